@@ -0,0 +1,23 @@
+from modules.archive import archive_closed_years
+from modules.repository import open_database
+from modules.sharding import ShardedDatabase
+import sys
+
+def archive_transactions(before_year=None):
+    """Move transactions of closed years from the hot table to yearly archive files"""
+    db = open_database()
+    db.create_tables()
+
+    # A sharded database archives each shard into its own files
+    databases = [db.shard(key) for key in db.shard_keys()] if isinstance(db, ShardedDatabase) else [db]
+    for database in databases:
+        print(f"Archiving closed years of {database.db_name}...")
+        moved = archive_closed_years(database, before_year)
+        for year, rows in moved.items():
+            print(f"  {year}: moved {rows} transactions")
+        if not moved:
+            print("  nothing to archive")
+
+if __name__ == "__main__":
+    # Optional argument: archive only the years before this one (default: the current year)
+    archive_transactions(int(sys.argv[1]) if len(sys.argv) > 1 else None)
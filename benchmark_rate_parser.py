@@ -0,0 +1,41 @@
+from modules.currency_exchange import CurrencyExchange
+import argparse
+import glob
+import os
+import time
+import tracemalloc
+
+DEFAULT_PAGES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tests", "fixtures", "tgju_*.html")
+
+def measure(parse, html, repeat):
+    """Mean milliseconds per call and peak traced allocation (MB) of parse(html)"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        parse(html)
+    elapsed = (time.perf_counter() - start) / repeat * 1000
+    tracemalloc.start()
+    parse(html)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak / (1 << 20)
+
+def main():
+    """Compare the targeted tgju price extraction with a full BeautifulSoup parse over saved pages"""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("--pages", default=DEFAULT_PAGES, help="glob of saved price pages (e.g. curl output)")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    exchange = CurrencyExchange()
+    for path in sorted(glob.glob(args.pages)):
+        with open(path, encoding="utf-8") as f:
+            html = f.read()
+        assert exchange.parse_rate(html) == exchange.parse_rate_full(html), f"{path}: parsers disagree"
+        fast_ms, fast_mb = measure(exchange.parse_rate, html, args.repeat)
+        full_ms, full_mb = measure(exchange.parse_rate_full, html, args.repeat)
+        print(f"{os.path.basename(path)} ({len(html) // 1024} KB)")
+        print(f"  targeted  {fast_ms:9.3f} ms  {fast_mb:7.2f} MB peak")
+        print(f"  full      {full_ms:9.3f} ms  {full_mb:7.2f} MB peak  ({full_ms / fast_ms:,.0f}x slower)")
+
+if __name__ == "__main__":
+    main()
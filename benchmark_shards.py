@@ -0,0 +1,46 @@
+from concurrent.futures import ThreadPoolExecutor
+from modules.connection_pool import close_all_pools
+from modules.sharding import ShardedDatabase
+import argparse
+import os
+import tempfile
+import time
+
+def run(shards, users, writes, threads, workdir):
+    """Time `writes` add_transaction calls per user, spread over `threads` threads"""
+    db = ShardedDatabase(os.path.join(workdir, f"catalog_{shards}.db"), shards)
+    db.create_tables()
+    category_id = db.add_category("bench")
+    owners = []
+    for i in range(users):
+        user_id = db.add_user(f"user{i}", f"user{i}@example.com", "hash")
+        owners.append((user_id, db.add_source("wallet", False, True, 0.0, user_id)))
+
+    def writer(owner):
+        user_id, source_id = owner
+        for _ in range(writes):
+            db.add_transaction("bench", "1403-01-01", 1.0, 1.0, category_id, source_id, user_id)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(threads) as executor:
+        list(executor.map(writer, owners))
+    elapsed = time.perf_counter() - start
+    close_all_pools()
+    return users * writes / elapsed
+
+def main():
+    """Measure write throughput of the sharded SQLite backend for several shard counts"""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("--shards", default="1,2,4,8", help="comma-separated shard counts (or 'per-user')")
+    parser.add_argument("--users", type=int, default=32)
+    parser.add_argument("--writes", type=int, default=200, help="transactions per user")
+    parser.add_argument("--threads", type=int, default=32)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        for shards in args.shards.split(","):
+            rate = run(shards, args.users, args.writes, args.threads, workdir)
+            print(f"shards={shards:>8}  {rate:8.0f} writes/s")
+
+if __name__ == "__main__":
+    main()
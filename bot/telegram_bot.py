@@ -60,14 +60,51 @@ def save_tokens(tokens):
         json.dump(tokens, f)
 
 def get_token(chat_id):
-    tokens = load_tokens()
-    return tokens.get(str(chat_id))
+    # Entries stored before refresh tokens existed are plain access tokens
+    entry = load_tokens().get(str(chat_id))
+    if isinstance(entry, dict):
+        return entry.get("access_token")
+    return entry
 
-def set_token(chat_id, token):
+def set_token(chat_id, token, refresh_token=None):
     tokens = load_tokens()
-    tokens[str(chat_id)] = token
+    tokens[str(chat_id)] = {"access_token": token, "refresh_token": refresh_token}
     save_tokens(tokens)
 
+def refresh_session(chat_id):
+    """Exchange the chat's refresh token for a new token pair; returns the new access token or None"""
+    entry = load_tokens().get(str(chat_id))
+    refresh_token = entry.get("refresh_token") if isinstance(entry, dict) else None
+    if not refresh_token:
+        return None
+    try:
+        resp = requests.post(f"{API_BASE_URL}/api/token/refresh", json={"refresh_token": refresh_token})
+    except requests.RequestException as e:
+        logger.warning(f"Token refresh failed: {e}")
+        return None
+    if resp.status_code != 200:
+        return None
+    data = resp.json()
+    set_token(chat_id, data["access_token"], data["refresh_token"])
+    return data["access_token"]
+
+def api_request(chat_id, method, path, **kwargs):
+    """Call the API as the chat's user, refreshing an expired access token once.
+
+    A 401 is returned only when the session itself is gone and the user has
+    to log in again.
+    """
+    headers = kwargs.pop("headers", {})
+    send = lambda token: requests.request(
+        method, f"{API_BASE_URL}{path}", headers={**headers, "Authorization": f"Bearer {token}"}, **kwargs
+    )
+    resp = send(get_token(chat_id))
+    if resp.status_code == 401:
+        token = refresh_session(chat_id)
+        if token:
+            resp = send(token)
+    return resp
+
 def delete_token(chat_id):
     tokens = load_tokens()
     if str(chat_id) in tokens:
@@ -169,8 +206,8 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
             try:
                 resp = requests.post(f"{API_BASE_URL}/api/token", data={"username": username, "password": password}, headers={"Content-Type": "application/x-www-form-urlencoded"})
                 if resp.status_code == 200:
-                    token = resp.json()["access_token"]
-                    set_token(chat_id, token)
+                    tokens = resp.json()
+                    set_token(chat_id, tokens["access_token"], tokens.get("refresh_token"))
                     del user_login_state[chat_id]
                     await smart_reply(update, "✅ Login successful! You can now use the bot.")
                 else:
@@ -190,8 +227,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if user_add_state.get(chat_id):
         await smart_reply(update, "Parsing your transaction with AI...")
         try:
-            headers = {"Authorization": f"Bearer {token}"}
-            resp = requests.post(f"{API_BASE_URL}/api/parse_transaction", json={"text": text}, headers=headers)
+            resp = api_request(chat_id, "POST", "/api/parse_transaction", json={"text": text})
             if resp.status_code == 401:
                 delete_token(chat_id)
                 user_login_state[chat_id] = {"step": "username"}
@@ -236,8 +272,7 @@ async def latest_transactions_command(update: Update, context: ContextTypes.DEFA
         await smart_reply(update, "❌ You are not authorized. Please log in first.")
         return
     try:
-        headers = {"Authorization": f"Bearer {token}"}
-        resp = requests.get(f"{API_BASE_URL}/api/transactions", headers=headers)
+        resp = api_request(chat_id, "GET", "/api/transactions", params={"limit": 5})
         if resp.status_code == 401:
             delete_token(chat_id)
             user_login_state[chat_id] = {"step": "username"}
@@ -246,13 +281,11 @@ async def latest_transactions_command(update: Update, context: ContextTypes.DEFA
         if not resp.ok:
             await smart_reply(update, f"❌ Failed to fetch transactions: {resp.text}")
             return
-        transactions = resp.json()
-        if not transactions:
+        # The API returns the newest page first, so no sorting is needed here
+        latest = resp.json()["items"]
+        if not latest:
             await smart_reply(update, "No transactions found.")
             return
-        # Sort by date descending (if not already sorted)
-        transactions.sort(key=lambda x: x.get('date', ''), reverse=True)
-        latest = transactions[:5]
         msg = "<b>📄 Latest 5 Transactions</b>\n\n"
         for idx, t in enumerate(latest, 1):
             amount = t.get('price', 0)
@@ -279,7 +312,6 @@ async def save_parsed_transaction(update: Update, context: ContextTypes.DEFAULT_
         await smart_reply(update, "❌ No transaction to save or not authorized.")
         return
     try:
-        headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
         if data.get('is_deposit'):
             # Income: use names and /api/add_income
             payload = {
@@ -295,8 +327,8 @@ async def save_parsed_transaction(update: Update, context: ContextTypes.DEFAULT_
         else:
             # Expense: use IDs and /api/add_transaction
             # Fetch categories and sources to map names to IDs
-            categories = requests.get(f"{API_BASE_URL}/api/categories", headers=headers).json()
-            sources = requests.get(f"{API_BASE_URL}/api/sources", headers=headers).json()
+            categories = api_request(chat_id, "GET", "/api/categories").json()
+            sources = api_request(chat_id, "GET", "/api/sources").json()
             cat = next((c for c in categories if c['name'].lower() == data.get('category_name', '').lower()), None)
             src = next((s for s in sources if s['name'].lower() == data.get('source_name', '').lower()), None)
             if not cat or not src:
@@ -311,7 +343,7 @@ async def save_parsed_transaction(update: Update, context: ContextTypes.DEFAULT_
                 "source_id": src['id']
             }
             endpoint = "/api/add_transaction"
-        resp = requests.post(f"{API_BASE_URL}{endpoint}", headers=headers, json=payload)
+        resp = api_request(chat_id, "POST", endpoint, json=payload)
         if resp.ok:
             await smart_reply(update, "✅ Transaction saved!")
         else:
@@ -326,8 +358,7 @@ async def exchange_rate_command(update: Update, context: ContextTypes.DEFAULT_TY
         await smart_reply(update, "❌ You are not authorized. Please log in first.")
         return
     try:
-        headers = {"Authorization": f"Bearer {token}"}
-        resp = requests.get(f"{API_BASE_URL}/api/exchange_rate", headers=headers)
+        resp = api_request(chat_id, "GET", "/api/exchange_rate")
         if resp.status_code == 401:
             delete_token(chat_id)
             user_login_state[chat_id] = {"step": "username"}
@@ -1,4 +1,4 @@
-from modules.database import Database
+from modules.repository import open_database
 from modules.auth import get_password_hash
 import os
 
@@ -6,7 +6,8 @@ def create_initial_database():
     """Create and initialize the database with common categories and sources"""
     
     # Initialize database
-    db = Database()
+    db = open_database()
+    db.create_tables()
     
     # Create default admin user
     print("Creating default admin user...")
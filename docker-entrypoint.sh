@@ -7,20 +7,24 @@ echo "Starting Nginx server..."
 nginx -c $(pwd)/nginx.conf &
 NGINX_PID=$!
 
-# Function to handle script termination
+# Function to handle script termination: stop the backend first, so its
+# shutdown commits queued writes and checkpoints the SQLite WAL, then Nginx
 cleanup() {
+    echo "Stopping backend..."
+    kill -TERM $BACKEND_PID 2>/dev/null || true
+    wait $BACKEND_PID || true
     echo "Stopping Nginx..."
     nginx -s stop
     exit 0
 }
 
 # Register the cleanup function for when the script is terminated
-trap cleanup SIGINT SIGTERM
+trap cleanup INT TERM
 
 echo "Nginx is running on http://localhost:8080"
 
-# Start FastAPI backend
-uvicorn main:app --host 0.0.0.0 --port 9000 &
+# Start FastAPI backend; it trusts the forwarded client address from Nginx only
+uvicorn main:app --host 0.0.0.0 --port 9000 --proxy-headers --forwarded-allow-ips 127.0.0.1 &
 BACKEND_PID=$!
 
 # Start Telegram bot (this will be the foreground process)
@@ -32,4 +36,4 @@ wait -n $NGINX_PID $BACKEND_PID $BOT_PID
 
 # If any process exits, kill all and exit
 kill -TERM $NGINX_PID $BACKEND_PID $BOT_PID
-exit 1 
\ No newline at end of file
+exit 1
@@ -1,18 +1,44 @@
 from fastapi import FastAPI, Request, Depends, HTTPException, status
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import OAuth2PasswordBearer
-from routers import transactions, categories, sources, users, reports, loans
-from modules.database import Database
-from modules.currency_exchange import CurrencyExchange
+from routers import transactions, categories, sources, users, reports, loans, exports, admin
+from modules.async_database import AsyncDatabase, db_executor_stats, shutdown_db_executor
+from modules.repository import open_database
+from modules.connection_pool import pool_stats, close_all_pools
+from modules.write_queue import shutdown_write_queues, write_queue_stats
+from modules.backup import backup_scheduler_stats, start_backup_scheduler, stop_backup_scheduler
+from modules.password_pool import password_pool_stats, shutdown_password_executor
+from modules.login_throttle import login_throttle_stats
+from modules.currency_exchange import exchange_rate_stats, get_currency_exchange
+from modules.rate_refresher import rate_refresher_stats, start_rate_refresher, stop_rate_refresher
+from modules.parse_cache import parse_cache_stats
 from modules.transaction_parser import TransactionParser
+from contextlib import asynccontextmanager
 import os
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Apply pending schema migrations once, before serving requests
+    open_database().create_tables()
+    # Scheduled online backups, when BACKUP_INTERVAL_MINUTES is set
+    start_backup_scheduler(open_database())
+    # Exchange rate scraping happens here, off the request path
+    await start_rate_refresher()
+    yield
+    # Finish in-flight database calls and backups, commit queued writes, then close pooled connections
+    await stop_rate_refresher()
+    stop_backup_scheduler()
+    shutdown_password_executor()
+    shutdown_db_executor()
+    shutdown_write_queues()
+    close_all_pools()
+
 # Create FastAPI app
-app = FastAPI(title="AI Money Tracker API")
+app = FastAPI(title="AI Money Tracker API", lifespan=lifespan)
 
 # Configure CORS
 app.add_middleware(
@@ -33,20 +59,17 @@ app.include_router(categories.router, tags=["categories"])
 app.include_router(sources.router, tags=["sources"])
 app.include_router(reports.router, prefix="/api", tags=["reports"])
 app.include_router(loans.router, tags=["loans"])
-
-# Serve static files
-from fastapi.staticfiles import StaticFiles
-app.mount("/", StaticFiles(directory="public", html=True), name="public")
+app.include_router(exports.router, tags=["exports"])
+app.include_router(admin.router, tags=["admin"])
 
 # Dependency for database access
 def get_db():
-    db = Database()
+    db = AsyncDatabase()
     return db
 
 # Dependency for exchange rate access
 def get_exchange():
-    exchange = CurrencyExchange()
-    return exchange
+    return get_currency_exchange()
 
 # Dependency for transaction parser
 def get_parser():
@@ -63,11 +86,25 @@ def get_parser():
 async def health_check():
     return {"status": "healthy"}
 
+# Connection pool, database thread pool, write queue and cache statistics;
+# admins only, as they expose internal paths, URLs and errors
+@app.get("/health/db")
+async def database_stats(admin_user = Depends(admin.get_admin_user)):
+    return {"pools": pool_stats(), "executor": db_executor_stats(), "write_queues": write_queue_stats(),
+            "backups": backup_scheduler_stats(), "user_cache": users.user_cache_stats(),
+            "password_pool": password_pool_stats(), "login_throttle": login_throttle_stats(),
+            "exchange_rate": exchange_rate_stats(), "rate_refresher": rate_refresher_stats(),
+            "parse_cache": parse_cache_stats()}
+
 # Root endpoint
 @app.get("/")
 async def root():
     return {"message": "Welcome to Money Tracker API"}
 
+# Serve static files (mounted last so it doesn't shadow the API routes)
+from fastapi.staticfiles import StaticFiles
+app.mount("/", StaticFiles(directory="public", html=True), name="public")
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("main:app", host="0.0.0.0", port=9000, reload=True) 
\ No newline at end of file
@@ -0,0 +1,156 @@
+import os
+import sqlite3
+import urllib.parse
+from contextlib import contextmanager
+from datetime import date
+from modules.connection_pool import ConnectionPool
+import jdatetime
+
+# Hot/cold partitioning: transactions of closed years can be moved out of the
+# hot transactions table into one SQLite file per year, which reads attach
+# (read-only) only when their date range reaches an archived year.
+ARCHIVE_DIR_ENV = "DB_ARCHIVE_DIR"
+
+
+def archive_dir(db_name):
+    """Directory of a database's yearly archives: DB_ARCHIVE_DIR, else money_tracker.db -> money_tracker_archive/
+
+    A relative DB_ARCHIVE_DIR is taken from the database's directory, so the
+    archives stay on the same (persisted) volume as the rows they replace.
+    """
+    root, _ = os.path.splitext(db_name)
+    configured = os.getenv(ARCHIVE_DIR_ENV)
+    if configured:
+        return os.path.join(os.path.dirname(os.path.abspath(db_name)), configured)
+    return f"{root}_archive"
+
+
+def archive_path(db_name, year):
+    """Archive file of one year of a database, e.g. money_tracker_archive/money_tracker_2024.db"""
+    stem, _ = os.path.splitext(os.path.basename(db_name))
+    return os.path.join(archive_dir(db_name), f"{stem}_{year}.db")
+
+
+def _year_range(year):
+    """Dates [start, end) of a year"""
+    return f"{year:04d}-01-01", f"{year + 1:04d}-01-01"
+
+
+@contextmanager
+def attached_archives(conn, db_name, columns, start_date=None, end_date=None):
+    """Attach the archived years a date range reaches to a connection for a block.
+
+    Yields the table expression to read transactions from: "transactions"
+    when the range (None: open-ended) reaches no archived year, else a
+    UNION ALL of the hot table and the attached archives. Like a
+    connection's with-block, the block's transaction is committed (or
+    rolled back on error) on exit, before the archives are detached.
+    """
+    first = int(start_date[:4]) if start_date else None
+    last = int(end_date[:4]) if end_date else None
+    years = [
+        (year, path) for year, path in conn.execute("SELECT year, path FROM archived_years ORDER BY year")
+        if (first is None or year >= first) and (last is None or year <= last)
+    ]
+    if not years:
+        yield "transactions"
+        return
+
+    root = os.path.dirname(os.path.abspath(db_name))
+    attached = []
+    try:
+        for year, path in years:
+            uri = f"file:{urllib.parse.quote(os.path.join(root, path))}?mode=ro"
+            conn.execute(f"ATTACH DATABASE ? AS archive_{year}", (uri,))
+            attached.append(year)
+        selects = [f"SELECT {columns} FROM main.transactions"]
+        selects += [f"SELECT {columns} FROM archive_{year}.transactions" for year in attached]
+        yield f"({' UNION ALL '.join(selects)})"
+        if conn.in_transaction:
+            conn.commit()
+    except BaseException:
+        if conn.in_transaction:
+            conn.rollback()
+        raise
+    finally:
+        for year in attached:
+            conn.execute(f"DETACH DATABASE archive_{year}")
+
+
+def _copy_to_archive(db_name, path, year):
+    """Copy a year of the hot transactions into its archive file and commit it there; returns the rows copied"""
+    start, end = _year_range(year)
+    hot = f"file:{urllib.parse.quote(os.path.abspath(db_name))}?mode=ro"
+    conn = sqlite3.connect(path, timeout=20)
+    try:
+        with conn:
+            conn.execute("ATTACH DATABASE ? AS hot", (hot,))
+            conn.execute("CREATE TABLE IF NOT EXISTS transactions AS SELECT * FROM hot.transactions WHERE 0")
+            conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_transactions_id ON transactions (id)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_transactions_user_date_id ON transactions (user_id, date, id)")
+            return conn.execute(
+                "INSERT OR REPLACE INTO transactions SELECT * FROM hot.transactions WHERE date >= ? AND date < ?",
+                (start, end)
+            ).rowcount
+    finally:
+        conn.close()
+
+
+def archive_year(db, year):
+    """Move a closed year's transactions from the hot table to its archive file.
+
+    The rows are copied to the archive and committed there while the write
+    lock of the database is held, then deleted from the hot table, so an
+    interruption can leave a year in both files (archive it again) but
+    never in neither. Their ledger effect is kept per source and day in
+    archived_ledger, so balances still add up. Returns the rows moved.
+    """
+    if not isinstance(db.pool, ConnectionPool):
+        raise ValueError("Yearly archives are only supported by the SQLite backend")
+    # Transaction dates (and so archive years) are Gregorian
+    if year >= date.today().year:
+        raise ValueError(f"{year} is not a closed year")
+
+    path = archive_path(db.db_name, year)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    start, end = _year_range(year)
+    with db.write_transaction() as cursor:
+        copied = _copy_to_archive(db.db_name, path, year)
+        cursor.execute("""
+            INSERT INTO archived_ledger (source_id, date, amount)
+            SELECT t.source_id, t.date,
+                   SUM(CASE WHEN t.is_deposit THEN 1 ELSE -1 END * ABS(t.price_in_dollar)
+                       * CASE WHEN s.usd THEN 1 ELSE t.your_currency_rate END)
+            FROM transactions t
+            JOIN sources s ON s.id = t.source_id
+            WHERE t.date >= ? AND t.date < ? AND t.affects_balance
+            GROUP BY t.source_id, t.date
+            ON CONFLICT (source_id, date) DO UPDATE SET amount = archived_ledger.amount + excluded.amount
+        """, (start, end))
+        cursor.execute("DELETE FROM transactions WHERE date >= ? AND date < ?", (start, end))
+        moved = cursor.rowcount
+        if moved != copied:
+            raise RuntimeError(f"Archived {copied} transactions of {year} but found {moved} to remove")
+        relative = os.path.relpath(os.path.abspath(path), os.path.dirname(os.path.abspath(db.db_name)))
+        cursor.execute("""
+            INSERT INTO archived_years (year, path, transaction_count, archived_at) VALUES (?, ?, ?, ?)
+            ON CONFLICT (year) DO UPDATE SET
+                transaction_count = archived_years.transaction_count + excluded.transaction_count,
+                archived_at = excluded.archived_at
+        """, (year, relative, moved, jdatetime.datetime.now().isoformat()))
+        return moved
+
+
+def archive_closed_years(db, before_year=None):
+    """Archive every year before `before_year` (default: the current year) that still has hot transactions.
+
+    Returns the rows moved per year.
+    """
+    current = date.today().year
+    before_year = min(before_year or current, current)
+    with db.get_connection() as conn:
+        years = [int(row[0]) for row in conn.execute(
+            "SELECT DISTINCT substr(date, 1, 4) FROM transactions WHERE date < ? ORDER BY 1",
+            (_year_range(before_year)[0],)
+        )]
+    return {year: archive_year(db, year) for year in years}
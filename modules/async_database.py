@@ -0,0 +1,100 @@
+import asyncio
+import functools
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from modules.connection_pool import DEFAULT_POOL_SIZE
+from modules.repository import open_database
+
+# Threads that run blocking database calls for the async routers. Matching
+# the connection pool size means a worker never waits for a connection.
+DB_EXECUTOR_WORKERS = int(os.getenv("DB_EXECUTOR_WORKERS", str(DEFAULT_POOL_SIZE)))
+
+_executor = None
+_executor_lock = threading.Lock()
+_stats_lock = threading.Lock()
+_stats = {
+    "calls": 0,
+    "in_flight": 0,
+    "peak_in_flight": 0,
+    "total_wait_ms": 0.0,
+    "max_wait_ms": 0.0,
+}
+
+
+def get_db_executor():
+    """Get the shared database thread pool, creating it on first use"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=DB_EXECUTOR_WORKERS, thread_name_prefix="db")
+        return _executor
+
+
+def shutdown_db_executor():
+    """Wait for running database calls and stop the thread pool"""
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=True)
+            _executor = None
+
+
+def db_executor_stats():
+    """Calls made, calls in flight and queueing delay of the database thread pool"""
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["workers"] = DB_EXECUTOR_WORKERS
+    stats["avg_wait_ms"] = round(stats["total_wait_ms"] / stats["calls"], 3) if stats["calls"] else 0.0
+    stats["total_wait_ms"] = round(stats["total_wait_ms"], 3)
+    stats["max_wait_ms"] = round(stats["max_wait_ms"], 3)
+    return stats
+
+
+def _run_timed(submitted, fn, args, kwargs):
+    """Run fn in a worker thread, recording how long it waited for a free worker"""
+    wait_ms = (time.perf_counter() - submitted) * 1000
+    with _stats_lock:
+        _stats["calls"] += 1
+        _stats["in_flight"] += 1
+        _stats["peak_in_flight"] = max(_stats["peak_in_flight"], _stats["in_flight"])
+        _stats["total_wait_ms"] += wait_ms
+        _stats["max_wait_ms"] = max(_stats["max_wait_ms"], wait_ms)
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        with _stats_lock:
+            _stats["in_flight"] -= 1
+
+
+async def run_in_db_executor(fn, *args, **kwargs):
+    """Run a blocking function on the database thread pool without blocking the event loop"""
+    loop = asyncio.get_running_loop()
+    call = functools.partial(_run_timed, time.perf_counter(), fn, args, kwargs)
+    return await loop.run_in_executor(get_db_executor(), call)
+
+
+class AsyncDatabase:
+    """Awaitable view of a Repository for async route handlers.
+
+    Every repository method becomes a coroutine that runs on the shared,
+    bounded database thread pool, e.g. ``await db.get_all_sources(user_id)``.
+    The streaming iter_* methods are returned unchanged: they only touch the
+    database while being iterated, which StreamingResponse already does in
+    a worker thread.
+    """
+
+    def __init__(self, db_name=None, database=None):
+        self.sync = database or open_database(db_name)
+
+    def __getattr__(self, name):
+        attr = getattr(self.sync, name)
+        if not callable(attr) or name.startswith("iter_"):
+            return attr
+
+        @functools.wraps(attr)
+        async def call(*args, **kwargs):
+            return await run_in_db_executor(attr, *args, **kwargs)
+
+        return call
@@ -3,7 +3,9 @@ from datetime import datetime, timedelta
 from typing import Optional
 import jwt
 from fastapi import HTTPException, status
+import hashlib
 import os
+import secrets
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -16,6 +18,9 @@ pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 SECRET_KEY = os.getenv("JWT_SECRET_KEY", "your-secret-key-here")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+# Refresh tokens are random strings, stored only as SHA-256 hashes and
+# rotated on every use
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "30"))
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a password against its hash"""
@@ -52,4 +57,14 @@ def verify_token(token: str) -> dict:
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Could not validate credentials",
             headers={"WWW-Authenticate": "Bearer"},
-        ) 
\ No newline at end of file
+        )
+
+def create_refresh_token() -> tuple:
+    """Create a refresh token: returns (token, its hash to store, expiry as a UTC ISO string)"""
+    token = secrets.token_urlsafe(32)
+    expires_at = datetime.utcnow() + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
+    return token, hash_refresh_token(token), expires_at.isoformat(timespec="seconds")
+
+def hash_refresh_token(token: str) -> str:
+    """Hash of a refresh token as stored in the database"""
+    return hashlib.sha256(token.encode()).hexdigest()
@@ -0,0 +1,262 @@
+import os
+import shutil
+import sqlite3
+import tarfile
+import tempfile
+import threading
+import time
+from datetime import datetime
+from modules.connection_pool import ConnectionPool
+from modules.sharding import ShardedDatabase
+
+# Online backups through the SQLite backup API: a few pages are copied per
+# step with a pause between steps, so live requests keep their share of I/O.
+# BACKUP_DIR defaults to backups/ next to the database; relative paths are
+# taken from the database's directory, so backups land on its (persisted) volume
+BACKUP_DIR = os.getenv("BACKUP_DIR", "backups")
+BACKUP_PAGES_PER_STEP = int(os.getenv("BACKUP_PAGES_PER_STEP", "256"))  # 1 MB of 4 KB pages
+BACKUP_STEP_SLEEP_MS = float(os.getenv("BACKUP_STEP_SLEEP_MS", "5"))
+# Scheduled backups: every BACKUP_INTERVAL_MINUTES (0 disables them), keeping
+# the newest BACKUP_KEEP in BACKUP_DIR
+BACKUP_INTERVAL_MINUTES = float(os.getenv("BACKUP_INTERVAL_MINUTES", "0"))
+BACKUP_KEEP = int(os.getenv("BACKUP_KEEP", "7"))
+STREAM_CHUNK_BYTES = 1 << 20
+
+_PARTIAL = ".partial"
+# One backup at a time, so they don't compete for I/O and retention never
+# removes a backup that is still being written
+_backup_lock = threading.Lock()
+
+
+def backup_file(source, target, pages=BACKUP_PAGES_PER_STEP, sleep_ms=BACKUP_STEP_SLEEP_MS):
+    """Copy a live SQLite database file to `target` as one consistent snapshot.
+
+    Copies `pages` pages per backup step and sleeps `sleep_ms` between steps.
+    The copy runs inside a read transaction on the source, so it is the
+    database as of the first step: writers carry on in WAL mode, and their
+    commits neither block the copy nor make it start over. The target is a
+    self-contained file (rollback journal). Returns the number of pages copied.
+    """
+    copied = 0
+
+    def progress(status, remaining, total):
+        nonlocal copied
+        copied = total - remaining
+        if remaining and sleep_ms:
+            time.sleep(sleep_ms / 1000)
+
+    src = sqlite3.connect(source, timeout=20)
+    dst = sqlite3.connect(target)
+    try:
+        src.execute("BEGIN")
+        src.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()  # start reading now
+        src.backup(dst, pages=pages, progress=progress)
+        dst.execute("PRAGMA journal_mode=DELETE")
+    finally:
+        src.rollback()
+        src.close()
+        dst.close()
+    return copied
+
+
+def _archive_files(path):
+    """Yearly archive files of a database file (modules.archive)"""
+    root = os.path.dirname(os.path.abspath(path))
+    conn = sqlite3.connect(path, timeout=20)
+    try:
+        return [os.path.join(root, archive) for (archive,) in conn.execute("SELECT path FROM archived_years ORDER BY year")]
+    finally:
+        conn.close()
+
+
+def database_files(db):
+    """SQLite files of a database as (path, path inside a backup) pairs.
+
+    The main file (or the catalog and every shard) plus their yearly
+    archives, laid out relative to the main file's directory.
+    """
+    if isinstance(db, ShardedDatabase):
+        main = [db.catalog.db_name] + [db.shard_path(key) for key in db.shard_keys()]
+    elif isinstance(db.pool, ConnectionPool):
+        main = [db.db_name]
+    else:
+        raise ValueError("Backups through the SQLite backup API need the SQLite backend")
+
+    root = os.path.dirname(os.path.abspath(db.db_name))
+    files = []
+    for path in main:
+        for file in [path] + _archive_files(path):
+            relative = os.path.relpath(os.path.abspath(file), root)
+            if relative.startswith(os.pardir):
+                relative = os.path.basename(file)
+            files.append((file, relative))
+    return files
+
+
+def _backup_name(db):
+    stem, _ = os.path.splitext(os.path.basename(db.db_name))
+    now = datetime.now()
+    return f"{stem}-{now:%Y%m%d-%H%M%S}-{now.microsecond // 1000:03d}"
+
+
+def _snapshot(db, target_dir):
+    """Back up every file of a database into target_dir; returns their paths inside it"""
+    files = database_files(db)
+    for path, relative in files:
+        target = os.path.join(target_dir, relative)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        backup_file(path, target)
+    return [relative for _, relative in files]
+
+
+def backup_dir_of(db, backup_dir=None):
+    """Directory backups of a database go to: backup_dir (default BACKUP_DIR), relative to the database's directory"""
+    return os.path.join(os.path.dirname(os.path.abspath(db.db_name)), backup_dir or BACKUP_DIR)
+
+
+def list_backups(db, backup_dir=None):
+    """Finished backups of a database in backup_dir (default: backup_dir_of(db)), oldest first"""
+    backup_dir = backup_dir_of(db, backup_dir)
+    if not os.path.isdir(backup_dir):
+        return []
+    stem, _ = os.path.splitext(os.path.basename(db.db_name))
+    return sorted(
+        name for name in os.listdir(backup_dir)
+        if name.startswith(f"{stem}-") and not name.endswith(_PARTIAL)
+    )
+
+
+def prune_backups(db, backup_dir=None, keep=BACKUP_KEEP):
+    """Delete all but the newest `keep` backups (and unfinished ones); returns the names deleted"""
+    backup_dir = backup_dir_of(db, backup_dir)
+    backups = list_backups(db, backup_dir)
+    stale = backups[:max(len(backups) - keep, 0)]
+    stale += [name for name in os.listdir(backup_dir) if name.endswith(_PARTIAL)] if os.path.isdir(backup_dir) else []
+    for name in stale:
+        shutil.rmtree(os.path.join(backup_dir, name), ignore_errors=True)
+    return stale
+
+
+def create_backup(db, backup_dir=None, keep=BACKUP_KEEP):
+    """Take a backup into a new directory of backup_dir, then apply retention.
+
+    The directory only gets its final name once every file is copied.
+    Returns its path.
+    """
+    backup_dir = backup_dir_of(db, backup_dir)
+    with _backup_lock:
+        final = os.path.join(backup_dir, _backup_name(db))
+        partial = final + _PARTIAL
+        try:
+            _snapshot(db, partial)
+        except BaseException:
+            shutil.rmtree(partial, ignore_errors=True)
+            raise
+        os.replace(partial, final)
+        prune_backups(db, backup_dir, keep)
+        return final
+
+
+def stream_backup(db, chunk_bytes=STREAM_CHUNK_BYTES):
+    """Take a backup for download: returns (filename, chunks).
+
+    The snapshot is taken before returning, so errors surface before a
+    response starts. A single database file is sent as is, several (shards,
+    archives) as a tar. The temporary copy is removed once the chunks are
+    consumed or the generator is closed.
+    """
+    workdir = tempfile.mkdtemp(prefix="backup-")
+    try:
+        with _backup_lock:
+            name = _backup_name(db)
+            snapshot_dir = os.path.join(workdir, name)
+            files = _snapshot(db, snapshot_dir)
+        if len(files) == 1:
+            path, filename = os.path.join(snapshot_dir, files[0]), f"{name}.db"
+        else:
+            path, filename = os.path.join(workdir, f"{name}.tar"), f"{name}.tar"
+            with tarfile.open(path, "w") as tar:
+                tar.add(snapshot_dir, arcname=name)
+    except BaseException:
+        shutil.rmtree(workdir, ignore_errors=True)
+        raise
+
+    def chunks():
+        try:
+            with open(path, "rb") as file:
+                while chunk := file.read(chunk_bytes):
+                    yield chunk
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    return filename, chunks()
+
+
+class BackupScheduler:
+    """Background thread that takes a backup every interval and applies retention"""
+
+    def __init__(self, db, interval_minutes=BACKUP_INTERVAL_MINUTES, backup_dir=None, keep=BACKUP_KEEP):
+        self.db = db
+        self.interval = interval_minutes * 60
+        self.backup_dir = backup_dir
+        self.keep = keep
+        self.last_backup = None
+        self.last_error = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="db-backup", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        """Stop after the backup in progress, if any"""
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.last_backup = create_backup(self.db, self.backup_dir, self.keep)
+                self.last_error = None
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"Error taking scheduled backup: {e}")
+
+    def stats(self):
+        return {
+            "interval_minutes": self.interval / 60,
+            "keep": self.keep,
+            "last_backup": self.last_backup,
+            "last_error": self.last_error,
+        }
+
+
+_scheduler = None
+
+
+def start_backup_scheduler(db):
+    """Start scheduled backups of a database if BACKUP_INTERVAL_MINUTES is set"""
+    global _scheduler
+    if BACKUP_INTERVAL_MINUTES <= 0 or _scheduler is not None:
+        return None
+    try:
+        database_files(db)
+    except ValueError as e:
+        print(f"Scheduled backups disabled: {e}")
+        return None
+    _scheduler = BackupScheduler(db)
+    _scheduler.start()
+    return _scheduler
+
+
+def backup_scheduler_stats():
+    """Settings and last result of the backup scheduler (None when it is not running)"""
+    return _scheduler.stats() if _scheduler is not None else None
+
+
+def stop_backup_scheduler():
+    """Stop scheduled backups (used on application shutdown)"""
+    global _scheduler
+    if _scheduler is not None:
+        _scheduler.stop()
+        _scheduler = None
@@ -0,0 +1,214 @@
+import os
+import queue
+import sqlite3
+import threading
+import time
+import urllib.parse
+from contextlib import contextmanager
+
+# Connection settings applied once, when a pooled connection is opened
+DEFAULT_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))
+DEFAULT_ACQUIRE_TIMEOUT = 30.0
+STATEMENT_CACHE_SIZE = 256
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA mmap_size=268435456",  # 256 MB
+    "PRAGMA cache_size=-16000",    # ~16 MB page cache per connection
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA busy_timeout=20000",
+)
+
+
+class PoolTimeout(Exception):
+    """Raised when no pooled connection becomes free in time"""
+
+
+class ConnectionPool:
+    """Bounded pool of long-lived SQLite connections for one database file.
+
+    attach_readonly maps schema names to database files that every
+    connection attaches read-only (e.g. a shared catalog).
+    """
+
+    def __init__(self, db_name, size=DEFAULT_POOL_SIZE, acquire_timeout=DEFAULT_ACQUIRE_TIMEOUT, attach_readonly=None):
+        self.db_name = db_name
+        self.size = size
+        self.acquire_timeout = acquire_timeout
+        self.attach_readonly = attach_readonly or {}
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._in_use = 0
+        self._peak_in_use = 0
+        self._acquisitions = 0
+        self._timeouts = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+
+    def _connect(self):
+        """Open and configure a new connection"""
+        conn = sqlite3.connect(
+            self.db_name,
+            timeout=20,
+            check_same_thread=False,
+            cached_statements=STATEMENT_CACHE_SIZE,
+            # Plain paths still work; lets ATTACH open file: URIs (read-only attaches)
+            uri=True,
+        )
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        # Read-only, so BEGIN IMMEDIATE only takes the write lock of the main file
+        for schema, path in self.attach_readonly.items():
+            uri = f"file:{urllib.parse.quote(os.path.abspath(path))}?mode=ro"
+            conn.execute(f"ATTACH DATABASE ? AS {schema}", (uri,))
+        return conn
+
+    def acquire(self):
+        """Borrow a connection, opening a new one while the pool is below its size"""
+        start = time.perf_counter()
+        conn = None
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                can_create = self._created < self.size
+                if can_create:
+                    self._created += 1
+            if can_create:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            else:
+                try:
+                    conn = self._idle.get(timeout=self.acquire_timeout)
+                except queue.Empty:
+                    with self._lock:
+                        self._timeouts += 1
+                    raise PoolTimeout(
+                        f"No database connection available after {self.acquire_timeout}s"
+                    )
+
+        waited = time.perf_counter() - start
+        with self._lock:
+            self._acquisitions += 1
+            self._in_use += 1
+            self._peak_in_use = max(self._peak_in_use, self._in_use)
+            self._total_wait += waited
+            self._max_wait = max(self._max_wait, waited)
+        return conn
+
+    def release(self, conn):
+        """Return a borrowed connection to the pool"""
+        if conn.in_transaction:
+            conn.rollback()
+        with self._lock:
+            self._in_use -= 1
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection for the duration of a with-block.
+
+        Commits on success and rolls back on error, like ``with sqlite3.connect(...)``,
+        but hands the connection back to the pool instead of leaving it open.
+        """
+        conn = self.acquire()
+        try:
+            yield conn
+            if conn.in_transaction:
+                conn.commit()
+        except BaseException:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+        finally:
+            self.release(conn)
+
+    def close(self):
+        """Checkpoint the WAL into the database file and close all idle connections"""
+        checkpointed = False
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            if not checkpointed:
+                checkpointed = True
+                try:
+                    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+                except sqlite3.Error as e:
+                    print(f"Error checkpointing {self.db_name}: {e}")
+            conn.close()
+            with self._lock:
+                self._created -= 1
+
+    def stats(self):
+        """Return usage and wait-time statistics for this pool"""
+        with self._lock:
+            return {
+                "db_name": self.db_name,
+                "size": self.size,
+                "open": self._created,
+                "in_use": self._in_use,
+                "idle": self._created - self._in_use,
+                "peak_in_use": self._peak_in_use,
+                "acquisitions": self._acquisitions,
+                "timeouts": self._timeouts,
+                "total_wait_ms": round(self._total_wait * 1000, 3),
+                "avg_wait_ms": round(self._total_wait * 1000 / self._acquisitions, 3) if self._acquisitions else 0.0,
+                "max_wait_ms": round(self._max_wait * 1000, 3),
+            }
+
+
+# One pool per database (file path or server URL), shared by every Database
+# instance in the process
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def _pool_key(db_name):
+    """Registry key: server URLs/conninfo strings as given, file paths made absolute"""
+    return db_name if "://" in db_name or "=" in db_name else os.path.abspath(db_name)
+
+
+def get_pool(db_name, factory=ConnectionPool):
+    """Get (or create) the shared pool for a database.
+
+    `factory` builds the pool on first use; other backends pass their own
+    pool class, which must provide connection(), close() and stats().
+    """
+    key = _pool_key(db_name)
+    pool = _pools.get(key)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(key)
+            if pool is None:
+                pool = factory(db_name)
+                _pools[key] = pool
+    return pool
+
+
+def pool_stats():
+    """Return statistics for every pool opened in this process"""
+    return [pool.stats() for pool in list(_pools.values())]
+
+
+def close_pool(db_name):
+    """Close and forget the pool of one database, if it was opened"""
+    key = _pool_key(db_name)
+    with _pools_lock:
+        pool = _pools.pop(key, None)
+    if pool is not None:
+        pool.close()
+
+
+def close_all_pools():
+    """Close idle connections of every pool (used on application shutdown)"""
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close()
+        _pools.clear()
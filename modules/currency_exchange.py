@@ -3,20 +3,88 @@ from bs4 import BeautifulSoup
 import json
 from datetime import datetime, timedelta
 import os
+import re
+import threading
+import time
+
+# A rate is fresh for CACHE_TTL; after that it is still served (while one
+# background refresh replaces it) until it is older than MAX_STALE.
+CACHE_TTL = timedelta(hours=10)
+MAX_STALE = timedelta(hours=int(os.getenv("EXCHANGE_RATE_MAX_STALE_HOURS", "24")))
+# Page to scrape; point it at a local stub server for tests and benchmarks
+EXCHANGE_RATE_URL = os.getenv("EXCHANGE_RATE_URL", "https://www.tgju.org/profile/price_dollar_rl")
+EXCHANGE_RATE_TIMEOUT_SECONDS = float(os.getenv("EXCHANGE_RATE_TIMEOUT_SECONDS", "10"))
+
+# The price is the text of <span data-col="info.last_trade.PDrCotVal">. The
+# fast path finds that attribute value with str.find and matches just the
+# enclosing tag, instead of building a DOM of the whole page; markup it does
+# not recognise falls back to BeautifulSoup.
+PRICE_COLUMN = "info.last_trade.PDrCotVal"
+_PRICE_SPAN = re.compile(
+    r"""<span\b[^<>]*?\sdata-col\s*=\s*(["']?)info\.last_trade\.PDrCotVal\1(?=[\s/>])[^<>]*>\s*([^<]*?)\s*</span>""",
+    re.IGNORECASE,
+)
+_PRICE_TEXT = re.compile(r"\d{1,3}(?:,\d{3})+(?:\.\d+)?|\d+(?:\.\d+)?")
+
+
+def extract_price_text(html):
+    """Text of the first price span, found without parsing the page; None if the markup is unexpected"""
+    found = html.find(PRICE_COLUMN)
+    while found != -1:
+        match = _PRICE_SPAN.match(html, html.rfind("<", 0, found))
+        if match:
+            text = match.group(2)
+            return text if _PRICE_TEXT.fullmatch(text) else None
+        found = html.find(PRICE_COLUMN, found + len(PRICE_COLUMN))
+    return None
+
 
 class CurrencyExchange:
-    def __init__(self):
-        self.url = "https://www.tgju.org/profile/price_dollar_rl"
+    """USD to Toman rate scraped from tgju.org, cached in memory.
+
+    The rate and its fetch time live in memory; currency_cache.json is read
+    once and written only when the rate changes. Concurrent callers share a
+    single scrape (single flight), and a stale rate is served while one
+    background refresh replaces it. While a RateRefresher
+    (modules.rate_refresher) is attached, callers never scrape: they get the
+    rate in memory and at most nudge the refresher. Use
+    get_currency_exchange() for the process-wide instance.
+    """
+
+    def __init__(self, cache_file="currency_cache.json", url=EXCHANGE_RATE_URL):
+        self.url = url
         self.headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
         }
-        self.cache_file = "currency_cache.json"
+        self.cache_file = cache_file
+        self._rate = None
+        self._fetched_at = None
+        self._loaded = False
+        self._lock = threading.Lock()
+        # Held for the duration of a scrape; callers that find it taken wait
+        # for that scrape instead of starting their own
+        self._refresh_lock = threading.Lock()
+        self._refresh_generation = 0
+        self._background_refresh = False
+        self.refresher = None
+        self._stats = {
+            "hits": 0,
+            "stale_hits": 0,
+            "misses": 0,
+            "refreshes": 0,
+            "refresh_failures": 0,
+            "disk_writes": 0,
+            "parse_fallbacks": 0,
+            "refresh_ms_total": 0.0,
+            "refresh_ms_max": 0.0,
+            "last_refresh_ms": None,
+        }
 
-    def save_to_cache(self, rate):
+    def save_to_cache(self, rate, timestamp=None):
         """Save the exchange rate and timestamp to cache file"""
         cache_data = {
             "rate": rate,
-            "timestamp": datetime.now().isoformat()
+            "timestamp": (timestamp or datetime.now()).isoformat()
         }
         with open(self.cache_file, 'w') as f:
             json.dump(cache_data, f)
@@ -25,7 +93,7 @@ class CurrencyExchange:
         """Load the exchange rate and timestamp from cache file"""
         if not os.path.exists(self.cache_file):
             return None, None
-        
+
         try:
             with open(self.cache_file, 'r') as f:
                 cache_data = json.load(f)
@@ -37,56 +105,197 @@ class CurrencyExchange:
         """Check if the cache is still valid (less than 10 hours old)"""
         if not cache_time:
             return False
-        return datetime.now() - cache_time < timedelta(hours=10)
+        return datetime.now() - cache_time < CACHE_TTL
+
+    def _current(self):
+        """In-memory (rate, fetch time), read from the cache file on first use"""
+        with self._lock:
+            if not self._loaded:
+                self._rate, self._fetched_at = self.load_from_cache()
+                self._loaded = True
+            return self._rate, self._fetched_at
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
 
     def get_usd_rate(self, live=False):
-        """Fetch the current USD to Rial exchange rate from tgju.org and convert to Toman"""
-        # Try to get from cache first if not live
+        """Current USD to Toman exchange rate, or None if it cannot be had.
+
+        Served from memory while fresh. A stale rate is returned at once
+        while a background refresh runs; with no usable rate (or live=True)
+        the caller waits for a scrape shared with any concurrent callers.
+        With a refresher attached nobody waits: live=True and stale rates
+        only ask the refresher for an early refresh.
+        """
+        rate, fetched_at = self._current()
+        refresher = self.refresher
+        if refresher is not None:
+            # The background refresher does all scraping; never wait for it
+            if live or not self.is_cache_valid(fetched_at):
+                refresher.request_refresh()
+            if rate and self.is_cache_valid(fetched_at):
+                self._count("hits")
+                return rate
+            if rate and datetime.now() - fetched_at < MAX_STALE:
+                self._count("stale_hits")
+                return rate
+            self._count("misses")
+            return None
         if not live:
-            cached_rate, cache_time = self.load_from_cache()
-            if cached_rate and self.is_cache_valid(cache_time):
-                return cached_rate
+            if rate and self.is_cache_valid(fetched_at):
+                self._count("hits")
+                return rate
+            if rate and datetime.now() - fetched_at < MAX_STALE:
+                self._count("stale_hits")
+                self._start_background_refresh()
+                return rate
+            self._count("misses")
+        return self.refresh()
+
+    def refresh(self):
+        """Scrape the rate now and store it; returns the rate or None.
+
+        Callers arriving while a scrape is running wait for it and share its
+        result instead of scraping again.
+        """
+        with self._lock:
+            generation = self._refresh_generation
+        with self._refresh_lock:
+            with self._lock:
+                if self._refresh_generation != generation:
+                    # Someone else refreshed while we waited
+                    return self._rate if self.is_cache_valid(self._fetched_at) else None
+            started = time.perf_counter()
+            rate = self.fetch_rate()
+            self.record_refresh((time.perf_counter() - started) * 1000, rate is not None)
+            if rate is None:
+                # If fetch fails and we have a valid cache, use that
+                rate, fetched_at = self._current()
+                return rate if rate and self.is_cache_valid(fetched_at) else None
+            self.set_rate(rate)
+            return rate
+
+    def record_refresh(self, elapsed_ms, ok):
+        """Count a finished scrape and its latency"""
+        with self._lock:
+            self._refresh_generation += 1
+            self._stats["refreshes"] += 1
+            self._stats["refresh_ms_total"] += elapsed_ms
+            self._stats["refresh_ms_max"] = max(self._stats["refresh_ms_max"], elapsed_ms)
+            self._stats["last_refresh_ms"] = round(elapsed_ms, 1)
+            if not ok:
+                self._stats["refresh_failures"] += 1
+
+    def set_rate(self, rate, fetched_at=None):
+        """Store a freshly fetched rate, writing the cache file only if the rate changed"""
+        fetched_at = fetched_at or datetime.now()
+        self._current()
+        with self._lock:
+            changed = rate != self._rate
+            self._rate, self._fetched_at = rate, fetched_at
+            if changed:
+                self._stats["disk_writes"] += 1
+        if changed:
+            try:
+                self.save_to_cache(rate, fetched_at)
+            except OSError as e:
+                print(f"Error writing exchange rate cache: {e}")
 
+    def _start_background_refresh(self):
+        with self._lock:
+            if self._background_refresh:
+                return
+            self._background_refresh = True
+        threading.Thread(target=self._run_background_refresh, name="exchange-rate-refresh", daemon=True).start()
+
+    def _run_background_refresh(self):
+        try:
+            self.refresh()
+        finally:
+            with self._lock:
+                self._background_refresh = False
+
+    def fetch_rate(self):
+        """Scrape the USD to Rial rate from tgju.org and convert it to Toman; None on failure"""
         try:
-            response = requests.get(self.url, headers=self.headers)
+            response = requests.get(self.url, headers=self.headers, timeout=EXCHANGE_RATE_TIMEOUT_SECONDS)
             response.raise_for_status()  # Raise an exception for bad status codes
-            
-            soup = BeautifulSoup(response.text, 'html.parser')
-            
-            # Find the price element with specific data-col attribute
-            price_element = soup.find('span', {'data-col': 'info.last_trade.PDrCotVal'})
-            
-            if price_element:
-                # Extract the price and remove any non-numeric characters except decimal point
-                price_text = price_element.text.strip()
-                # Convert Rial to Toman by dividing by 10
-                price = float(price_text.replace(',', '')) / 10
-                # Save to cache
-                self.save_to_cache(price)
-                return price
-            else:
-                raise ValueError("Could not find price element on the page")
-                
+            return self.parse_rate(response.text)
         except requests.RequestException as e:
             print(f"Error fetching data: {e}")
-            # If fetch fails and we have a valid cache, use that
-            cached_rate, cache_time = self.load_from_cache()
-            if cached_rate and self.is_cache_valid(cache_time):
-                return cached_rate
             return None
         except ValueError as e:
             print(f"Error parsing data: {e}")
             return None
 
+    def parse_rate(self, html):
+        """USD to Toman rate from a tgju.org price page; raises ValueError if it is not there"""
+        price_text = extract_price_text(html)
+        if price_text is not None:
+            # Convert Rial to Toman by dividing by 10
+            return float(price_text.replace(',', '')) / 10
+        self._count("parse_fallbacks")
+        return self.parse_rate_full(html)
+
+    def parse_rate_full(self, html):
+        """parse_rate through a full BeautifulSoup parse of the page (the fallback)"""
+        soup = BeautifulSoup(html, 'html.parser')
+
+        # Find the price element with specific data-col attribute
+        price_element = soup.find('span', {'data-col': 'info.last_trade.PDrCotVal'})
+
+        if price_element:
+            # Extract the price and remove any non-numeric characters except decimal point
+            price_text = price_element.text.strip()
+            # Convert Rial to Toman by dividing by 10
+            return float(price_text.replace(',', '')) / 10
+        else:
+            raise ValueError("Could not find price element on the page")
+
+    def stats(self):
+        """Cache hits, misses and refresh latency of this exchange service"""
+        with self._lock:
+            stats = dict(self._stats)
+            rate, fetched_at = self._rate, self._fetched_at
+        refreshes = stats.pop("refreshes")
+        total_ms = stats.pop("refresh_ms_total")
+        stats.update({
+            "refreshes": refreshes,
+            "refresh_ms_avg": round(total_ms / refreshes, 1) if refreshes else None,
+            "refresh_ms_max": round(stats["refresh_ms_max"], 1),
+            "rate": rate,
+            "age_seconds": round((datetime.now() - fetched_at).total_seconds()) if fetched_at else None,
+        })
+        return stats
+
+
+_exchange = None
+_exchange_lock = threading.Lock()
+
+
+def get_currency_exchange():
+    """Get the process-wide exchange service, creating it on first use"""
+    global _exchange
+    with _exchange_lock:
+        if _exchange is None:
+            _exchange = CurrencyExchange()
+        return _exchange
+
+
+def exchange_rate_stats():
+    """Cache and refresh statistics of the process-wide exchange service"""
+    return get_currency_exchange().stats()
+
 # Sample usage code
 if __name__ == "__main__":
-    # Create an instance of CurrencyExchange
-    exchange = CurrencyExchange()
-    
+    # Get the shared CurrencyExchange instance
+    exchange = get_currency_exchange()
+
     # Get current USD rate (using cache if available)
     current_rate = exchange.get_usd_rate(live=False)
     print(f"Current USD to Toman rate: {current_rate:,.2f}")
-    
+
     # Get live rate
     live_rate = exchange.get_usd_rate(live=True)
-    print(f"Live USD to Toman rate: {live_rate:,.2f}") 
\ No newline at end of file
+    print(f"Live USD to Toman rate: {live_rate:,.2f}")
@@ -1,12 +1,216 @@
+import os
 import sqlite3
-from datetime import datetime
-from modules.currency_exchange import CurrencyExchange
+from contextlib import contextmanager, nullcontext
+from datetime import date as _date, datetime, timedelta
+from typing import NamedTuple, Optional
+from modules.archive import attached_archives
+from modules.currency_exchange import get_currency_exchange
+from modules.connection_pool import get_pool
+from modules.migrations import run_migrations
+from modules.repository import Repository
+from modules.write_queue import WRITE_QUEUE_ENABLED, get_write_queue
 import jdatetime
 
-class Database:
-    def __init__(self, db_name="money_tracker.db"):
+# Typed rows returned by Database. They are tuples (no per-row dict) with
+# named fields, so callers use row.date instead of guessing row[2]; field
+# order matches the column lists the queries select.
+class UserRow(NamedTuple):
+    id: int
+    username: str
+    email: str
+    password_hash: str
+    created_at: str
+
+
+class CategoryRow(NamedTuple):
+    id: int
+    name: str
+
+
+class SourceRow(NamedTuple):
+    id: int
+    name: str
+    bank: bool
+    usd: bool
+    value: float
+    user_id: int
+
+
+class TransactionRow(NamedTuple):
+    id: int
+    name: str
+    date: str
+    price_in_dollar: float
+    your_currency_rate: float
+    category_id: Optional[int]
+    source_id: Optional[int]
+    is_deposit: bool
+    user_id: int
+    affects_balance: bool
+
+
+class TransactionDetailRow(NamedTuple):
+    """A transaction joined with its category and source names (for reports)"""
+    id: int
+    name: str
+    date: str
+    price_in_dollar: float
+    your_currency_rate: float
+    category_id: Optional[int]
+    source_id: Optional[int]
+    is_deposit: bool
+    user_id: int
+    affects_balance: bool
+    category: Optional[str]
+    source: Optional[str]
+
+
+class LoanRow(NamedTuple):
+    id: int
+    name: str
+    total_amount: float
+    monthly_payment: float
+    interest_rate: float
+    start_date: str
+    end_date: Optional[str]
+    remaining_amount: float
+    is_usd: bool
+    user_id: int
+    created_at: str
+
+
+class LoanPaymentRow(NamedTuple):
+    id: int
+    loan_id: int
+    amount: float
+    payment_date: str
+    source_id: int
+    is_paid: bool
+    is_usd: bool
+    user_id: int
+    created_at: str
+    source_name: Optional[str]
+
+
+class MonthlyAggregateRow(NamedTuple):
+    category_id: int
+    category: Optional[str]
+    source_id: int
+    source: Optional[str]
+    is_deposit: int
+    transaction_count: int
+    total_usd: float
+    total_toman: float
+
+
+class ExchangeRateRow(NamedTuple):
+    timestamp: str
+    rate: float
+
+
+def columns(row_type, table=None):
+    """SQL select list for a row type's fields, optionally qualified with a table alias"""
+    prefix = f"{table}." if table else ""
+    return ", ".join(prefix + field for field in row_type._fields)
+
+
+def row_factory(row_type):
+    """sqlite3 row factory that builds row_type tuples straight from the cursor"""
+    make = row_type._make
+    return lambda cursor, row: make(row)
+
+
+USER_COLUMNS = columns(UserRow)
+CATEGORY_COLUMNS = columns(CategoryRow)
+SOURCE_COLUMNS = columns(SourceRow)
+TRANSACTION_COLUMNS = columns(TransactionRow)
+LOAN_COLUMNS = columns(LoanRow)
+EXCHANGE_RATE_COLUMNS = columns(ExchangeRateRow)
+
+DEFAULT_DB_NAME = "money_tracker.db"
+STREAM_CHUNK_SIZE = 500  # rows fetched per fetchmany() when streaming
+GENESIS_DATE = "0000-00-00"  # date of each source's opening-balance snapshot
+LATEST_DATE = "9999-99-99"  # sorts after every real date, for "current balance"
+# Take a new balance snapshot once a balance query has to sum this many ledger rows
+BALANCE_SNAPSHOT_EVERY = int(os.environ.get("BALANCE_SNAPSHOT_EVERY", "200"))
+USD_TOMAN = "USD/TOMAN"  # pair of the scraped rate in exchange_rates
+
+# Ledger of one source: every entry that moves its balance, as an amount in
+# the source's own currency, with archived transactions summed per day.
+# Parameters: usd, source_id, after, until (three times).
+LEDGER_QUERY = """
+    SELECT CASE WHEN is_deposit THEN 1 ELSE -1 END * ABS(price_in_dollar)
+           * CASE WHEN ? THEN 1 ELSE your_currency_rate END AS amount, date
+    FROM transactions
+    WHERE source_id = ? AND date > ? AND date <= ? AND affects_balance
+    UNION ALL
+    SELECT amount, date
+    FROM balance_adjustments
+    WHERE source_id = ? AND date > ? AND date <= ?
+    UNION ALL
+    SELECT amount, date
+    FROM archived_ledger
+    WHERE source_id = ? AND date > ? AND date <= ?
+"""
+
+# Export queries, one per dataset. Column order must match
+# modules.transaction_io.EXPORT_SCHEMAS; transactions use the bulk-import
+# layout (prices in dollars, is_usd = true) so an export can be re-imported,
+# and read {transactions} so archived years are included. Incomes are stored
+# with a negative price; is_deposit carries the sign, so prices are exported
+# as absolute values like the import expects.
+EXPORT_QUERIES = {
+    "transactions": """
+        SELECT t.date, t.name, ABS(t.price_in_dollar) AS price, 1 AS is_usd,
+               c.name AS category, s.name AS source, t.is_deposit, t.your_currency_rate
+        FROM {transactions} t
+        LEFT JOIN categories c ON t.category_id = c.id
+        LEFT JOIN sources s ON t.source_id = s.id
+        WHERE t.user_id = ?
+        ORDER BY t.date, t.id
+    """,
+    "sources": """
+        SELECT id, name, bank, usd, value
+        FROM sources
+        WHERE user_id = ?
+        ORDER BY id
+    """,
+    "loans": """
+        SELECT id, name, total_amount, monthly_payment, interest_rate, start_date,
+               end_date, remaining_amount, is_usd, created_at
+        FROM loans
+        WHERE user_id = ?
+        ORDER BY created_at
+    """,
+    "loan_payments": """
+        SELECT lp.id, lp.loan_id, lp.amount, lp.payment_date, lp.source_id,
+               s.name AS source, lp.is_paid, lp.is_usd, lp.created_at
+        FROM loan_payments lp
+        LEFT JOIN sources s ON lp.source_id = s.id
+        WHERE lp.user_id = ?
+        ORDER BY lp.id
+    """,
+}
+
+class Database(Repository):
+    """SQLite storage backend (the default)"""
+
+    # Raised by the driver when a constraint rejects a write
+    IntegrityError = sqlite3.IntegrityError
+    # Appended to SELECTs of rows a write block is about to change; SQLite
+    # needs none, as BEGIN IMMEDIATE already holds the database's write lock
+    FOR_UPDATE = ""
+
+    def __init__(self, db_name=DEFAULT_DB_NAME, write_queue=None):
         self.db_name = db_name
-        self.create_tables()
+        self.pool = get_pool(db_name)
+        self._init_write_queue(write_queue)
+
+    def _init_write_queue(self, write_queue):
+        """Route ledger writes through the shared group-commit queue if enabled (default: DB_WRITE_QUEUE)"""
+        if write_queue is None:
+            write_queue = WRITE_QUEUE_ENABLED
+        self.write_queue = get_write_queue(self) if write_queue else None
     
     def get_current_persian_date(self):
         """Get current date in Persian calendar format (YYYY-MM-DD)"""
@@ -31,122 +235,93 @@ class Database:
         return gregorian_date.strftime('%Y-%m-%d')
 
     def get_connection(self):
-        """Get a new connection to the SQLite database"""
-        return sqlite3.connect(self.db_name, timeout=20)  # Add timeout parameter
+        """Borrow a pooled connection to the SQLite database.
+
+        Use as ``with db.get_connection() as conn:``; the connection is committed
+        (or rolled back on error) and returned to the shared pool on exit.
+        """
+        return self.pool.connection()
+
+    @contextmanager
+    def write_transaction(self):
+        """Run a block of writes as a single BEGIN IMMEDIATE transaction.
+
+        Yields a cursor; the write lock is taken up front so reads inside the
+        block see the rows they are about to change, and everything commits
+        together (one fsync) or rolls back on error.
+        """
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            self._begin_write(cursor)
+            yield cursor
+
+    def _begin_write(self, cursor):
+        """Start a transaction that holds the database's write lock"""
+        cursor.execute("BEGIN IMMEDIATE")
+
+    def _lock_sources(self, cursor, source_ids):
+        """Keep other writers off sources' balances until the write commits (BEGIN IMMEDIATE already does)"""
+
+    def _lock_aggregates(self, cursor):
+        """Keep other writers off monthly_aggregates until the write commits (BEGIN IMMEDIATE already does)"""
+
+    def _transactions_source(self, conn, start_date=None, end_date=None):
+        """Context manager giving the table expression that holds the transactions of a date range.
+
+        Usually just "transactions"; when the range (None: open-ended)
+        reaches years moved to archive files (modules.archive), those are
+        attached to `conn` for the block and read along with the hot table.
+        """
+        return attached_archives(conn, self.db_name, TRANSACTION_COLUMNS, start_date, end_date)
+
+    def _write(self, fn, *args):
+        """Run fn(cursor, *args) as one atomic write and return its result.
+
+        With the write queue enabled the write is batched with other threads'
+        writes into a shared commit (inside its own savepoint); otherwise it
+        runs in its own write_transaction().
+        """
+        if self.write_queue is not None:
+            return self.write_queue.submit(fn, *args).result()
+        with self.write_transaction() as cursor:
+            return fn(cursor, *args)
+
+    def pool_stats(self):
+        """Get usage statistics of the connection pool behind this database"""
+        return self.pool.stats()
     
     def get_exchange_rate(self):
         """Get the current USD to Toman exchange rate"""
         try:
-            exchange = CurrencyExchange()
-            rate = exchange.get_usd_rate(live=False)
+            rate = get_currency_exchange().get_usd_rate(live=False)
             return rate if rate is not None else 50000  # Fallback rate
         except Exception as e:
             print(f"Error getting exchange rate: {e}")
             return 50000  # Fallback rate
 
-    def create_tables(self):
-        """Create the necessary tables if they don't exist"""
+    def add_exchange_rate(self, timestamp, rate, pair=USD_TOMAN):
+        """Record a rate in the exchange rate history; returns False if that timestamp is already there"""
+        with self.write_transaction() as cursor:
+            cursor.execute(
+                "INSERT INTO exchange_rates (timestamp, pair, rate) VALUES (?, ?, ?) ON CONFLICT (pair, timestamp) DO NOTHING",
+                (timestamp, pair, rate)
+            )
+            return cursor.rowcount > 0
+
+    def get_exchange_rates(self, pair=USD_TOMAN, since=None):
+        """Get a pair's rate history in time order, only after `since` if given"""
         with self.get_connection() as conn:
             cursor = conn.cursor()
-            
-            # Create users table
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS users (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    username TEXT UNIQUE NOT NULL,
-                    email TEXT UNIQUE NOT NULL,
-                    password_hash TEXT NOT NULL,
-                    created_at TEXT NOT NULL
-                )
-            ''')
-            
-            # Create categories table (without user_id)
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS categories (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    name TEXT UNIQUE NOT NULL
-                )
-            ''')
-            
-            # Create sources table
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS sources (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    name TEXT NOT NULL,
-                    bank BOOLEAN NOT NULL,
-                    usd BOOLEAN NOT NULL,
-                    value REAL NOT NULL,
-                    user_id INTEGER NOT NULL,
-                    FOREIGN KEY (user_id) REFERENCES users (id)
-                )
-            ''')
-            
-            # Create transactions table
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS transactions (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    name TEXT NOT NULL,
-                    date TEXT NOT NULL,
-                    price_in_dollar REAL NOT NULL,
-                    your_currency_rate REAL NOT NULL,
-                    category_id INTEGER,
-                    source_id INTEGER,
-                    is_deposit BOOLEAN NOT NULL DEFAULT FALSE,
-                    user_id INTEGER NOT NULL,
-                    FOREIGN KEY (category_id) REFERENCES categories (id),
-                    FOREIGN KEY (source_id) REFERENCES sources (id),
-                    FOREIGN KEY (user_id) REFERENCES users (id)
-                )
-            ''')
-            
-            # Create loans table
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS loans (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    name TEXT NOT NULL,
-                    total_amount REAL NOT NULL,
-                    monthly_payment REAL NOT NULL,
-                    interest_rate REAL DEFAULT 0.0,
-                    start_date TEXT NOT NULL,
-                    end_date TEXT,
-                    remaining_amount REAL NOT NULL,
-                    is_usd BOOLEAN NOT NULL DEFAULT TRUE,
-                    user_id INTEGER NOT NULL,
-                    created_at TEXT NOT NULL,
-                    FOREIGN KEY (user_id) REFERENCES users (id)
-                )
-            ''')
-            
-            # Create loan payments table
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS loan_payments (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    loan_id INTEGER NOT NULL,
-                    amount REAL NOT NULL,
-                    payment_date TEXT NOT NULL,
-                    source_id INTEGER NOT NULL,
-                    is_paid BOOLEAN NOT NULL DEFAULT FALSE,
-                    is_usd BOOLEAN NOT NULL DEFAULT TRUE,
-                    user_id INTEGER NOT NULL,
-                    created_at TEXT NOT NULL,
-                    FOREIGN KEY (loan_id) REFERENCES loans (id),
-                    FOREIGN KEY (source_id) REFERENCES sources (id),
-                    FOREIGN KEY (user_id) REFERENCES users (id)
-                )
-            ''')
-            
-            # Add user_id column if it doesn't exist
-            try:
-                cursor.execute('ALTER TABLE sources ADD COLUMN user_id INTEGER NOT NULL REFERENCES users(id)')
-            except sqlite3.OperationalError:
-                pass
-                
-            try:
-                cursor.execute('ALTER TABLE transactions ADD COLUMN user_id INTEGER NOT NULL REFERENCES users(id)')
-            except sqlite3.OperationalError:
-                pass
-                
-            conn.commit()
+            cursor.row_factory = row_factory(ExchangeRateRow)
+            cursor.execute(
+                f"SELECT {EXCHANGE_RATE_COLUMNS} FROM exchange_rates WHERE pair = ? AND timestamp > ? ORDER BY timestamp",
+                (pair, since or "")
+            )
+            return cursor.fetchall()
+
+    def create_tables(self):
+        """Bring the schema up to date (the app does this once at startup)"""
+        return run_migrations(self.db_name)
 
     def add_user(self, username, email, password_hash):
         """Add a new user"""
@@ -161,7 +336,7 @@ class Database:
                 user_id = cursor.lastrowid
                 conn.commit()
                 return user_id
-        except sqlite3.IntegrityError as e:
+        except self.IntegrityError as e:
             print(f"Database integrity error: {e}")
             return None
 
@@ -169,36 +344,97 @@ class Database:
         """Get user by username"""
         with self.get_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute("SELECT * FROM users WHERE username = ?", (username,))
+            cursor.row_factory = row_factory(UserRow)
+            cursor.execute(f"SELECT {USER_COLUMNS} FROM users WHERE username = ?", (username,))
             return cursor.fetchone()
 
     def get_user_by_email(self, email):
         """Get user by email"""
         with self.get_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute("SELECT * FROM users WHERE email = ?", (email,))
+            cursor.row_factory = row_factory(UserRow)
+            cursor.execute(f"SELECT {USER_COLUMNS} FROM users WHERE email = ?", (email,))
             return cursor.fetchone()
 
     def get_user_by_id(self, user_id):
         """Get user by ID"""
         with self.get_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute("SELECT * FROM users WHERE id = ?", (user_id,))
+            cursor.row_factory = row_factory(UserRow)
+            cursor.execute(f"SELECT {USER_COLUMNS} FROM users WHERE id = ?", (user_id,))
             return cursor.fetchone()
 
+    # Refresh tokens are stored by hash; times are UTC ISO strings (expires_at comes from modules.auth)
+    def add_refresh_token(self, user_id, token_hash, family_id, expires_at):
+        """Store a new refresh token, dropping the user's expired ones"""
+        now = datetime.utcnow().isoformat(timespec="seconds")
+        with self.write_transaction() as cursor:
+            cursor.execute("DELETE FROM refresh_tokens WHERE user_id = ? AND expires_at <= ?", (user_id, now))
+            cursor.execute(
+                """INSERT INTO refresh_tokens (token_hash, user_id, family_id, expires_at, created_at)
+                   VALUES (?, ?, ?, ?, ?)""",
+                (token_hash, user_id, family_id, expires_at, now)
+            )
+
+    def rotate_refresh_token(self, token_hash, new_token_hash, expires_at):
+        """Exchange a live refresh token for a new one of the same family.
+
+        Returns the user ID, or None if the token is unknown, expired or
+        already used. A used token presented again has leaked (or was
+        stolen), so its whole family is revoked.
+        """
+        now = datetime.utcnow().isoformat(timespec="seconds")
+        with self.write_transaction() as cursor:
+            cursor.execute(
+                f"SELECT user_id, family_id, expires_at, revoked_at FROM refresh_tokens WHERE token_hash = ?{self.FOR_UPDATE}",
+                (token_hash,)
+            )
+            row = cursor.fetchone()
+            if row is None:
+                return None
+            user_id, family_id, token_expires_at, revoked_at = row
+            if revoked_at is not None:
+                cursor.execute(
+                    "UPDATE refresh_tokens SET revoked_at = ? WHERE family_id = ? AND revoked_at IS NULL",
+                    (now, family_id)
+                )
+                print(f"Refresh token reuse for user {user_id}: revoked the session")
+                return None
+            if token_expires_at <= now:
+                return None
+            cursor.execute("UPDATE refresh_tokens SET revoked_at = ? WHERE token_hash = ?", (now, token_hash))
+            cursor.execute(
+                """INSERT INTO refresh_tokens (token_hash, user_id, family_id, expires_at, created_at)
+                   VALUES (?, ?, ?, ?, ?)""",
+                (new_token_hash, user_id, family_id, expires_at, now)
+            )
+            return user_id
+
+    def revoke_refresh_token(self, token_hash):
+        """Revoke the session (token family) of a refresh token; returns whether the token was known"""
+        now = datetime.utcnow().isoformat(timespec="seconds")
+        with self.write_transaction() as cursor:
+            cursor.execute(
+                """UPDATE refresh_tokens SET revoked_at = ?
+                   WHERE revoked_at IS NULL AND family_id = (SELECT family_id FROM refresh_tokens WHERE token_hash = ?)""",
+                (now, token_hash)
+            )
+            cursor.execute("SELECT 1 FROM refresh_tokens WHERE token_hash = ?", (token_hash,))
+            return cursor.fetchone() is not None
+
     def add_category(self, name, user_id=None):
         """Add a new category (global, not user-specific)"""
-        with self.get_connection() as conn:
-            cursor = conn.cursor()
-            try:
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
                 cursor.execute(
                     "INSERT INTO categories (name) VALUES (?)",
                     (name,)
                 )
                 conn.commit()
                 return cursor.lastrowid
-            except sqlite3.IntegrityError:
-                return None
+        except self.IntegrityError:
+            return None
 
     def add_source(self, name, bank, usd, value=0.0, user_id=None):
         """Add a new source"""
@@ -207,57 +443,291 @@ class Database:
                 cursor = conn.cursor()
                 cursor.execute(
                     "INSERT INTO sources (name, bank, usd, value, user_id) VALUES (?, ?, ?, ?, ?)",
-                    (name, bank, usd, value, user_id)
+                    (name, bool(bank), bool(usd), value, user_id)
+                )
+                source_id = cursor.lastrowid
+                # Opening balance, the starting point of every balance_as_of()
+                cursor.execute(
+                    "INSERT INTO balance_snapshots (source_id, date, balance) VALUES (?, ?, ?)",
+                    (source_id, GENESIS_DATE, value)
                 )
                 conn.commit()
-                return cursor.lastrowid
-        except sqlite3.IntegrityError:
+                return source_id
+        except self.IntegrityError:
             return None
 
     def add_transaction(self, name, date, price_in_dollar, your_currency_rate, category_id, source_id, user_id, is_deposit=False, update_balance=True):
-        """Add a new transaction and optionally update source balance"""
+        """Add a new transaction and optionally update source balance, atomically"""
         try:
-            with self.get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute(
-                    """INSERT INTO transactions 
-                       (name, date, price_in_dollar, your_currency_rate, category_id, source_id, is_deposit, user_id)
-                       VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
-                    (name, date, price_in_dollar, your_currency_rate, category_id, source_id, is_deposit, user_id)
-                )
-                transaction_id = cursor.lastrowid
-                conn.commit()
-                
-                if update_balance:
-                    self.update_source_balance(source_id, price_in_dollar, your_currency_rate, is_deposit)
-                
-                return transaction_id
-        except sqlite3.IntegrityError:
+            return self._write(
+                self._add_transaction, name, date, price_in_dollar, your_currency_rate,
+                category_id, source_id, user_id, is_deposit, update_balance
+            )
+        except self.IntegrityError:
             return None
+
+    def _add_transaction(self, cursor, name, date, price_in_dollar, your_currency_rate, category_id, source_id, user_id, is_deposit, update_balance):
+        """Insert a transaction and apply it to balances and aggregates inside the caller's transaction"""
+        cursor.execute(
+            """INSERT INTO transactions 
+               (name, date, price_in_dollar, your_currency_rate, category_id, source_id, is_deposit, user_id, affects_balance)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+            (name, date, price_in_dollar, your_currency_rate, category_id, source_id, bool(is_deposit), user_id, bool(update_balance))
+        )
+        transaction_id = cursor.lastrowid
+        
+        if update_balance:
+            self._apply_source_delta(cursor, source_id, price_in_dollar, your_currency_rate, is_deposit, date)
+        self._apply_aggregate_deltas(cursor, [
+            self._aggregate_delta(user_id, date, category_id, source_id, is_deposit, price_in_dollar, your_currency_rate)
+        ])
+        
+        return transaction_id
+
+    def bulk_add_transactions(self, user_id, transactions):
+        """Insert many transactions and update source balances in one transaction
+
+        Args:
+            user_id: Owner of the transactions
+            transactions: Iterable of (name, date, price_in_dollar, your_currency_rate,
+                category_id, source_id, is_deposit) tuples
+
+        Returns:
+            Number of inserted transactions
+        """
+        rows = []
+        # Summed balance change per source: [delta for USD sources, delta for Toman sources, earliest date]
+        deltas = {}
+        # Summed monthly aggregate change per (month, category, source, type)
+        aggregates = {}
+        for name, date, price_in_dollar, your_currency_rate, category_id, source_id, is_deposit in transactions:
+            rows.append((name, date, price_in_dollar, your_currency_rate, category_id, source_id, bool(is_deposit), user_id))
+            sign = 1 if is_deposit else -1
+            delta = deltas.setdefault(source_id, [0.0, 0.0, date])
+            delta[0] += sign * price_in_dollar
+            delta[1] += sign * price_in_dollar * your_currency_rate
+            delta[2] = min(delta[2], date)
+            key = (date[:7], category_id, source_id, bool(is_deposit))
+            aggregate = aggregates.setdefault(key, [date, 0, 0.0, 0.0])
+            aggregate[1] += 1
+            aggregate[2] += abs(price_in_dollar)
+            aggregate[3] += abs(price_in_dollar) * your_currency_rate
+
+        # Sources in ID order, so concurrent imports lock them in the same order
+        deltas = sorted(deltas.items())
+        with self.write_transaction() as cursor:
+            cursor.executemany(
+                """INSERT INTO transactions 
+                   (name, date, price_in_dollar, your_currency_rate, category_id, source_id, is_deposit, user_id)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                rows
+            )
+            cursor.executemany(
+                "UPDATE sources SET value = value + CASE WHEN usd THEN ? ELSE ? END WHERE id = ? AND user_id = ?",
+                [(usd_delta, toman_delta, source_id, user_id) for source_id, (usd_delta, toman_delta, _) in deltas]
+            )
+            cursor.executemany(
+                "DELETE FROM balance_snapshots WHERE source_id = ? AND date >= ? AND date > ?",
+                [(source_id, earliest, GENESIS_DATE) for source_id, (_, _, earliest) in deltas]
+            )
+            self._apply_aggregate_deltas(cursor, [
+                (user_id, date, category_id, source_id, is_deposit, count, total_usd, total_toman)
+                for (_, category_id, source_id, is_deposit), (date, count, total_usd, total_toman) in aggregates.items()
+            ])
+        return len(rows)
+
+    def _aggregate_delta(self, user_id, date, category_id, source_id, is_deposit, price_in_dollar, your_currency_rate, sign=1):
+        """Monthly aggregate change for adding (sign=1) or removing (sign=-1) one transaction"""
+        amount = abs(price_in_dollar)
+        return (user_id, date, category_id, source_id, is_deposit, sign, sign * amount, sign * amount * your_currency_rate)
+
+    def _apply_aggregate_deltas(self, cursor, deltas):
+        """Fold transaction changes into monthly_aggregates inside the caller's transaction
+
+        Args:
+            cursor: Cursor of the surrounding write transaction
+            deltas: Iterable of (user_id, date, category_id, source_id, is_deposit,
+                count, total_usd, total_toman) changes
+        """
+        params = [
+            (user_id, date, date, category_id or 0, source_id or 0, 1 if is_deposit else 0, count, total_usd, total_toman)
+            for user_id, date, category_id, source_id, is_deposit, count, total_usd, total_toman in deltas
+        ]
+        # Upsert the groups in key order, so concurrent writers lock their rows in the same order
+        params.sort(key=lambda param: (param[0], param[1][:7]) + param[3:6])
+        cursor.executemany("""
+            INSERT INTO monthly_aggregates
+                (user_id, year, month, category_id, source_id, is_deposit, transaction_count, total_usd, total_toman)
+            VALUES (?, CAST(substr(?, 1, 4) AS INTEGER), CAST(substr(?, 6, 2) AS INTEGER), ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (user_id, year, month, category_id, source_id, is_deposit) DO UPDATE SET
+                transaction_count = monthly_aggregates.transaction_count + excluded.transaction_count,
+                total_usd = monthly_aggregates.total_usd + excluded.total_usd,
+                total_toman = monthly_aggregates.total_toman + excluded.total_toman
+        """, params)
+        removed = [param[:6] for param in params if param[6] < 0]
+        if removed:
+            # Drop groups whose last transaction was removed
+            cursor.executemany("""
+                DELETE FROM monthly_aggregates
+                WHERE user_id = ? AND year = CAST(substr(?, 1, 4) AS INTEGER) AND month = CAST(substr(?, 6, 2) AS INTEGER)
+                  AND category_id = ? AND source_id = ? AND is_deposit = ? AND transaction_count <= 0
+            """, removed)
+
+    def rebuild_monthly_aggregates(self, user_id=None):
+        """Recompute monthly_aggregates from the transactions, archived years included (all users or one user)"""
+        where = "WHERE user_id = ?" if user_id is not None else ""
+        params = (user_id,) if user_id is not None else ()
+        with self.get_connection() as conn, self._transactions_source(conn) as transactions:
+            cursor = conn.cursor()
+            self._begin_write(cursor)
+            self._lock_aggregates(cursor)
+            cursor.execute(f"DELETE FROM monthly_aggregates {where}", params)
+            cursor.execute(f"""
+                INSERT INTO monthly_aggregates
+                    (user_id, year, month, category_id, source_id, is_deposit, transaction_count, total_usd, total_toman)
+                SELECT user_id,
+                       CAST(substr(date, 1, 4) AS INTEGER),
+                       CAST(substr(date, 6, 2) AS INTEGER),
+                       COALESCE(category_id, 0),
+                       COALESCE(source_id, 0),
+                       CASE WHEN is_deposit THEN 1 ELSE 0 END,
+                       COUNT(*),
+                       SUM(ABS(price_in_dollar)),
+                       SUM(ABS(price_in_dollar) * your_currency_rate)
+                FROM {transactions}
+                {where}
+                GROUP BY 1, 2, 3, 4, 5, 6
+            """, params)
+            return cursor.rowcount
+
+    def _apply_source_delta(self, cursor, source_id, amount_in_dollar, your_currency_rate, is_deposit, date):
+        """Add a transaction's effect to a source balance inside the caller's transaction.
+
+        The delta is applied in SQL (value = value + ?), so concurrent writers
+        can't overwrite each other's updates. USD sources move by the dollar
+        amount, Toman sources by the amount converted at your_currency_rate.
+        Balance snapshots from `date` on no longer hold and are dropped.
+        """
+        sign = 1 if is_deposit else -1
+        cursor.execute(
+            "UPDATE sources SET value = value + CASE WHEN usd THEN ? ELSE ? END WHERE id = ?",
+            (sign * amount_in_dollar, sign * amount_in_dollar * your_currency_rate, source_id)
+        )
+        updated = cursor.rowcount > 0
+        cursor.execute(
+            "DELETE FROM balance_snapshots WHERE source_id = ? AND date >= ? AND date > ?",
+            (source_id, date, GENESIS_DATE)
+        )
+        return updated
     
-    def update_source_balance(self, source_id, amount_in_dollar, your_currency_rate, is_deposit):
-        """Update source balance based on transaction amount and type (deposit/expense)"""
+    def update_source_balance(self, source_id, amount_in_dollar, your_currency_rate, is_deposit, date=None, note=None):
+        """Update source balance based on transaction amount and type (deposit/expense)
+
+        Used for balance changes that have no transaction row (e.g. loan
+        payments); the change is recorded in balance_adjustments so the
+        ledger still adds up to the balance.
+        """
+        date = date or _date.today().isoformat()
+        return self._write(self._update_source_balance, source_id, amount_in_dollar, your_currency_rate, is_deposit, date, note)
+
+    def _update_source_balance(self, cursor, source_id, amount_in_dollar, your_currency_rate, is_deposit, date, note):
+        """Record a balance adjustment and apply it inside the caller's transaction"""
+        sign = 1 if is_deposit else -1
+        cursor.execute(
+            """INSERT INTO balance_adjustments (source_id, user_id, date, amount, note, created_at)
+               SELECT id, user_id, ?, CASE WHEN usd THEN ? ELSE ? END, ?, ? FROM sources WHERE id = ?""",
+            (date, sign * amount_in_dollar, sign * amount_in_dollar * your_currency_rate, note,
+             self.get_current_persian_datetime(), source_id)
+        )
+        return self._apply_source_delta(cursor, source_id, amount_in_dollar, your_currency_rate, is_deposit, date)
+
+    def _balance_as_of(self, cursor, source_id, date):
+        """Balance of a source after all ledger entries dated on or before `date`
+
+        Starts from the latest snapshot at or before `date` and sums the
+        ledger entries after it. Returns (balance, ledger rows summed), or
+        None if the source does not exist.
+        """
+        cursor.execute(
+            """SELECT s.usd, b.date, b.balance
+               FROM balance_snapshots b
+               JOIN sources s ON s.id = b.source_id
+               WHERE b.source_id = ? AND b.date <= ?
+               ORDER BY b.date DESC
+               LIMIT 1""",
+            (source_id, date)
+        )
+        snapshot = cursor.fetchone()
+        if not snapshot:
+            return None
+        usd, snapshot_date, balance = snapshot
+        cursor.execute(
+            f"SELECT COUNT(*), COALESCE(SUM(amount), 0) FROM ({LEDGER_QUERY}) AS ledger",
+            (usd, source_id, snapshot_date, date, source_id, snapshot_date, date, source_id, snapshot_date, date)
+        )
+        count, delta = cursor.fetchone()
+        return balance + delta, count
+
+    def balance_as_of(self, source_id, date=None):
+        """Get a source's balance at the end of `date` (YYYY-MM-DD), or its current balance
+
+        Cost is bounded by the ledger entries since the nearest snapshot; when
+        that grows past BALANCE_SNAPSHOT_EVERY rows a new snapshot is taken.
+        Returns None if the source does not exist.
+        """
+        as_of = date or LATEST_DATE
         with self.get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT usd, value FROM sources WHERE id = ?", (source_id,))
-            source = cursor.fetchone()
-            if not source:
-                return False
-            is_usd, current_value = source
-            if is_usd:
-                delta = amount_in_dollar if is_deposit else -amount_in_dollar
-                new_value = current_value + delta
-            else:
-                amount_in_toman = amount_in_dollar * your_currency_rate
-                delta = amount_in_toman if is_deposit else -amount_in_toman
-                new_value = current_value + delta
+            result = self._balance_as_of(conn.cursor(), source_id, as_of)
+        if result is None:
+            return None
+        balance, count = result
+        if count >= BALANCE_SNAPSHOT_EVERY:
+            # Checkpoint no later than yesterday, so today's writes don't
+            # immediately invalidate it. Ledger dates are Gregorian.
+            yesterday = (_date.today() - timedelta(days=1)).isoformat()
+            self.snapshot_balance(source_id, min(as_of, yesterday))
+        return balance
 
+    def snapshot_balance(self, source_id, date=None):
+        """Record a balance snapshot for a source at `date` (default: today, Gregorian)"""
+        date = date or _date.today().isoformat()
+        with self.write_transaction() as cursor:
+            self._lock_sources(cursor, [source_id])
+            result = self._balance_as_of(cursor, source_id, date)
+            if result is None:
+                return None
+            balance, _ = result
             cursor.execute(
-                "UPDATE sources SET value = ? WHERE id = ?",
-                (new_value, source_id)
+                """INSERT INTO balance_snapshots (source_id, date, balance) VALUES (?, ?, ?)
+                   ON CONFLICT (source_id, date) DO UPDATE SET balance = excluded.balance""",
+                (source_id, date, balance)
             )
-            conn.commit()
-            return True
+            return balance
+
+    def snapshot_all_balances(self, date=None):
+        """Record a balance snapshot for every source (e.g. from a daily job)"""
+        with self.get_connection() as conn:
+            source_ids = [row[0] for row in conn.execute("SELECT id FROM sources")]
+        for source_id in source_ids:
+            self.snapshot_balance(source_id, date)
+        return len(source_ids)
+
+    def get_balance_history(self, source_id, dates):
+        """Get a source's balance at the end of each of the given dates"""
+        return {date: self.balance_as_of(source_id, date) for date in dates}
+
+    def reconcile_source_balance(self, source_id):
+        """Reset sources.value to the balance derived from the ledger; returns the correction"""
+        with self.write_transaction() as cursor:
+            self._lock_sources(cursor, [source_id])
+            result = self._balance_as_of(cursor, source_id, LATEST_DATE)
+            if result is None:
+                return None
+            balance, _ = result
+            cursor.execute("SELECT value FROM sources WHERE id = ?", (source_id,))
+            stored = cursor.fetchone()[0]
+            cursor.execute("UPDATE sources SET value = ? WHERE id = ?", (balance, source_id))
+            return balance - stored
 
     def add_income(self, name, date, amount, is_usd, your_currency_rate, category_id, source_id):
         """Add income to a source
@@ -274,25 +744,33 @@ class Database:
         try:
             # Convert amount to USD if needed
             amount_in_dollar = amount if is_usd else amount / your_currency_rate
-            
-            with self.get_connection() as conn:
-                cursor = conn.cursor()
-                # Add as a negative transaction (income)
-                cursor.execute(
-                    """INSERT INTO transactions 
-                       (name, date, price_in_dollar, your_currency_rate, category_id, source_id, is_deposit)
-                       VALUES (?, ?, ?, ?, ?, ?, ?)""",
-                    (name, date, -amount_in_dollar, your_currency_rate, category_id, source_id, True)
-                )
-                transaction_id = cursor.lastrowid
-                conn.commit()
-                
-                # Update source balance
-                self.update_source_income(source_id, amount_in_dollar, your_currency_rate)
-                
-                return transaction_id
-        except sqlite3.IntegrityError:
+            return self._write(self._add_income, name, date, amount_in_dollar, your_currency_rate, category_id, source_id)
+        except self.IntegrityError:
             return None
+
+    def _add_income(self, cursor, name, date, amount_in_dollar, your_currency_rate, category_id, source_id):
+        """Insert an income transaction and apply it inside the caller's transaction"""
+        # Add as a negative transaction (income)
+        # The income belongs to the owner of the source
+        cursor.execute(
+            """INSERT INTO transactions 
+               (name, date, price_in_dollar, your_currency_rate, category_id, source_id, is_deposit, user_id)
+               SELECT ?, ?, ?, ?, ?, id, ?, user_id FROM sources WHERE id = ?""",
+            (name, date, -amount_in_dollar, your_currency_rate, category_id, True, source_id)
+        )
+        if not cursor.rowcount:
+            return None
+        transaction_id = cursor.lastrowid
+        
+        # Update source balance
+        self._apply_source_delta(cursor, source_id, amount_in_dollar, your_currency_rate, True, date)
+        cursor.execute("SELECT user_id FROM transactions WHERE id = ?", (transaction_id,))
+        user_id = cursor.fetchone()[0]
+        self._apply_aggregate_deltas(cursor, [
+            self._aggregate_delta(user_id, date, category_id, source_id, True, amount_in_dollar, your_currency_rate)
+        ])
+        
+        return transaction_id
     
     def update_source_income(self, source_id, amount_in_dollar, your_currency_rate):
         """Update source balance for income
@@ -302,113 +780,219 @@ class Database:
             amount_in_dollar: Income amount in USD
             your_currency_rate: Exchange rate used for the transaction
         """
-        # Get source details
-        with self.get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT usd, value FROM sources WHERE id = ?", (source_id,))
-            source = cursor.fetchone()
-            
-            if not source:
-                return False
-            
-            is_usd, current_value = source
-            
-            # Calculate the amount to add based on currency
-            if is_usd:
-                # Source is in USD, so directly add amount_in_dollar
-                new_value = current_value + amount_in_dollar
-            else:
-                # Source is in Toman, so convert amount_in_dollar to Toman
-                amount_in_toman = amount_in_dollar * your_currency_rate
-                new_value = current_value + amount_in_toman
-            
-            # Update source value
-            cursor.execute(
-                "UPDATE sources SET value = ? WHERE id = ?",
-                (new_value, source_id)
-            )
-            conn.commit()
-            
-            return True
+        return self.update_source_balance(source_id, amount_in_dollar, your_currency_rate, True)
 
     def get_all_categories(self):
         """Get all categories (global, not user-specific)"""
         with self.get_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute("SELECT * FROM categories")
+            cursor.row_factory = row_factory(CategoryRow)
+            cursor.execute(f"SELECT {CATEGORY_COLUMNS} FROM categories")
             return cursor.fetchall()
 
     def get_all_sources(self, user_id):
         """Get all sources for a user"""
         with self.get_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute("SELECT * FROM sources WHERE user_id = ?", (user_id,))
+            cursor.row_factory = row_factory(SourceRow)
+            cursor.execute(f"SELECT {SOURCE_COLUMNS} FROM sources WHERE user_id = ?", (user_id,))
             return cursor.fetchall()
     
     def get_sources(self, user_id):
-        """Get all sources for a user as dictionaries"""
-        with self.get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT * FROM sources WHERE user_id = ?", (user_id,))
-            
-            # Convert tuples to dictionaries
-            columns = [description[0] for description in cursor.description]
-            rows = cursor.fetchall()
-            return [dict(zip(columns, row)) for row in rows]
+        """Get all sources for a user (same rows as get_all_sources)"""
+        return self.get_all_sources(user_id)
 
     def get_all_transactions(self, user_id, month=None):
         """Get all transactions for a user, optionally filtered by month"""
-        with self.get_connection() as conn:
+        start_date = end_date = None
+        if month is not None:
+            year = jdatetime.datetime.now().year
+            start_date = f"{year}-{month:02d}-01"
+            end_date = f"{year}-{month + 1:02d}-01" if month < 12 else f"{year + 1}-01-01"
+
+        with self.get_connection() as conn, self._transactions_source(conn, start_date, end_date) as transactions:
             cursor = conn.cursor()
+            cursor.row_factory = row_factory(TransactionRow)
             
             if month is not None:
-                year = jdatetime.datetime.now().year
-                start_date = f"{year}-{month:02d}-01"
-                end_date = f"{year}-{month + 1:02d}-01" if month < 12 else f"{year + 1}-01-01"
-                
-                cursor.execute("""
-                    SELECT * FROM transactions 
+                cursor.execute(f"""
+                    SELECT {TRANSACTION_COLUMNS} FROM {transactions} 
                     WHERE user_id = ? AND date >= ? AND date < ?
                     ORDER BY date DESC
                 """, (user_id, start_date, end_date))
             else:
                 cursor.execute(
-                    "SELECT * FROM transactions WHERE user_id = ? ORDER BY date DESC",
+                    f"SELECT {TRANSACTION_COLUMNS} FROM {transactions} WHERE user_id = ? ORDER BY date DESC",
                     (user_id,)
                 )
             
             return cursor.fetchall()
     
+    def get_transactions_page(self, user_id, limit, before_date=None, before_id=None, month=None):
+        """Get one page of a user's transactions, newest first (keyset pagination)
+
+        Args:
+            user_id: Owner of the transactions
+            limit: Maximum number of rows to return
+            before_date: Cursor date; only rows strictly before (before_date, before_id) are returned
+            before_id: Cursor transaction ID (tie-breaker for rows sharing before_date)
+            month: Optional month of the current year to restrict the listing to
+
+        Returns:
+            (rows, next_cursor) where next_cursor is a (date, id) tuple, or None on the last page
+        """
+        conditions = ["user_id = ?"]
+        params = [user_id]
+        start_date = end_date = None
+        if month is not None:
+            year = jdatetime.datetime.now().year
+            start_date = f"{year}-{month:02d}-01"
+            end_date = f"{year}-{month + 1:02d}-01" if month < 12 else f"{year + 1}-01-01"
+            conditions.append("date >= ? AND date < ?")
+            params.extend([start_date, end_date])
+        if before_date is not None:
+            if before_id is None:
+                conditions.append("date < ?")
+                params.append(before_date)
+            else:
+                conditions.append("(date, id) < (?, ?)")
+                params.extend([before_date, before_id])
+        # Fetch one extra row to know whether another page follows
+        query = f"""SELECT {TRANSACTION_COLUMNS} FROM {{transactions}}
+                    WHERE {' AND '.join(conditions)}
+                    ORDER BY date DESC, id DESC
+                    LIMIT ?"""
+        params.append(limit + 1)
+
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = row_factory(TransactionRow)
+            cursor.execute(query.format(transactions="transactions"), params)
+            rows = cursor.fetchall()
+            # Archived rows can only belong on this page if their year lies
+            # between the cursor and the oldest row the hot table gave
+            oldest = rows[-1].date if len(rows) > limit else start_date
+            newest = min(filter(None, (before_date, end_date)), default=None)
+            with self._transactions_source(conn, oldest, newest) as transactions:
+                if transactions != "transactions":
+                    cursor.execute(query.format(transactions=transactions), params)
+                    rows = cursor.fetchall()
+
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last = rows[-1]
+            return rows, (last.date, last.id)
+        return rows, None
+
     def get_transactions_by_month(self, user_id, month, year):
         """Get all transactions for a user for a specific month and year"""
-        with self.get_connection() as conn:
+        start_date = f"{year}-{month:02d}-01"
+        if month == 12:
+            end_date = f"{year + 1}-01-01"
+        else:
+            end_date = f"{year}-{month + 1:02d}-01"
+
+        with self.get_connection() as conn, self._transactions_source(conn, start_date, end_date) as transactions:
             cursor = conn.cursor()
-            
-            start_date = f"{year}-{month:02d}-01"
-            if month == 12:
-                end_date = f"{year + 1}-01-01"
-            else:
-                end_date = f"{year}-{month + 1:02d}-01"
-            
-            cursor.execute("""
-                SELECT t.*, c.name as category, s.name as source
-                FROM transactions t
+            cursor.row_factory = row_factory(TransactionDetailRow)
+            cursor.execute(f"""
+                SELECT {columns(TransactionRow, "t")}, c.name as category, s.name as source
+                FROM {transactions} t
                 LEFT JOIN categories c ON t.category_id = c.id
                 LEFT JOIN sources s ON t.source_id = s.id
                 WHERE t.user_id = ? AND t.date >= ? AND t.date < ?
                 ORDER BY t.date DESC
             """, (user_id, start_date, end_date))
-            
-            # Convert tuples to dictionaries
-            columns = [description[0] for description in cursor.description]
-            rows = cursor.fetchall()
-            return [dict(zip(columns, row)) for row in rows]
+            return cursor.fetchall()
+    
+    def _iter_rows(self, query, params, chunk_size, row_type=None, dates=None):
+        """Yield the rows of a query, fetching chunk_size rows at a time.
+
+        With dates=(start, end), the query selects FROM {transactions}, which
+        also covers the archived years that date range reaches. The pooled
+        connection is held until the generator is exhausted or closed.
+        """
+        with self.get_connection() as conn:
+            source = self._transactions_source(conn, *dates) if dates is not None else nullcontext()
+            with source as transactions:
+                cursor = conn.cursor()
+                try:
+                    if row_type is not None:
+                        cursor.row_factory = row_factory(row_type)
+                    cursor.execute(query.format(transactions=transactions) if dates is not None else query, params)
+                    while True:
+                        rows = cursor.fetchmany(chunk_size)
+                        if not rows:
+                            break
+                        yield from rows
+                finally:
+                    # An unfinished statement would keep the archives attached
+                    cursor.close()
+
+    def iter_transactions(self, user_id, month=None, chunk_size=STREAM_CHUNK_SIZE):
+        """Stream a user's transactions (same rows and order as get_all_transactions)"""
+        if month is not None:
+            year = jdatetime.datetime.now().year
+            start_date = f"{year}-{month:02d}-01"
+            end_date = f"{year}-{month + 1:02d}-01" if month < 12 else f"{year + 1}-01-01"
+            return self._iter_rows(f"""
+                SELECT {TRANSACTION_COLUMNS} FROM {{transactions}} 
+                WHERE user_id = ? AND date >= ? AND date < ?
+                ORDER BY date DESC
+            """, (user_id, start_date, end_date), chunk_size, TransactionRow, (start_date, end_date))
+        return self._iter_rows(
+            f"SELECT {TRANSACTION_COLUMNS} FROM {{transactions}} WHERE user_id = ? ORDER BY date DESC",
+            (user_id,),
+            chunk_size,
+            TransactionRow,
+            (None, None)
+        )
+
+    def iter_transactions_by_month(self, user_id, month, year, chunk_size=STREAM_CHUNK_SIZE):
+        """Stream a month of transactions (same rows as get_transactions_by_month)"""
+        start_date = f"{year}-{month:02d}-01"
+        end_date = f"{year + 1}-01-01" if month == 12 else f"{year}-{month + 1:02d}-01"
+        return self._iter_rows(f"""
+            SELECT {columns(TransactionRow, "t")}, c.name as category, s.name as source
+            FROM {{transactions}} t
+            LEFT JOIN categories c ON t.category_id = c.id
+            LEFT JOIN sources s ON t.source_id = s.id
+            WHERE t.user_id = ? AND t.date >= ? AND t.date < ?
+            ORDER BY t.date DESC
+        """, (user_id, start_date, end_date), chunk_size, TransactionDetailRow, (start_date, end_date))
+    
+    def iter_export_rows(self, dataset, user_id, chunk_size=STREAM_CHUNK_SIZE):
+        """Stream all of a user's rows of one dataset (see EXPORT_QUERIES)"""
+        if dataset not in EXPORT_QUERIES:
+            raise ValueError(f"Unknown export dataset: {dataset}")
+        dates = (None, None) if dataset == "transactions" else None
+        return self._iter_rows(EXPORT_QUERIES[dataset], (user_id,), chunk_size, dates=dates)
+    
+    def get_monthly_aggregates(self, user_id, month, year):
+        """Get a month's totals per category, source and type (deposit/expense)
+
+        Reads the incrementally maintained monthly_aggregates table, so the cost
+        depends on the number of categories and sources, not transactions.
+        """
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = row_factory(MonthlyAggregateRow)
+            cursor.execute("""
+                SELECT a.category_id, c.name as category, a.source_id, s.name as source,
+                       a.is_deposit, a.transaction_count, a.total_usd, a.total_toman
+                FROM monthly_aggregates a
+                LEFT JOIN categories c ON a.category_id = c.id
+                LEFT JOIN sources s ON a.source_id = s.id
+                WHERE a.user_id = ? AND a.year = ? AND a.month = ?
+            """, (user_id, year, month))
+            return cursor.fetchall()
     
     def get_source_by_id(self, source_id):
         """Get source by ID"""
         with self.get_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute("SELECT * FROM sources WHERE id = ?", (source_id,))
+            cursor.row_factory = row_factory(SourceRow)
+            cursor.execute(f"SELECT {SOURCE_COLUMNS} FROM sources WHERE id = ?", (source_id,))
             result = cursor.fetchone()
             return result
     
@@ -416,89 +1000,114 @@ class Database:
         """Get category by ID"""
         with self.get_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute("SELECT * FROM categories WHERE id = ?", (category_id,))
+            cursor.row_factory = row_factory(CategoryRow)
+            cursor.execute(f"SELECT {CATEGORY_COLUMNS} FROM categories WHERE id = ?", (category_id,))
             result = cursor.fetchone()
             return result
     
     def get_transactions_by_source(self, source_id):
         """Get all transactions for a specific source"""
-        with self.get_connection() as conn:
+        with self.get_connection() as conn, self._transactions_source(conn) as transactions:
             cursor = conn.cursor()
-            cursor.execute("SELECT * FROM transactions WHERE source_id = ?", (source_id,))
+            cursor.row_factory = row_factory(TransactionRow)
+            cursor.execute(f"SELECT {TRANSACTION_COLUMNS} FROM {transactions} WHERE source_id = ?", (source_id,))
             result = cursor.fetchall()
             return result
     
     def get_transactions_by_category(self, category_id):
         """Get all transactions for a specific category"""
-        with self.get_connection() as conn:
+        with self.get_connection() as conn, self._transactions_source(conn) as transactions:
             cursor = conn.cursor()
-            cursor.execute("SELECT * FROM transactions WHERE category_id = ?", (category_id,))
+            cursor.row_factory = row_factory(TransactionRow)
+            cursor.execute(f"SELECT {TRANSACTION_COLUMNS} FROM {transactions} WHERE category_id = ?", (category_id,))
             result = cursor.fetchall()
             return result
     
     def get_transactions_by_date_range(self, start_date, end_date):
         """Get all transactions within a date range"""
-        with self.get_connection() as conn:
+        with self.get_connection() as conn, self._transactions_source(conn, start_date, end_date) as transactions:
             cursor = conn.cursor()
+            cursor.row_factory = row_factory(TransactionRow)
             cursor.execute(
-                "SELECT * FROM transactions WHERE date BETWEEN ? AND ?",
+                f"SELECT {TRANSACTION_COLUMNS} FROM {transactions} WHERE date BETWEEN ? AND ?",
                 (start_date, end_date)
             )
             result = cursor.fetchall()
             return result
     
     def get_transaction_by_id(self, transaction_id):
-        """Get a transaction by its ID"""
+        """Get a transaction by its ID (archived transactions too, though they can't be changed)"""
         with self.get_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute("SELECT * FROM transactions WHERE id = ?", (transaction_id,))
-            return cursor.fetchone()
+            cursor.row_factory = row_factory(TransactionRow)
+            cursor.execute(f"SELECT {TRANSACTION_COLUMNS} FROM transactions WHERE id = ?", (transaction_id,))
+            row = cursor.fetchone()
+            if row is None:
+                with self._transactions_source(conn) as transactions:
+                    if transactions != "transactions":
+                        cursor.execute(f"SELECT {TRANSACTION_COLUMNS} FROM {transactions} WHERE id = ?", (transaction_id,))
+                        row = cursor.fetchone()
+            return row
 
     def update_transaction(self, transaction_id, name, date, price, is_usd, category_id, source_id, your_currency_rate, is_deposit):
-        """Update a transaction by its ID and update the source balance as well"""
-        with self.get_connection() as conn:
-            cursor = conn.cursor()
-            # Fetch old transaction data
-            cursor.execute("SELECT price_in_dollar, your_currency_rate, source_id, is_deposit FROM transactions WHERE id = ?", (transaction_id,))
-            old_tx = cursor.fetchone()
-            if not old_tx:
-                return False
-            old_price, old_rate, old_source_id, old_is_deposit = old_tx
-            # Revert old effect (invert is_deposit)
-            self.update_source_balance(old_source_id, abs(old_price), old_rate, not old_is_deposit)
-            # Update transaction
-            cursor.execute(
-                """
-                UPDATE transactions SET name=?, date=?, price_in_dollar=?, your_currency_rate=?, category_id=?, source_id=?, is_deposit=? WHERE id=?
-                """,
-                (name, date, price, your_currency_rate, category_id, source_id, is_deposit, transaction_id)
-            )
-            conn.commit()
-            # Apply new effect
-            self.update_source_balance(source_id, abs(price), your_currency_rate, is_deposit)
-            return cursor.rowcount > 0 
+        """Update a transaction by its ID and update the source balance as well, atomically"""
+        return self._write(self._update_transaction, transaction_id, name, date, price, is_usd, category_id, source_id, your_currency_rate, is_deposit)
+
+    def _update_transaction(self, cursor, transaction_id, name, date, price, is_usd, category_id, source_id, your_currency_rate, is_deposit):
+        """Update a transaction and move its balance and aggregate effects inside the caller's transaction"""
+        # Fetch old transaction data
+        cursor.execute(f"SELECT price_in_dollar, your_currency_rate, source_id, is_deposit, user_id, date, category_id, affects_balance FROM transactions WHERE id = ?{self.FOR_UPDATE}", (transaction_id,))
+        old_tx = cursor.fetchone()
+        if not old_tx:
+            return False
+        old_price, old_rate, old_source_id, old_is_deposit, user_id, old_date, old_category_id, affects_balance = old_tx
+        if affects_balance:
+            # Lock both sources in ID order, so opposite moves between two sources can't deadlock
+            self._lock_sources(cursor, sorted({old_source_id, source_id}))
+        # Update transaction
+        cursor.execute(
+            """
+            UPDATE transactions SET name=?, date=?, price_in_dollar=?, your_currency_rate=?, category_id=?, source_id=?, is_deposit=? WHERE id=?
+            """,
+            (name, date, price, your_currency_rate, category_id, source_id, bool(is_deposit), transaction_id)
+        )
+        updated = cursor.rowcount > 0
+        if affects_balance:
+            # Revert old effect (invert is_deposit) and apply the new one
+            self._apply_source_delta(cursor, old_source_id, abs(old_price), old_rate, not old_is_deposit, old_date)
+            self._apply_source_delta(cursor, source_id, abs(price), your_currency_rate, is_deposit, date)
+        self._apply_aggregate_deltas(cursor, [
+            self._aggregate_delta(user_id, old_date, old_category_id, old_source_id, old_is_deposit, old_price, old_rate, sign=-1),
+            self._aggregate_delta(user_id, date, category_id, source_id, is_deposit, price, your_currency_rate),
+        ])
+        return updated
 
     def delete_transaction(self, transaction_id, user_id):
-        """Delete a transaction by its ID and update the source balance"""
-        with self.get_connection() as conn:
-            cursor = conn.cursor()
-            # Fetch transaction data before deletion
-            cursor.execute("SELECT price_in_dollar, your_currency_rate, source_id, is_deposit FROM transactions WHERE id = ? AND user_id = ?", (transaction_id, user_id))
-            transaction = cursor.fetchone()
-            if not transaction:
-                return False
-            
-            price, rate, source_id, is_deposit = transaction
-            
-            # Delete the transaction
-            cursor.execute("DELETE FROM transactions WHERE id = ? AND user_id = ?", (transaction_id, user_id))
-            conn.commit()
-            
-            if cursor.rowcount > 0:
-                # Revert the source balance effect (invert is_deposit)
-                self.update_source_balance(source_id, abs(price), rate, not is_deposit)
-                return True
+        """Delete a transaction by its ID and update the source balance, atomically"""
+        return self._write(self._delete_transaction, transaction_id, user_id)
+
+    def _delete_transaction(self, cursor, transaction_id, user_id):
+        """Delete a transaction and revert its effects inside the caller's transaction"""
+        # Fetch transaction data before deletion
+        cursor.execute(f"SELECT price_in_dollar, your_currency_rate, source_id, is_deposit, date, category_id, affects_balance FROM transactions WHERE id = ? AND user_id = ?{self.FOR_UPDATE}", (transaction_id, user_id))
+        transaction = cursor.fetchone()
+        if not transaction:
             return False
+        
+        price, rate, source_id, is_deposit, date, category_id, affects_balance = transaction
+        
+        # Delete the transaction
+        cursor.execute("DELETE FROM transactions WHERE id = ? AND user_id = ?", (transaction_id, user_id))
+        
+        if cursor.rowcount > 0:
+            if affects_balance:
+                # Revert the source balance effect (invert is_deposit)
+                self._apply_source_delta(cursor, source_id, abs(price), rate, not is_deposit, date)
+            self._apply_aggregate_deltas(cursor, [
+                self._aggregate_delta(user_id, date, category_id, source_id, is_deposit, price, rate, sign=-1)
+            ])
+            return True
+        return False
 
     # Loan management methods
     def add_loan(self, name, total_amount, monthly_payment, is_usd, user_id):
@@ -510,26 +1119,28 @@ class Database:
                     """INSERT INTO loans 
                        (name, total_amount, monthly_payment, interest_rate, start_date, end_date, remaining_amount, is_usd, user_id, created_at)
                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-                    (name, total_amount, monthly_payment, 0.0, self.get_current_persian_date(), None, total_amount, is_usd, user_id, self.get_current_persian_datetime())
+                    (name, total_amount, monthly_payment, 0.0, self.get_current_persian_date(), None, total_amount, bool(is_usd), user_id, self.get_current_persian_datetime())
                 )
                 loan_id = cursor.lastrowid
                 conn.commit()
                 return loan_id
-        except sqlite3.IntegrityError:
+        except self.IntegrityError:
             return None
 
     def get_all_loans(self, user_id):
         """Get all loans for a user"""
         with self.get_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute("SELECT * FROM loans WHERE user_id = ? ORDER BY created_at DESC", (user_id,))
+            cursor.row_factory = row_factory(LoanRow)
+            cursor.execute(f"SELECT {LOAN_COLUMNS} FROM loans WHERE user_id = ? ORDER BY created_at DESC", (user_id,))
             return cursor.fetchall()
 
     def get_loan_by_id(self, loan_id, user_id):
         """Get a loan by ID for a specific user"""
         with self.get_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute("SELECT * FROM loans WHERE id = ? AND user_id = ?", (loan_id, user_id))
+            cursor.row_factory = row_factory(LoanRow)
+            cursor.execute(f"SELECT {LOAN_COLUMNS} FROM loans WHERE id = ? AND user_id = ?", (loan_id, user_id))
             return cursor.fetchone()
 
     def update_loan_remaining_amount(self, loan_id, new_remaining_amount):
@@ -552,20 +1163,22 @@ class Database:
                     """INSERT INTO loan_payments 
                        (loan_id, amount, payment_date, source_id, is_paid, is_usd, user_id, created_at)
                        VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
-                    (loan_id, amount, payment_date, source_id, is_paid, is_usd, user_id, self.get_current_persian_datetime())
+                    (loan_id, amount, payment_date, source_id, bool(is_paid), bool(is_usd), user_id, self.get_current_persian_datetime())
                 )
                 payment_id = cursor.lastrowid
                 conn.commit()
                 return payment_id
-        except sqlite3.IntegrityError:
+        except self.IntegrityError:
             return None
 
     def get_loan_payments(self, loan_id, user_id):
         """Get all payments for a specific loan"""
         with self.get_connection() as conn:
             cursor = conn.cursor()
+            cursor.row_factory = row_factory(LoanPaymentRow)
             cursor.execute("""
-                SELECT lp.*, s.name as source_name 
+                SELECT lp.id, lp.loan_id, lp.amount, lp.payment_date, lp.source_id, lp.is_paid,
+                       lp.is_usd, lp.user_id, lp.created_at, s.name as source_name
                 FROM loan_payments lp
                 LEFT JOIN sources s ON lp.source_id = s.id
                 WHERE lp.loan_id = ? AND lp.user_id = ?
@@ -575,20 +1188,17 @@ class Database:
 
     def mark_payment_paid(self, payment_id, user_id):
         """Mark a loan payment as paid and update loan remaining amount"""
-        with self.get_connection() as conn:
-            cursor = conn.cursor()
-            
+        with self.write_transaction() as cursor:
             # Get payment details
-            cursor.execute("""
-                SELECT lp.*, l.remaining_amount, l.is_usd 
-                FROM loan_payments lp
-                JOIN loans l ON lp.loan_id = l.id
-                WHERE lp.id = ? AND lp.user_id = ?
-            """, (payment_id, user_id))
+            cursor.execute(
+                f"SELECT loan_id, amount FROM loan_payments WHERE id = ? AND user_id = ?{self.FOR_UPDATE}",
+                (payment_id, user_id)
+            )
             payment = cursor.fetchone()
             
             if not payment:
                 return False
+            loan_id, amount = payment
             
             # Mark payment as paid
             cursor.execute(
@@ -597,13 +1207,10 @@ class Database:
             )
             
             # Update loan remaining amount
-            new_remaining = payment[6] - payment[2]  # remaining_amount - amount
             cursor.execute(
-                "UPDATE loans SET remaining_amount = ? WHERE id = ?",
-                (new_remaining, payment[1])  # new_remaining, loan_id
+                "UPDATE loans SET remaining_amount = remaining_amount - ? WHERE id = ?",
+                (amount, loan_id)
             )
-            
-            conn.commit()
             return True
 
     def delete_loan(self, loan_id, user_id):
@@ -0,0 +1,102 @@
+import os
+import threading
+import time
+from collections import deque
+
+# Login throttling: every client IP gets LOGIN_IP_ATTEMPTS failed logins and
+# registrations per window, and every username LOGIN_USER_FAILURES failed
+# logins, before further attempts are refused with 429 without touching
+# bcrypt. Successful logins count against neither, so a busy IP is only
+# refused for its own failures.
+LOGIN_WINDOW_SECONDS = float(os.getenv("LOGIN_WINDOW_SECONDS", "60"))
+LOGIN_IP_ATTEMPTS = int(os.getenv("LOGIN_IP_ATTEMPTS", "20"))
+LOGIN_USER_FAILURES = int(os.getenv("LOGIN_USER_FAILURES", "5"))
+# IPs that log in on behalf of many users (e.g. the Telegram bot) are only
+# throttled per username
+LOGIN_IP_EXEMPT = {ip.strip() for ip in os.getenv("LOGIN_IP_EXEMPT", "").split(",") if ip.strip()}
+MAX_TRACKED_KEYS = 100_000
+
+
+class LoginThrottle:
+    """Sliding-window counter of attempts per key (an IP or a username)"""
+
+    def __init__(self, max_attempts, window_seconds=LOGIN_WINDOW_SECONDS, max_keys=MAX_TRACKED_KEYS):
+        self.max_attempts = max_attempts
+        self.window = window_seconds
+        self.max_keys = max_keys
+        self._attempts = {}
+        self._lock = threading.Lock()
+        self.rejected = 0
+
+    def _recent(self, key, now):
+        attempts = self._attempts.get(key)
+        if attempts is None:
+            return None
+        while attempts and attempts[0] <= now - self.window:
+            attempts.popleft()
+        if not attempts:
+            del self._attempts[key]
+            return None
+        return attempts
+
+    def retry_after(self, key):
+        """Seconds until `key` may try again (0 if it may now)"""
+        now = time.monotonic()
+        with self._lock:
+            attempts = self._recent(key, now)
+            if attempts is None or len(attempts) < self.max_attempts:
+                return 0
+            self.rejected += 1
+            return max(attempts[0] + self.window - now, 0.001)
+
+    def record(self, key):
+        """Count an attempt of `key`"""
+        now = time.monotonic()
+        with self._lock:
+            if len(self._attempts) >= self.max_keys:
+                self._prune(now)
+            attempts = self._recent(key, now) or self._attempts.setdefault(key, deque())
+            attempts.append(now)
+
+    def reset(self, key):
+        """Forget the attempts of `key` (e.g. after a successful login)"""
+        with self._lock:
+            self._attempts.pop(key, None)
+
+    def _prune(self, now):
+        for key in list(self._attempts):
+            self._recent(key, now)
+        # Still full of active keys: drop the oldest ones rather than grow without bound
+        excess = len(self._attempts) - self.max_keys + 1
+        for key in list(self._attempts)[:max(excess, 0)]:
+            del self._attempts[key]
+
+    def stats(self):
+        with self._lock:
+            return {"tracked": len(self._attempts), "max_attempts": self.max_attempts,
+                    "window_seconds": self.window, "rejected": self.rejected}
+
+
+ip_throttle = LoginThrottle(LOGIN_IP_ATTEMPTS)
+user_throttle = LoginThrottle(LOGIN_USER_FAILURES)
+
+
+def check_login(ip, username=None):
+    """Seconds before a login (or registration) from `ip` may be tried, 0 if now"""
+    return max(
+        0 if ip in LOGIN_IP_EXEMPT else ip_throttle.retry_after(ip),
+        user_throttle.retry_after(username) if username else 0,
+    )
+
+
+def record_attempt(ip, username=None):
+    """Count a failed login (or a registration) against the IP, unless exempt, and the username"""
+    if ip not in LOGIN_IP_EXEMPT:
+        ip_throttle.record(ip)
+    if username:
+        user_throttle.record(username)
+
+
+def login_throttle_stats():
+    """Keys tracked and attempts refused per IP and per username"""
+    return {"ip": ip_throttle.stats(), "username": user_throttle.stats()}
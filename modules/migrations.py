@@ -0,0 +1,356 @@
+from datetime import datetime
+from modules.connection_pool import get_pool
+
+
+def _initial_schema(cursor):
+    """Create the base tables"""
+    # Create users table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            email TEXT UNIQUE NOT NULL,
+            password_hash TEXT NOT NULL,
+            created_at TEXT NOT NULL
+        )
+    ''')
+
+    # Create categories table (without user_id)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS categories (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT UNIQUE NOT NULL
+        )
+    ''')
+
+    # Create sources table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sources (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            bank BOOLEAN NOT NULL,
+            usd BOOLEAN NOT NULL,
+            value REAL NOT NULL,
+            user_id INTEGER NOT NULL,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    ''')
+
+    # Create transactions table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS transactions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            date TEXT NOT NULL,
+            price_in_dollar REAL NOT NULL,
+            your_currency_rate REAL NOT NULL,
+            category_id INTEGER,
+            source_id INTEGER,
+            is_deposit BOOLEAN NOT NULL DEFAULT FALSE,
+            user_id INTEGER NOT NULL,
+            FOREIGN KEY (category_id) REFERENCES categories (id),
+            FOREIGN KEY (source_id) REFERENCES sources (id),
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    ''')
+
+    # Create loans table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS loans (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            total_amount REAL NOT NULL,
+            monthly_payment REAL NOT NULL,
+            interest_rate REAL DEFAULT 0.0,
+            start_date TEXT NOT NULL,
+            end_date TEXT,
+            remaining_amount REAL NOT NULL,
+            is_usd BOOLEAN NOT NULL DEFAULT TRUE,
+            user_id INTEGER NOT NULL,
+            created_at TEXT NOT NULL,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    ''')
+
+    # Create loan payments table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS loan_payments (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            loan_id INTEGER NOT NULL,
+            amount REAL NOT NULL,
+            payment_date TEXT NOT NULL,
+            source_id INTEGER NOT NULL,
+            is_paid BOOLEAN NOT NULL DEFAULT FALSE,
+            is_usd BOOLEAN NOT NULL DEFAULT TRUE,
+            user_id INTEGER NOT NULL,
+            created_at TEXT NOT NULL,
+            FOREIGN KEY (loan_id) REFERENCES loans (id),
+            FOREIGN KEY (source_id) REFERENCES sources (id),
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    ''')
+
+
+def _add_user_id_columns(cursor):
+    """Add user_id to sources/transactions tables created before multi-user support"""
+    for table in ("sources", "transactions"):
+        cursor.execute(f"PRAGMA table_info({table})")
+        columns = [row[1] for row in cursor.fetchall()]
+        if "user_id" not in columns:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN user_id INTEGER NOT NULL DEFAULT 0 REFERENCES users(id)")
+
+
+def _fix_integer_created_at(cursor):
+    """Convert integer created_at values in loans/loan_payments to ISO strings"""
+    for table in ("loans", "loan_payments"):
+        cursor.execute(f"SELECT id, created_at FROM {table} WHERE typeof(created_at) = 'integer'")
+        for row_id, created_at in cursor.fetchall():
+            if created_at > 1000000000:  # Unix timestamp
+                new_created_at = datetime.fromtimestamp(created_at).isoformat()
+            else:
+                # If it's just a number, use current time
+                new_created_at = datetime.now().isoformat()
+            cursor.execute(
+                f"UPDATE {table} SET created_at = ? WHERE id = ?",
+                (new_created_at, row_id)
+            )
+
+
+def _add_lookup_indexes(cursor):
+    """Index the per-user and per-foreign-key lookups used by Database queries"""
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_transactions_user_date ON transactions (user_id, date DESC)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_transactions_source ON transactions (source_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_transactions_category ON transactions (category_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_transactions_date ON transactions (date)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_sources_user ON sources (user_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_loans_user_created ON loans (user_id, created_at DESC)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_loan_payments_loan_user ON loan_payments (loan_id, user_id, payment_date DESC)")
+
+
+def _add_keyset_index(cursor):
+    """Replace the (user_id, date DESC) index with one matching the keyset order"""
+    # Scanning (user_id, date, id) backwards yields ORDER BY date DESC, id DESC
+    # without a temporary sort, which keyset pagination relies on.
+    cursor.execute("DROP INDEX IF EXISTS idx_transactions_user_date")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_transactions_user_date_id ON transactions (user_id, date, id)")
+
+
+def _add_loan_payments_user_index(cursor):
+    """Index loan payments by owner for per-user listings and exports"""
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_loan_payments_user ON loan_payments (user_id)")
+
+
+def _add_monthly_aggregates(cursor):
+    """Create the per-month totals table and backfill it from existing transactions"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS monthly_aggregates (
+            user_id INTEGER NOT NULL,
+            year INTEGER NOT NULL,
+            month INTEGER NOT NULL,
+            category_id INTEGER NOT NULL,
+            source_id INTEGER NOT NULL,
+            is_deposit INTEGER NOT NULL,
+            transaction_count INTEGER NOT NULL,
+            total_usd REAL NOT NULL,
+            total_toman REAL NOT NULL,
+            PRIMARY KEY (user_id, year, month, category_id, source_id, is_deposit)
+        )
+    ''')
+    # Backfill; a missing category or source is stored as 0 so it still
+    # takes part in the primary key
+    cursor.execute('''
+        INSERT INTO monthly_aggregates
+            (user_id, year, month, category_id, source_id, is_deposit, transaction_count, total_usd, total_toman)
+        SELECT user_id,
+               CAST(substr(date, 1, 4) AS INTEGER),
+               CAST(substr(date, 6, 2) AS INTEGER),
+               COALESCE(category_id, 0),
+               COALESCE(source_id, 0),
+               CASE WHEN is_deposit THEN 1 ELSE 0 END,
+               COUNT(*),
+               SUM(ABS(price_in_dollar)),
+               SUM(ABS(price_in_dollar) * your_currency_rate)
+        FROM transactions
+        GROUP BY 1, 2, 3, 4, 5, 6
+    ''')
+
+
+def _add_balance_ledger(cursor):
+    """Add balance snapshots and adjustments so source balances can be derived from the ledger"""
+    cursor.execute("PRAGMA table_info(transactions)")
+    columns = [row[1] for row in cursor.fetchall()]
+    if "affects_balance" not in columns:
+        cursor.execute("ALTER TABLE transactions ADD COLUMN affects_balance BOOLEAN NOT NULL DEFAULT 1")
+
+    # Balance changes that have no transaction row (e.g. loan payments),
+    # stored in the source's own currency
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS balance_adjustments (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            source_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            date TEXT NOT NULL,
+            amount REAL NOT NULL,
+            note TEXT,
+            created_at TEXT NOT NULL,
+            FOREIGN KEY (source_id) REFERENCES sources (id),
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_balance_adjustments_source_date ON balance_adjustments (source_id, date)")
+
+    # Balance of a source after every ledger entry dated on or before `date`
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS balance_snapshots (
+            source_id INTEGER NOT NULL,
+            date TEXT NOT NULL,
+            balance REAL NOT NULL,
+            PRIMARY KEY (source_id, date),
+            FOREIGN KEY (source_id) REFERENCES sources (id)
+        )
+    ''')
+    cursor.execute("DROP INDEX IF EXISTS idx_transactions_source")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_transactions_source_date ON transactions (source_id, date)")
+
+    # Income rows written without a user_id belong to the source's owner
+    cursor.execute('''
+        UPDATE transactions
+        SET user_id = (SELECT user_id FROM sources WHERE sources.id = transactions.source_id)
+        WHERE user_id = 0 AND source_id IN (SELECT id FROM sources)
+    ''')
+    if cursor.rowcount:
+        cursor.execute("DELETE FROM monthly_aggregates")
+        _add_monthly_aggregates(cursor)
+
+    # Genesis snapshot: the opening balance that makes the ledger add up to
+    # the current stored value
+    cursor.execute('''
+        INSERT OR IGNORE INTO balance_snapshots (source_id, date, balance)
+        SELECT s.id, '0000-00-00', s.value - COALESCE((
+            SELECT SUM(CASE WHEN t.is_deposit THEN 1 ELSE -1 END * ABS(t.price_in_dollar)
+                       * CASE WHEN s.usd THEN 1 ELSE t.your_currency_rate END)
+            FROM transactions t
+            WHERE t.source_id = s.id
+        ), 0)
+        FROM sources s
+    ''')
+
+
+def _add_archive_tables(cursor):
+    """Add the bookkeeping of transaction years moved to yearly archive files"""
+    # One row per closed year whose transactions live in an archive file
+    # (path relative to the database's directory)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS archived_years (
+            year INTEGER PRIMARY KEY,
+            path TEXT NOT NULL,
+            transaction_count INTEGER NOT NULL,
+            archived_at TEXT NOT NULL
+        )
+    ''')
+    # Daily ledger totals of the archived transactions, in the source's own
+    # currency, so balances stay derivable without opening the archives
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS archived_ledger (
+            source_id INTEGER NOT NULL,
+            date TEXT NOT NULL,
+            amount REAL NOT NULL,
+            PRIMARY KEY (source_id, date),
+            FOREIGN KEY (source_id) REFERENCES sources (id)
+        )
+    ''')
+
+
+def _add_refresh_tokens(cursor):
+    """Add refresh tokens (stored as SHA-256 hashes) for long-lived sessions"""
+    # A login starts a family; each refresh revokes the presented token and
+    # adds its successor to the same family
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS refresh_tokens (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            token_hash TEXT NOT NULL UNIQUE,
+            user_id INTEGER NOT NULL,
+            family_id TEXT NOT NULL,
+            expires_at TEXT NOT NULL,
+            created_at TEXT NOT NULL,
+            revoked_at TEXT,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_refresh_tokens_family ON refresh_tokens (family_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_refresh_tokens_user_expires ON refresh_tokens (user_id, expires_at)")
+
+
+def _add_exchange_rates(cursor):
+    """Add the exchange rate time series filled by the rate refresher"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS exchange_rates (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp TEXT NOT NULL,
+            pair TEXT NOT NULL,
+            rate REAL NOT NULL
+        )
+    ''')
+    # Point-in-time lookups and loading a pair's series in time order
+    cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_exchange_rates_pair_time ON exchange_rates (pair, timestamp)")
+
+
+# Ordered list of (version, description, migration function).
+# Append new migrations at the end; never renumber or edit applied ones.
+MIGRATIONS = [
+    (1, "initial schema", _initial_schema),
+    (2, "add user_id to legacy sources/transactions", _add_user_id_columns),
+    (3, "normalize integer created_at in loans", _fix_integer_created_at),
+    (4, "add lookup indexes", _add_lookup_indexes),
+    (5, "add keyset pagination index", _add_keyset_index),
+    (6, "add loan_payments user index", _add_loan_payments_user_index),
+    (7, "add monthly aggregates", _add_monthly_aggregates),
+    (8, "add balance snapshots and adjustments", _add_balance_ledger),
+    (9, "add transaction archive tables", _add_archive_tables),
+    (10, "add refresh tokens", _add_refresh_tokens),
+    (11, "add exchange rate history", _add_exchange_rates),
+]
+
+
+def get_schema_version(cursor):
+    """Get the highest applied migration version (0 for a fresh database)"""
+    cursor.execute("SELECT MAX(version) FROM schema_version")
+    version = cursor.fetchone()[0]
+    return version or 0
+
+
+def run_migrations(db_name="money_tracker.db"):
+    """Apply all pending migrations to a database and return its schema version.
+
+    Migrations run inside a single BEGIN IMMEDIATE transaction, so concurrent
+    workers starting at the same time apply them only once.
+    """
+    with get_pool(db_name).connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                description TEXT NOT NULL,
+                applied_at TEXT NOT NULL
+            )
+        ''')
+        current = get_schema_version(cursor)
+        for version, description, migrate in MIGRATIONS:
+            if version <= current:
+                continue
+            migrate(cursor)
+            cursor.execute(
+                "INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, ?)",
+                (version, description, datetime.now().isoformat())
+            )
+            print(f"Applied migration {version}: {description}")
+            current = version
+        conn.commit()
+        return current
+
+
+if __name__ == "__main__":
+    import sys
+    db_name = sys.argv[1] if len(sys.argv) > 1 else "money_tracker.db"
+    print(f"Schema version: {run_migrations(db_name)}")
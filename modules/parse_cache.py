@@ -0,0 +1,176 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+from datetime import datetime, timedelta
+from modules.cache import TTLCache
+from modules.connection_pool import get_pool
+
+# Parsed transactions are cached by normalized message text plus a hash of
+# the model and the category/source lists the LLM was asked to choose from,
+# in an in-memory LRU backed by a SQLite file shared by all workers.
+# PARSE_CACHE_SIZE=0 turns the cache off; an empty PARSE_CACHE_DB keeps it
+# in memory only.
+PARSE_CACHE_SIZE = int(os.getenv("PARSE_CACHE_SIZE", "2048"))
+PARSE_CACHE_DB = os.getenv("PARSE_CACHE_DB", "parse_cache.db")
+PARSE_CACHE_TTL_DAYS = int(os.getenv("PARSE_CACHE_TTL_DAYS", "90"))
+
+# Messages that date themselves relative to today: their answer is only
+# valid on the day it was given
+_RELATIVE_DATE = re.compile(
+    r"\b(today|tonight|yesterday|tomorrow|ago|last|next|this|previous|"
+    r"monday|tuesday|wednesday|thursday|friday|saturday|sunday)\b"
+    r"|امروز|امشب|دیروز|دیشب|پریروز|فردا|پیش|گذشته|قبل|بعد|آینده|شنبه|جمعه"
+)
+# Messages that state a date ("2024-05-01", "05/01", "1 may", "فروردین"): an
+# answer dated the parse day took that date from the text, so it is kept
+_EXPLICIT_DATE = re.compile(
+    r"\b\d{2,4}[-/.]\d{1,2}[-/.]\d{1,4}\b|\b\d{1,2}/\d{1,2}\b"
+    r"|\b(january|february|march|april|may|june|july|august|september|october|november|december|"
+    r"jan|feb|mar|apr|jun|jul|aug|sep|sept|oct|nov|dec)\b"
+    r"|فروردین|اردیبهشت|خرداد|\bتیر\b|مرداد|شهریور|\bمهر\b|آبان|\bآذر\b|\bدی\b|بهمن|اسفند"
+)
+_DIGITS = str.maketrans("۰۱۲۳۴۵۶۷۸۹٠١٢٣٤٥٦٧٨٩", "01234567890123456789")
+# Stored in place of the date when the LLM dated an undated message today;
+# filled in with the day of each hit
+_TODAY = "{today}"
+
+
+def normalize_text(text):
+    """Message text as compared by the cache: NFKC, ASCII digits, case-folded, single spaces"""
+    text = unicodedata.normalize("NFKC", text).translate(_DIGITS).casefold()
+    return " ".join(text.split())
+
+
+def options_hash(model, categories, sources):
+    """Hash of what besides the text shapes the answer: the model and the lists to choose from"""
+    payload = json.dumps([model, sorted(categories or []), sorted(sources or [])], ensure_ascii=False)
+    return hashlib.sha256(payload.encode()).hexdigest()[:16]
+
+
+def _end_of_day(today):
+    day = datetime.strptime(today, "%Y-%m-%d") + timedelta(days=1)
+    return day.timestamp()
+
+
+class ParseCache:
+    """Two-tier cache of TransactionParser results.
+
+    Entries come in three kinds, by how the answer depends on the date:
+    messages with relative dates ("yesterday", "دیروز") are kept for the
+    day they were parsed only; undated messages the LLM dated today are
+    stored without the date and re-dated to the day of each hit; answers
+    with any other date, or taken from a date stated in the message, are
+    reused as they are.
+    """
+
+    def __init__(self, db_name=PARSE_CACHE_DB, maxsize=PARSE_CACHE_SIZE, ttl_days=PARSE_CACHE_TTL_DAYS):
+        self.db_name = db_name
+        self.ttl = ttl_days * 86400
+        self.memory = TTLCache(maxsize=maxsize, ttl=self.ttl)
+        self.pool = get_pool(db_name) if db_name else None
+        self._lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0}
+        if self.pool is not None:
+            with self.pool.connection() as conn:
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS parse_cache (
+                        key TEXT PRIMARY KEY,
+                        result TEXT NOT NULL,
+                        valid_on TEXT,
+                        expires_at REAL NOT NULL
+                    )
+                """)
+            self.purge_expired()
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    @staticmethod
+    def key(text, options):
+        """Cache key of a message under an options_hash()"""
+        return hashlib.sha256(f"{options}\0{normalize_text(text)}".encode()).hexdigest()
+
+    def get(self, key, today):
+        """Cached result (a dict) for a key on the day `today` (YYYY-MM-DD), or None"""
+        entry = self.memory.get(key)
+        tier = "memory_hits"
+        if entry is None and self.pool is not None:
+            with self.pool.connection() as conn:
+                row = conn.execute(
+                    "SELECT result, valid_on, expires_at FROM parse_cache WHERE key = ? AND expires_at > ?",
+                    (key, time.time())
+                ).fetchone()
+            if row is not None:
+                entry = (json.loads(row[0]), row[1])
+                self.memory.set(key, entry, expires_at=row[2])
+                tier = "disk_hits"
+        if entry is None or (entry[1] is not None and entry[1] != today):
+            self._count("misses")
+            return None
+        self._count(tier)
+        result = dict(entry[0])
+        if result.get("date") == _TODAY:
+            result["date"] = today
+        return result
+
+    def put(self, key, text, result, today):
+        """Cache a result (a dict) parsed on `today` from a message"""
+        result = dict(result)
+        text = normalize_text(text)
+        valid_on = None
+        expires_at = time.time() + self.ttl
+        if _RELATIVE_DATE.search(text):
+            valid_on = today
+            expires_at = min(expires_at, _end_of_day(today))
+        elif result.get("date") == today and not _EXPLICIT_DATE.search(text):
+            result["date"] = _TODAY
+        self.memory.set(key, (result, valid_on), expires_at=expires_at)
+        if self.pool is not None:
+            with self.pool.connection() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO parse_cache (key, result, valid_on, expires_at) VALUES (?, ?, ?, ?)",
+                    (key, json.dumps(result, ensure_ascii=False), valid_on, expires_at)
+                )
+        self._count("stores")
+
+    def purge_expired(self):
+        """Delete expired entries from the SQLite tier; returns how many"""
+        if self.pool is None:
+            return 0
+        with self.pool.connection() as conn:
+            return conn.execute("DELETE FROM parse_cache WHERE expires_at <= ?", (time.time(),)).rowcount
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        hits = stats["memory_hits"] + stats["disk_hits"]
+        lookups = hits + stats["misses"]
+        stats["hit_rate"] = round(hits / lookups, 3) if lookups else 0.0
+        stats["memory"] = self.memory.stats()
+        stats["db"] = self.db_name or None
+        return stats
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_parse_cache():
+    """Get the process-wide parse cache, or None when PARSE_CACHE_SIZE is 0"""
+    global _cache
+    if PARSE_CACHE_SIZE <= 0:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = ParseCache()
+        return _cache
+
+
+def parse_cache_stats():
+    """Hit rates of the parse cache (None when it is off or not yet used)"""
+    return _cache.stats() if _cache is not None else None
@@ -0,0 +1,79 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import HTTPException, status
+from modules.auth import get_password_hash, verify_password
+
+# bcrypt costs 100+ ms of CPU per hash and releases the GIL while it runs, so
+# a small dedicated thread pool keeps it off the event loop and out of the
+# shared threadpool. Work beyond PASSWORD_QUEUE_LIMIT (running + waiting) is
+# rejected with 429 at once instead of queueing for seconds.
+PASSWORD_WORKERS = int(os.getenv("PASSWORD_WORKERS", str(min(4, os.cpu_count() or 1))))
+PASSWORD_QUEUE_LIMIT = int(os.getenv("PASSWORD_QUEUE_LIMIT", str(PASSWORD_WORKERS * 8)))
+
+_executor = None
+_executor_lock = threading.Lock()
+_stats_lock = threading.Lock()
+_stats = {
+    "calls": 0,
+    "pending": 0,
+    "peak_pending": 0,
+    "rejected": 0,
+}
+
+
+def get_password_executor():
+    """Get the password hashing thread pool, creating it on first use"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=PASSWORD_WORKERS, thread_name_prefix="bcrypt")
+        return _executor
+
+
+def shutdown_password_executor():
+    """Wait for running hashes and stop the thread pool"""
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=True)
+            _executor = None
+
+
+def password_pool_stats():
+    """Hashes run, hashes pending and requests rejected by the password hashing pool"""
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["workers"] = PASSWORD_WORKERS
+    stats["queue_limit"] = PASSWORD_QUEUE_LIMIT
+    return stats
+
+
+async def _run(fn, *args):
+    with _stats_lock:
+        if _stats["pending"] >= PASSWORD_QUEUE_LIMIT:
+            _stats["rejected"] += 1
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many logins in progress, try again shortly",
+                headers={"Retry-After": "1"},
+            )
+        _stats["calls"] += 1
+        _stats["pending"] += 1
+        _stats["peak_pending"] = max(_stats["peak_pending"], _stats["pending"])
+    try:
+        return await asyncio.get_running_loop().run_in_executor(get_password_executor(), fn, *args)
+    finally:
+        with _stats_lock:
+            _stats["pending"] -= 1
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """verify_password on the password hashing pool"""
+    return await _run(verify_password, plain_password, hashed_password)
+
+
+async def get_password_hash_async(password: str) -> str:
+    """get_password_hash on the password hashing pool"""
+    return await _run(get_password_hash, password)
@@ -0,0 +1,389 @@
+import re
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+import psycopg
+from psycopg_pool import ConnectionPool as PsycopgPool, PoolTimeout as PsycopgPoolTimeout
+from modules.connection_pool import DEFAULT_POOL_SIZE, DEFAULT_ACQUIRE_TIMEOUT, PoolTimeout, get_pool
+from modules.database import Database, STREAM_CHUNK_SIZE, row_factory
+
+# Tables whose INSERTs report the new row ID (cursor.lastrowid in sqlite3)
+ID_TABLES = {"users", "categories", "sources", "transactions", "loans", "loan_payments", "balance_adjustments"}
+# Advisory lock held while migrating, so concurrent workers migrate once
+MIGRATION_LOCK_KEY = 0x6D6F6E657A  # "money" + 1
+
+_INSERT_TABLE = re.compile(r"^\s*INSERT\s+INTO\s+(\w+)", re.IGNORECASE)
+
+
+def _to_pg(query):
+    """Translate sqlite3 '?' placeholders to psycopg '%s' (escaping literal '%')"""
+    return query.replace("%", "%%").replace("?", "%s")
+
+
+class PostgresCursor:
+    """sqlite3-style cursor over a psycopg cursor.
+
+    Accepts '?' placeholders, honours a sqlite3-style row_factory and sets
+    lastrowid for INSERTs into ID_TABLES, so Database's queries run unchanged.
+    """
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self.row_factory = None
+        self.lastrowid = None
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    def execute(self, query, params=()):
+        match = _INSERT_TABLE.match(query)
+        returns_id = match and match.group(1).lower() in ID_TABLES and "RETURNING" not in query.upper()
+        if returns_id:
+            query = f"{query.rstrip().rstrip(';')} RETURNING id"
+        self._cursor.execute(_to_pg(query), params)
+        if returns_id:
+            row = self._cursor.fetchone()
+            self.lastrowid = row[0] if row else None
+        return self
+
+    def executemany(self, query, params_seq):
+        self._cursor.executemany(_to_pg(query), params_seq)
+        return self
+
+    def _make(self, row):
+        return self.row_factory(self, row) if self.row_factory and row is not None else row
+
+    def fetchone(self):
+        return self._make(self._cursor.fetchone())
+
+    def fetchmany(self, size):
+        return [self._make(row) for row in self._cursor.fetchmany(size)]
+
+    def fetchall(self):
+        return [self._make(row) for row in self._cursor.fetchall()]
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+
+class PostgresConnection:
+    """sqlite3-style view of a pooled psycopg connection"""
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def cursor(self, name=None):
+        return PostgresCursor(self._conn.cursor(name=name) if name else self._conn.cursor())
+
+    def execute(self, query, params=()):
+        return self.cursor().execute(query, params)
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+
+
+class PostgresPool:
+    """psycopg_pool pool with the connection()/close()/stats() interface of ConnectionPool"""
+
+    def __init__(self, conninfo, size=DEFAULT_POOL_SIZE, acquire_timeout=DEFAULT_ACQUIRE_TIMEOUT):
+        self.db_name = conninfo
+        self.size = size
+        self.acquire_timeout = acquire_timeout
+        self._pool = PsycopgPool(conninfo, min_size=1, max_size=size, timeout=acquire_timeout, open=True)
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection; commits on success and rolls back on error"""
+        try:
+            with self._pool.connection() as conn:
+                yield PostgresConnection(conn)
+        except PsycopgPoolTimeout as e:
+            raise PoolTimeout(str(e)) from e
+
+    def close(self):
+        """Close every connection of the pool"""
+        self._pool.close()
+
+    def stats(self):
+        """Return usage and wait-time statistics for this pool"""
+        stats = self._pool.get_stats()
+        acquisitions = stats.get("requests_num", 0)
+        wait_ms = stats.get("requests_wait_ms", 0)
+        opened = stats.get("pool_size", 0)
+        idle = stats.get("pool_available", 0)
+        return {
+            "db_name": psycopg.conninfo.conninfo_to_dict(self.db_name).get("dbname"),
+            "size": self.size,
+            "open": opened,
+            "in_use": opened - idle,
+            "idle": idle,
+            "acquisitions": acquisitions,
+            "timeouts": stats.get("requests_errors", 0),
+            "total_wait_ms": wait_ms,
+            "avg_wait_ms": round(wait_ms / acquisitions, 3) if acquisitions else 0.0,
+        }
+
+
+def _initial_schema(cursor):
+    """Create the tables and indexes (the SQLite schema as of its migration 8)"""
+    # Dates are 'YYYY-MM-DD' text compared byte-wise (COLLATE "C"), as in SQLite
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id SERIAL PRIMARY KEY,
+            username TEXT UNIQUE NOT NULL,
+            email TEXT UNIQUE NOT NULL,
+            password_hash TEXT NOT NULL,
+            created_at TEXT NOT NULL
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS categories (
+            id SERIAL PRIMARY KEY,
+            name TEXT UNIQUE NOT NULL
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sources (
+            id SERIAL PRIMARY KEY,
+            name TEXT NOT NULL,
+            bank BOOLEAN NOT NULL,
+            usd BOOLEAN NOT NULL,
+            value DOUBLE PRECISION NOT NULL,
+            user_id INTEGER NOT NULL REFERENCES users (id)
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS transactions (
+            id BIGSERIAL PRIMARY KEY,
+            name TEXT NOT NULL,
+            date TEXT COLLATE "C" NOT NULL,
+            price_in_dollar DOUBLE PRECISION NOT NULL,
+            your_currency_rate DOUBLE PRECISION NOT NULL,
+            category_id INTEGER REFERENCES categories (id),
+            source_id INTEGER REFERENCES sources (id),
+            is_deposit BOOLEAN NOT NULL DEFAULT FALSE,
+            user_id INTEGER NOT NULL REFERENCES users (id),
+            affects_balance BOOLEAN NOT NULL DEFAULT TRUE
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS loans (
+            id SERIAL PRIMARY KEY,
+            name TEXT NOT NULL,
+            total_amount DOUBLE PRECISION NOT NULL,
+            monthly_payment DOUBLE PRECISION NOT NULL,
+            interest_rate DOUBLE PRECISION DEFAULT 0.0,
+            start_date TEXT NOT NULL,
+            end_date TEXT,
+            remaining_amount DOUBLE PRECISION NOT NULL,
+            is_usd BOOLEAN NOT NULL DEFAULT TRUE,
+            user_id INTEGER NOT NULL REFERENCES users (id),
+            created_at TEXT NOT NULL
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS loan_payments (
+            id SERIAL PRIMARY KEY,
+            loan_id INTEGER NOT NULL REFERENCES loans (id),
+            amount DOUBLE PRECISION NOT NULL,
+            payment_date TEXT NOT NULL,
+            source_id INTEGER NOT NULL REFERENCES sources (id),
+            is_paid BOOLEAN NOT NULL DEFAULT FALSE,
+            is_usd BOOLEAN NOT NULL DEFAULT TRUE,
+            user_id INTEGER NOT NULL REFERENCES users (id),
+            created_at TEXT NOT NULL
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS monthly_aggregates (
+            user_id INTEGER NOT NULL,
+            year INTEGER NOT NULL,
+            month INTEGER NOT NULL,
+            category_id INTEGER NOT NULL,
+            source_id INTEGER NOT NULL,
+            is_deposit INTEGER NOT NULL,
+            transaction_count INTEGER NOT NULL,
+            total_usd DOUBLE PRECISION NOT NULL,
+            total_toman DOUBLE PRECISION NOT NULL,
+            PRIMARY KEY (user_id, year, month, category_id, source_id, is_deposit)
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS balance_adjustments (
+            id SERIAL PRIMARY KEY,
+            source_id INTEGER NOT NULL REFERENCES sources (id),
+            user_id INTEGER NOT NULL REFERENCES users (id),
+            date TEXT COLLATE "C" NOT NULL,
+            amount DOUBLE PRECISION NOT NULL,
+            note TEXT,
+            created_at TEXT NOT NULL
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS balance_snapshots (
+            source_id INTEGER NOT NULL REFERENCES sources (id),
+            date TEXT COLLATE "C" NOT NULL,
+            balance DOUBLE PRECISION NOT NULL,
+            PRIMARY KEY (source_id, date)
+        )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_transactions_user_date_id ON transactions (user_id, date, id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_transactions_source_date ON transactions (source_id, date)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_transactions_category ON transactions (category_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_transactions_date ON transactions (date)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_sources_user ON sources (user_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_loans_user_created ON loans (user_id, created_at DESC)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_loan_payments_loan_user ON loan_payments (loan_id, user_id, payment_date DESC)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_loan_payments_user ON loan_payments (user_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_balance_adjustments_source_date ON balance_adjustments (source_id, date)")
+
+
+def _add_archived_ledger(cursor):
+    """Add the (always empty) archived ledger read by the shared balance queries.
+
+    Yearly archive files are a SQLite feature; PostgreSQL keeps every
+    transaction in its table.
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS archived_ledger (
+            source_id INTEGER NOT NULL REFERENCES sources (id),
+            date TEXT COLLATE "C" NOT NULL,
+            amount DOUBLE PRECISION NOT NULL,
+            PRIMARY KEY (source_id, date)
+        )
+    ''')
+
+
+def _add_refresh_tokens(cursor):
+    """Add refresh tokens (stored as SHA-256 hashes) for long-lived sessions"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS refresh_tokens (
+            id SERIAL PRIMARY KEY,
+            token_hash TEXT NOT NULL UNIQUE,
+            user_id INTEGER NOT NULL REFERENCES users (id),
+            family_id TEXT NOT NULL,
+            expires_at TEXT COLLATE "C" NOT NULL,
+            created_at TEXT NOT NULL,
+            revoked_at TEXT
+        )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_refresh_tokens_family ON refresh_tokens (family_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_refresh_tokens_user_expires ON refresh_tokens (user_id, expires_at)")
+
+
+def _add_exchange_rates(cursor):
+    """Add the exchange rate time series filled by the rate refresher"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS exchange_rates (
+            id SERIAL PRIMARY KEY,
+            timestamp TEXT COLLATE "C" NOT NULL,
+            pair TEXT NOT NULL,
+            rate DOUBLE PRECISION NOT NULL
+        )
+    ''')
+    cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_exchange_rates_pair_time ON exchange_rates (pair, timestamp)")
+
+
+# Ordered list of (version, description, migration function), kept separately
+# from the SQLite migrations. Append new migrations at the end.
+MIGRATIONS = [
+    (1, "initial schema", _initial_schema),
+    (2, "add archived ledger", _add_archived_ledger),
+    (3, "add refresh tokens", _add_refresh_tokens),
+    (4, "add exchange rate history", _add_exchange_rates),
+]
+
+
+def run_migrations(pool):
+    """Apply all pending migrations through a PostgresPool and return the schema version.
+
+    An advisory lock makes concurrent workers apply them only once.
+    """
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT pg_advisory_xact_lock(?)", (MIGRATION_LOCK_KEY,))
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                description TEXT NOT NULL,
+                applied_at TEXT NOT NULL
+            )
+        ''')
+        cursor.execute("SELECT MAX(version) FROM schema_version")
+        current = cursor.fetchone()[0] or 0
+        for version, description, migrate in MIGRATIONS:
+            if version <= current:
+                continue
+            migrate(cursor)
+            cursor.execute(
+                "INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, ?)",
+                (version, description, datetime.now().isoformat())
+            )
+            print(f"Applied PostgreSQL migration {version}: {description}")
+            current = version
+        conn.commit()
+        return current
+
+
+class PostgresDatabase(Database):
+    """PostgreSQL storage backend.
+
+    Runs Database's queries through a pooled psycopg connection wrapped to
+    look like sqlite3 (see PostgresCursor), so both backends share one
+    implementation of every method.
+    """
+
+    IntegrityError = psycopg.IntegrityError
+    FOR_UPDATE = " FOR UPDATE"
+
+    def __init__(self, conninfo, write_queue=None):
+        self.db_name = conninfo
+        self.pool = get_pool(conninfo, factory=PostgresPool)
+        self._init_write_queue(write_queue)
+
+    def _begin_write(self, cursor):
+        """Start a write transaction without a database-wide lock.
+
+        psycopg opens the transaction with the first statement. Writers
+        only wait for each other on the rows they share: balances move by
+        atomic UPDATE ... SET value = value + ?, aggregates by upserts, and
+        blocks that read rows before changing them lock those rows
+        (FOR_UPDATE, _lock_sources, _lock_aggregates). Multi-row blocks
+        take their row locks in key order (sources by ID, aggregates by
+        group), so two writers never wait for each other in a cycle.
+        """
+
+    def _lock_sources(self, cursor, source_ids):
+        """Lock sources' rows, which every balance change also updates, in ID order"""
+        for source_id in sorted(source_ids):
+            cursor.execute("SELECT id FROM sources WHERE id = ? FOR UPDATE", (source_id,))
+
+    def _lock_aggregates(self, cursor):
+        """Block incremental aggregate upserts while monthly_aggregates is rebuilt"""
+        cursor.execute("LOCK TABLE monthly_aggregates IN EXCLUSIVE MODE")
+
+    def _transactions_source(self, conn, start_date=None, end_date=None):
+        """Every transaction is in the transactions table (no yearly archives)"""
+        return nullcontext("transactions")
+
+    def create_tables(self):
+        """Bring the schema up to date (the app does this once at startup)"""
+        return run_migrations(self.pool)
+
+    def _iter_rows(self, query, params, chunk_size, row_type=None, dates=None):
+        """Yield the rows of a query through a server-side cursor, chunk_size rows at a time"""
+        if dates is not None:
+            query = query.format(transactions="transactions")
+        with self.get_connection() as conn:
+            cursor = conn.cursor(name="stream")
+            if row_type is not None:
+                cursor.row_factory = row_factory(row_type)
+            cursor.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(chunk_size or STREAM_CHUNK_SIZE)
+                if not rows:
+                    break
+                yield from rows
@@ -0,0 +1,141 @@
+import bisect
+import threading
+import time
+from datetime import date, datetime
+import numpy as np
+from modules.database import USD_TOMAN
+from modules.repository import open_database
+
+# Rows written by other workers are picked up at most this often
+SYNC_SECONDS = 60
+END_OF_DAY = np.timedelta64(86399, "s")
+
+
+def _timestamp(when):
+    """ISO timestamp for a point in time; a bare date means the end of that day"""
+    if isinstance(when, datetime):
+        return when.isoformat(timespec="seconds")
+    if isinstance(when, date):
+        when = when.isoformat()
+    when = when.replace(" ", "T")
+    return when + "T23:59:59" if len(when) == 10 else when
+
+
+def _datetime(text):
+    """One point in time as a datetime64[s]; NaT if it is not an ISO date or datetime"""
+    try:
+        value = np.datetime64(text, "s")
+    except ValueError:
+        return np.datetime64("NaT", "s")
+    return value + END_OF_DAY if len(text) == 10 else value
+
+
+def _datetimes(whens):
+    """Points in time as a datetime64[s] array; bare dates mean the end of their day.
+
+    Transaction dates are free text, so values that are not ISO dates (e.g.
+    "2024-02-30", "2024/05/01") become NaT instead of failing the whole array.
+    """
+    raw = np.asarray(whens)
+    if raw.dtype.kind == "M":
+        values = raw.astype("datetime64[s]")
+        return values + END_OF_DAY if raw.dtype == np.dtype("datetime64[D]") else values
+    text = raw.astype(str)
+    try:
+        values = text.astype("datetime64[s]")
+    except ValueError:
+        # Some value is malformed: parse one by one
+        return np.array([_datetime(value) for value in text.ravel()], dtype="datetime64[s]").reshape(text.shape)
+    values[np.char.str_len(text) == 10] += END_OF_DAY
+    return values
+
+
+class RateHistory:
+    """Point-in-time exchange rates from the exchange_rates table.
+
+    The series of one pair is kept in memory as two parallel arrays sorted
+    by time, loaded once and then topped up with newer rows, so a lookup is
+    a bisect rather than a query. The rate at a time is the last one
+    recorded at or before it; times before the first record get the first
+    rate. Lookups return None (or NaN) while the history is empty.
+    """
+
+    def __init__(self, db=None, pair=USD_TOMAN):
+        self.db = db or open_database()
+        self.pair = pair
+        self._timestamps = []
+        self._rates = []
+        self._arrays = None
+        self._synced_at = None
+        self._lock = threading.Lock()
+
+    def record(self, rate, when=None):
+        """Store a rate (default: now) in the table and in memory"""
+        timestamp = _timestamp(when or datetime.now())
+        self.db.add_exchange_rate(timestamp, rate, self.pair)
+        self._sync(force=True)
+        return timestamp
+
+    def _sync(self, force=False):
+        """Load rows newer than the last one in memory, at most every SYNC_SECONDS unless forced"""
+        with self._lock:
+            if not force and self._synced_at is not None and time.monotonic() - self._synced_at < SYNC_SECONDS:
+                return
+            since = self._timestamps[-1] if self._timestamps else None
+            rows = self.db.get_exchange_rates(self.pair, since)
+            for row in rows:
+                self._timestamps.append(row.timestamp)
+                self._rates.append(row.rate)
+            if rows or self._arrays is None:
+                self._arrays = (np.array(self._timestamps, dtype="datetime64[s]"), np.array(self._rates, dtype=float))
+            self._synced_at = time.monotonic()
+
+    def rate_at(self, when):
+        """Rate in effect at a datetime, date or ISO string (a date means its end), or None"""
+        self._sync()
+        with self._lock:
+            if not self._timestamps:
+                return None
+            index = bisect.bisect_right(self._timestamps, _timestamp(when)) - 1
+            return self._rates[max(index, 0)]
+
+    def rates_at(self, whens):
+        """Rates in effect at each of many points in time, as a float array (NaN without history or a valid date)"""
+        self._sync()
+        with self._lock:
+            timestamps, rates = self._arrays
+        points = _datetimes(whens)
+        if not len(rates):
+            return np.full(points.shape, np.nan)
+        index = np.searchsorted(timestamps, points, side="right") - 1
+        return np.where(np.isnat(points), np.nan, rates[np.maximum(index, 0)])
+
+    def to_toman(self, amounts_usd, whens):
+        """Convert a column of dollar amounts to Toman, each at the rate of its own date"""
+        return np.asarray(amounts_usd, dtype=float) * self.rates_at(whens)
+
+    def to_usd(self, amounts_toman, whens):
+        """Convert a column of Toman amounts to dollars, each at the rate of its own date"""
+        return np.asarray(amounts_toman, dtype=float) / self.rates_at(whens)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "pair": self.pair,
+                "points": len(self._timestamps),
+                "first": self._timestamps[0] if self._timestamps else None,
+                "last": self._timestamps[-1] if self._timestamps else None,
+            }
+
+
+_history = None
+_history_lock = threading.Lock()
+
+
+def get_rate_history():
+    """Get the process-wide USD/Toman rate history of the configured database"""
+    global _history
+    with _history_lock:
+        if _history is None:
+            _history = RateHistory()
+        return _history
@@ -0,0 +1,207 @@
+import asyncio
+import os
+import random
+import time
+from datetime import datetime
+import httpx
+from modules.async_database import run_in_db_executor
+from modules.currency_exchange import EXCHANGE_RATE_TIMEOUT_SECONDS, get_currency_exchange
+from modules.rate_history import get_rate_history
+
+# The exchange rate is scraped on a schedule by an asyncio task, so request
+# handlers only ever read the rate in memory. Each refresh makes up to
+# EXCHANGE_RATE_RETRIES attempts with jittered exponential backoff; after
+# EXCHANGE_RATE_BREAKER_THRESHOLD failed refreshes in a row the circuit
+# breaker stops scraping for EXCHANGE_RATE_BREAKER_COOLDOWN_SECONDS.
+EXCHANGE_RATE_REFRESH_MINUTES = float(os.getenv("EXCHANGE_RATE_REFRESH_MINUTES", "30"))
+EXCHANGE_RATE_RETRIES = int(os.getenv("EXCHANGE_RATE_RETRIES", "3"))
+EXCHANGE_RATE_BREAKER_THRESHOLD = int(os.getenv("EXCHANGE_RATE_BREAKER_THRESHOLD", "3"))
+EXCHANGE_RATE_BREAKER_COOLDOWN_SECONDS = float(os.getenv("EXCHANGE_RATE_BREAKER_COOLDOWN_SECONDS", "300"))
+# After a failed refresh, and at most this often on request, try again
+FAILURE_RETRY_SECONDS = 60
+RETRY_BACKOFF_SECONDS = 1.0
+
+
+class CircuitBreaker:
+    """Closed, open or half-open breaker around a flaky dependency.
+
+    Opens after `threshold` consecutive failures; once `cooldown` seconds
+    have passed one trial call is allowed (half-open), which closes the
+    breaker on success and reopens it on failure.
+    """
+
+    def __init__(self, threshold, cooldown):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = None
+        self.opens = 0
+
+    def allow(self):
+        """Whether a call may be made now"""
+        if self.state == "open" and time.monotonic() - self.opened_at >= self.cooldown:
+            self.state = "half-open"
+        return self.state != "open"
+
+    def retry_in(self):
+        """Seconds until the breaker lets a trial call through"""
+        if self.state != "open":
+            return 0.0
+        return max(0.0, self.opened_at + self.cooldown - time.monotonic())
+
+    def record_success(self):
+        self.state = "closed"
+        self.failures = 0
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == "half-open" or self.failures >= self.threshold:
+            self.state = "open"
+            self.opened_at = time.monotonic()
+            self.opens += 1
+
+    def stats(self):
+        return {"state": self.state, "consecutive_failures": self.failures, "opens": self.opens}
+
+
+class RateRefresher:
+    """Asyncio task that keeps a CurrencyExchange's rate fresh.
+
+    While running it is attached to the exchange, whose callers then never
+    scrape; they may only ask for an early refresh. Every rate fetched is
+    also recorded in `history` (a RateHistory), if given.
+    """
+
+    def __init__(self, exchange, history=None, interval_minutes=EXCHANGE_RATE_REFRESH_MINUTES,
+                 retries=EXCHANGE_RATE_RETRIES, timeout=EXCHANGE_RATE_TIMEOUT_SECONDS, breaker=None,
+                 failure_retry=FAILURE_RETRY_SECONDS, backoff=RETRY_BACKOFF_SECONDS):
+        self.exchange = exchange
+        self.history = history
+        self.interval = interval_minutes * 60
+        self.retries = retries
+        self.timeout = timeout
+        self.breaker = breaker or CircuitBreaker(EXCHANGE_RATE_BREAKER_THRESHOLD, EXCHANGE_RATE_BREAKER_COOLDOWN_SECONDS)
+        self.failure_retry = failure_retry
+        self.backoff = backoff
+        self.last_attempt = None
+        self.last_success = None
+        self.last_error = None
+        self._loop = None
+        self._task = None
+        self._wake = None
+        self._client = None
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        self._client = httpx.AsyncClient(headers=self.exchange.headers, timeout=self.timeout, follow_redirects=True)
+        self._task = asyncio.create_task(self._run(), name="exchange-rate-refresher")
+        self.exchange.refresher = self
+
+    async def stop(self):
+        """Detach from the exchange and cancel the task, including a refresh in progress"""
+        self.exchange.refresher = None
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        await self._client.aclose()
+
+    def request_refresh(self):
+        """Ask for an early refresh; callable from any thread, never waits.
+
+        Ignored while the breaker is open or within FAILURE_RETRY_SECONDS of
+        the last attempt.
+        """
+        if self.breaker.state == "open":
+            return
+        if self.last_attempt is not None and time.monotonic() - self.last_attempt < self.failure_retry:
+            return
+        try:
+            self._loop.call_soon_threadsafe(self._wake.set)
+        except RuntimeError:
+            pass  # Loop already closed on shutdown
+
+    async def refresh_once(self):
+        """Scrape the rate with retries and store it; returns whether it worked"""
+        self.last_attempt = time.monotonic()
+        started = time.perf_counter()
+        for attempt in range(self.retries):
+            try:
+                response = await self._client.get(self.exchange.url)
+                response.raise_for_status()
+                rate = self.exchange.parse_rate(response.text)
+                break
+            except (httpx.HTTPError, ValueError) as e:
+                self.last_error = f"{type(e).__name__}: {e}"
+                if attempt + 1 < self.retries:
+                    await asyncio.sleep(self.backoff * 2 ** attempt * random.uniform(0.5, 1.5))
+        else:
+            self.exchange.record_refresh((time.perf_counter() - started) * 1000, False)
+            self.breaker.record_failure()
+            print(f"Error refreshing exchange rate: {self.last_error}")
+            return False
+        self.exchange.record_refresh((time.perf_counter() - started) * 1000, True)
+        self.exchange.set_rate(rate)
+        if self.history is not None:
+            try:
+                await run_in_db_executor(self.history.record, rate)
+            except Exception as e:
+                print(f"Error recording exchange rate history: {e}")
+        self.breaker.record_success()
+        self.last_success = datetime.now().isoformat(timespec="seconds")
+        self.last_error = None
+        return True
+
+    async def _run(self):
+        while True:
+            if self.breaker.allow():
+                ok = await self.refresh_once()
+                delay = self.interval if ok else min(self.interval, self.failure_retry)
+            else:
+                delay = self.breaker.retry_in()
+            # Jitter keeps several workers from scraping in lockstep
+            delay *= random.uniform(0.9, 1.1)
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+
+    def stats(self):
+        return {
+            "interval_minutes": self.interval / 60,
+            "url": self.exchange.url,
+            "last_success": self.last_success,
+            "last_error": self.last_error,
+            "breaker": self.breaker.stats(),
+            "history": self.history.stats() if self.history is not None else None,
+        }
+
+
+_refresher = None
+
+
+async def start_rate_refresher(exchange=None):
+    """Start refreshing the exchange rate in the background unless EXCHANGE_RATE_REFRESH_MINUTES is 0"""
+    global _refresher
+    if EXCHANGE_RATE_REFRESH_MINUTES <= 0 or _refresher is not None:
+        return None
+    _refresher = RateRefresher(exchange or get_currency_exchange(), get_rate_history())
+    await _refresher.start()
+    return _refresher
+
+
+def rate_refresher_stats():
+    """Schedule, last result and breaker state of the rate refresher (None when it is not running)"""
+    return _refresher.stats() if _refresher is not None else None
+
+
+async def stop_rate_refresher():
+    """Stop the background rate refresher (used on application shutdown)"""
+    global _refresher
+    if _refresher is not None:
+        await _refresher.stop()
+        _refresher = None
@@ -0,0 +1,257 @@
+import os
+from abc import ABC, abstractmethod
+
+# Storage backend selection: a postgresql:// URL selects PostgreSQL; anything
+# else (or nothing) is the path of the SQLite database file.
+DATABASE_URL_ENV = "DATABASE_URL"
+# SQLite sharding: a shard count, or "per-user" for one file per user
+DB_SHARDS_ENV = "DB_SHARDS"
+DB_SHARD_DIR_ENV = "DB_SHARD_DIR"
+
+
+class Repository(ABC):
+    """Data-access interface shared by the storage backends.
+
+    Rows are returned as the NamedTuple types in modules.database, whatever
+    the backend. Write methods are atomic; add_* methods return the new row
+    ID, or None when a constraint rejects the row.
+    """
+
+    # Schema
+    @abstractmethod
+    def create_tables(self):
+        """Apply pending schema migrations"""
+
+    @abstractmethod
+    def pool_stats(self):
+        """Connection pool statistics"""
+
+    # Users
+    @abstractmethod
+    def add_user(self, username, email, password_hash):
+        """Add a user"""
+
+    @abstractmethod
+    def get_user_by_username(self, username):
+        """Get a user by username"""
+
+    @abstractmethod
+    def get_user_by_email(self, email):
+        """Get a user by email"""
+
+    @abstractmethod
+    def get_user_by_id(self, user_id):
+        """Get a user by ID"""
+
+    @abstractmethod
+    def add_refresh_token(self, user_id, token_hash, family_id, expires_at):
+        """Store a refresh token (by hash)"""
+
+    @abstractmethod
+    def rotate_refresh_token(self, token_hash, new_token_hash, expires_at):
+        """Exchange a live refresh token for a new one; returns the user ID or None"""
+
+    @abstractmethod
+    def revoke_refresh_token(self, token_hash):
+        """Revoke the session of a refresh token"""
+
+    # Exchange rate history
+    @abstractmethod
+    def add_exchange_rate(self, timestamp, rate, pair="USD/TOMAN"):
+        """Record a rate in the exchange rate history"""
+
+    @abstractmethod
+    def get_exchange_rates(self, pair="USD/TOMAN", since=None):
+        """Get a pair's rate history in time order"""
+
+    # Categories
+    @abstractmethod
+    def add_category(self, name, user_id=None):
+        """Add a (global) category"""
+
+    @abstractmethod
+    def get_all_categories(self):
+        """Get all categories"""
+
+    @abstractmethod
+    def get_category_by_id(self, category_id):
+        """Get a category by ID"""
+
+    # Sources
+    @abstractmethod
+    def add_source(self, name, bank, usd, value=0.0, user_id=None):
+        """Add a source with its opening balance"""
+
+    @abstractmethod
+    def get_all_sources(self, user_id):
+        """Get all sources of a user"""
+
+    @abstractmethod
+    def get_sources(self, user_id):
+        """Get all sources of a user"""
+
+    @abstractmethod
+    def get_source_by_id(self, source_id):
+        """Get a source by ID"""
+
+    @abstractmethod
+    def update_source_balance(self, source_id, amount_in_dollar, your_currency_rate, is_deposit, date=None, note=None):
+        """Move a source balance without a transaction row"""
+
+    @abstractmethod
+    def update_source_income(self, source_id, amount_in_dollar, your_currency_rate):
+        """Add income to a source balance"""
+
+    @abstractmethod
+    def balance_as_of(self, source_id, date=None):
+        """Get a source's balance at the end of a date, or now"""
+
+    @abstractmethod
+    def snapshot_balance(self, source_id, date=None):
+        """Record a balance snapshot for a source"""
+
+    @abstractmethod
+    def snapshot_all_balances(self, date=None):
+        """Record a balance snapshot for every source"""
+
+    @abstractmethod
+    def get_balance_history(self, source_id, dates):
+        """Get a source's balance at each of the given dates"""
+
+    @abstractmethod
+    def reconcile_source_balance(self, source_id):
+        """Reset a source's stored balance to the ledger-derived one"""
+
+    # Transactions
+    @abstractmethod
+    def add_transaction(self, name, date, price_in_dollar, your_currency_rate, category_id, source_id, user_id, is_deposit=False, update_balance=True):
+        """Add a transaction and apply it to its source balance"""
+
+    @abstractmethod
+    def bulk_add_transactions(self, user_id, transactions):
+        """Add many transactions in one write"""
+
+    @abstractmethod
+    def add_income(self, name, date, amount, is_usd, your_currency_rate, category_id, source_id):
+        """Add an income transaction for the source's owner"""
+
+    @abstractmethod
+    def get_all_transactions(self, user_id, month=None):
+        """Get a user's transactions, newest first"""
+
+    @abstractmethod
+    def get_transactions_page(self, user_id, limit, before_date=None, before_id=None, month=None):
+        """Get one keyset-paginated page of a user's transactions"""
+
+    @abstractmethod
+    def get_transactions_by_month(self, user_id, month, year):
+        """Get a month of transactions with category and source names"""
+
+    @abstractmethod
+    def iter_transactions(self, user_id, month=None, chunk_size=None):
+        """Stream a user's transactions"""
+
+    @abstractmethod
+    def iter_transactions_by_month(self, user_id, month, year, chunk_size=None):
+        """Stream a month of transactions with category and source names"""
+
+    @abstractmethod
+    def iter_export_rows(self, dataset, user_id, chunk_size=None):
+        """Stream one export dataset of a user"""
+
+    @abstractmethod
+    def get_transactions_by_source(self, source_id):
+        """Get all transactions of a source"""
+
+    @abstractmethod
+    def get_transactions_by_category(self, category_id):
+        """Get all transactions of a category"""
+
+    @abstractmethod
+    def get_transactions_by_date_range(self, start_date, end_date):
+        """Get all transactions within a date range"""
+
+    @abstractmethod
+    def get_transaction_by_id(self, transaction_id):
+        """Get a transaction by ID"""
+
+    @abstractmethod
+    def update_transaction(self, transaction_id, name, date, price, is_usd, category_id, source_id, your_currency_rate, is_deposit):
+        """Update a transaction and its effect on source balances"""
+
+    @abstractmethod
+    def delete_transaction(self, transaction_id, user_id):
+        """Delete a transaction and revert its effect on the source balance"""
+
+    @abstractmethod
+    def get_monthly_aggregates(self, user_id, month, year):
+        """Get a month's pre-aggregated totals"""
+
+    @abstractmethod
+    def rebuild_monthly_aggregates(self, user_id=None):
+        """Recompute the monthly aggregates from the transactions"""
+
+    # Loans and payments
+    @abstractmethod
+    def add_loan(self, name, total_amount, monthly_payment, is_usd, user_id):
+        """Add a loan"""
+
+    @abstractmethod
+    def get_all_loans(self, user_id):
+        """Get all loans of a user"""
+
+    @abstractmethod
+    def get_loan_by_id(self, loan_id, user_id):
+        """Get a loan of a user by ID"""
+
+    @abstractmethod
+    def update_loan_remaining_amount(self, loan_id, new_remaining_amount):
+        """Set a loan's remaining amount"""
+
+    @abstractmethod
+    def delete_loan(self, loan_id, user_id):
+        """Delete a loan and its payments"""
+
+    @abstractmethod
+    def get_loan_summary(self, user_id):
+        """Get loan totals of a user"""
+
+    @abstractmethod
+    def add_loan_payment(self, loan_id, amount, payment_date, source_id, user_id, is_paid=False, is_usd=True):
+        """Add a loan payment"""
+
+    @abstractmethod
+    def get_loan_payments(self, loan_id, user_id):
+        """Get all payments of a loan"""
+
+    @abstractmethod
+    def mark_payment_paid(self, payment_id, user_id):
+        """Mark a payment as paid and reduce the loan's remaining amount"""
+
+
+def is_postgres_url(url):
+    """Whether a database URL points at PostgreSQL"""
+    return bool(url) and url.startswith(("postgres://", "postgresql://"))
+
+
+def open_database(url=None):
+    """Open the configured storage backend.
+
+    Uses `url`, else the DATABASE_URL environment variable: a postgresql://
+    URL opens PostgresDatabase, anything else is a SQLite file path, with or
+    without a sqlite:/// prefix (default money_tracker.db). With DB_SHARDS
+    set, that SQLite file is the catalog of a ShardedDatabase whose shards
+    live in DB_SHARD_DIR (default: next to the catalog).
+    """
+    url = url or os.getenv(DATABASE_URL_ENV)
+    if is_postgres_url(url):
+        from modules.postgres_database import PostgresDatabase
+        return PostgresDatabase(url)
+    from modules.database import Database, DEFAULT_DB_NAME
+    if url and url.startswith("sqlite:///"):
+        url = url[len("sqlite:///"):]
+    shards = os.getenv(DB_SHARDS_ENV)
+    if shards:
+        from modules.sharding import ShardedDatabase
+        return ShardedDatabase(url or DEFAULT_DB_NAME, shards, os.getenv(DB_SHARD_DIR_ENV))
+    return Database(url or DEFAULT_DB_NAME)
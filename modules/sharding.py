@@ -0,0 +1,420 @@
+import os
+import re
+import sqlite3
+import threading
+from functools import partial
+from modules.connection_pool import ConnectionPool, get_pool
+from modules.database import Database, DEFAULT_DB_NAME, LOAN_COLUMNS, SOURCE_COLUMNS, STREAM_CHUNK_SIZE, TRANSACTION_COLUMNS, USD_TOMAN
+from modules.migrations import run_migrations
+from modules.repository import Repository
+
+# Row IDs of the per-user tables carry their shard: shard k allocates IDs
+# from k * SHARD_ID_SPAN + 1, so an ID alone is enough to find its shard.
+# IDs stay below 2**53 (safe in JavaScript) while k < 2**21.
+SHARD_ID_SPAN = 1 << 32
+SHARDED_ID_TABLES = ("sources", "transactions", "loans", "loan_payments", "balance_adjustments")
+# Global tables kept only in the catalog; shards read them through the
+# read-only attached "catalog" schema
+CATALOG_TABLES = ("users", "categories", "refresh_tokens", "exchange_rates")
+PER_USER = "per-user"
+
+_USER_FILE = re.compile(r"^user_(\d+)\.db$")
+
+# Shards (by file path) and catalogs migrated by this process, shared by
+# every ShardedDatabase instance so the setup runs once per file
+_shards = {}
+_ready_catalogs = set()
+_shards_lock = threading.Lock()
+
+
+def default_shard_dir(catalog_name):
+    """Shard directory next to the catalog file: money_tracker.db -> money_tracker_shards/"""
+    root, _ = os.path.splitext(catalog_name)
+    return f"{root}_shards"
+
+
+class ShardDatabase(Database):
+    """One shard file: the per-user tables of the users routed to it"""
+
+    def __init__(self, db_name, shard_key, catalog_name, write_queue=None):
+        self.db_name = db_name
+        self.shard_key = shard_key
+        self.pool = get_pool(db_name, factory=partial(ConnectionPool, attach_readonly={"catalog": catalog_name}))
+        self._init_write_queue(write_queue)
+
+    def create_tables(self):
+        """Migrate the shard, drop its copies of the catalog tables and start its ID range"""
+        version = run_migrations(self.db_name)
+        base = self.shard_key * SHARD_ID_SPAN
+        with self.write_transaction() as cursor:
+            for table in CATALOG_TABLES:
+                cursor.execute(f"DROP TABLE IF EXISTS main.{table}")
+            for table in SHARDED_ID_TABLES:
+                cursor.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = ?", (base, table))
+                if not cursor.rowcount:
+                    cursor.execute("INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)", (table, base))
+        return version
+
+
+class ShardedDatabase(Repository):
+    """SQLite backend that spreads users over shard files.
+
+    A catalog file holds the global tables (users, categories, refresh
+    tokens, exchange rates); every other table lives in a shard. With
+    `shards=N` user u goes to shard u % N; with `shards="per-user"` every
+    user gets a file of their own. Writes to
+    different shards take different write locks, so tenants no longer
+    queue behind each other.
+    """
+
+    def __init__(self, catalog_name=DEFAULT_DB_NAME, shards=8, shard_dir=None, write_queue=None):
+        self.db_name = catalog_name
+        self.catalog = Database(catalog_name, write_queue=False)
+        self.per_user = shards == PER_USER
+        self.shard_count = None if self.per_user else int(shards)
+        if self.shard_count is not None and self.shard_count < 1:
+            raise ValueError("shards must be a positive number or 'per-user'")
+        self.shard_dir = shard_dir or default_shard_dir(catalog_name)
+        self.write_queue = write_queue
+
+    # Routing
+    def shard_key_for_user(self, user_id):
+        """Shard of a user"""
+        return user_id if self.per_user else user_id % self.shard_count
+
+    def shard_path(self, key):
+        """File of a shard"""
+        name = f"user_{key}.db" if self.per_user else f"shard_{key:03d}.db"
+        return os.path.join(self.shard_dir, name)
+
+    def shard_keys(self):
+        """Keys of every shard (per-user: every user file created so far)"""
+        if not self.per_user:
+            return list(range(self.shard_count))
+        if not os.path.isdir(self.shard_dir):
+            return []
+        return sorted(int(m.group(1)) for m in map(_USER_FILE.match, os.listdir(self.shard_dir)) if m)
+
+    def shard(self, key, create=True):
+        """Get the Database of a shard, creating and migrating its file on first use.
+
+        With create=False, returns None for a shard file that does not exist.
+        """
+        path = self.shard_path(key)
+        db = _shards.get(path)
+        if db is not None:
+            return db
+        with _shards_lock:
+            db = _shards.get(path)
+            if db is None:
+                if not create and (key < 0 or not os.path.exists(path)):
+                    return None
+                if self.catalog.db_name not in _ready_catalogs:
+                    # Shards attach the catalog, so it must exist first
+                    self.catalog.create_tables()
+                    _ready_catalogs.add(self.catalog.db_name)
+                os.makedirs(self.shard_dir, exist_ok=True)
+                db = ShardDatabase(path, key, self.catalog.db_name, self.write_queue)
+                db.create_tables()
+                _shards[path] = db
+        return db
+
+    def _user(self, user_id):
+        return self.shard(self.shard_key_for_user(user_id))
+
+    def _owner(self, row_id):
+        """Shard holding a row of a sharded table, by its ID (None if there is none)"""
+        if row_id is None:
+            return None
+        return self.shard(row_id // SHARD_ID_SPAN, create=False)
+
+    def _all(self):
+        return [self.shard(key) for key in self.shard_keys()]
+
+    # Schema
+    def create_tables(self):
+        """Migrate the catalog and every shard"""
+        version = self.catalog.create_tables()
+        _ready_catalogs.add(self.catalog.db_name)
+        for shard in self._all():
+            shard.create_tables()
+        return version
+
+    def pool_stats(self):
+        """Connection pool statistics of the catalog and every open shard"""
+        shard_dir = os.path.abspath(self.shard_dir)
+        opened = [db for path, db in list(_shards.items()) if os.path.dirname(os.path.abspath(path)) == shard_dir]
+        return [self.catalog.pool_stats()] + [shard.pool_stats() for shard in opened]
+
+    def get_exchange_rate(self):
+        """Get the current USD to Toman exchange rate"""
+        return self.catalog.get_exchange_rate()
+
+    # Users, refresh tokens, exchange rates and categories (catalog)
+    def add_user(self, username, email, password_hash):
+        return self.catalog.add_user(username, email, password_hash)
+
+    def get_user_by_username(self, username):
+        return self.catalog.get_user_by_username(username)
+
+    def get_user_by_email(self, email):
+        return self.catalog.get_user_by_email(email)
+
+    def get_user_by_id(self, user_id):
+        return self.catalog.get_user_by_id(user_id)
+
+    def add_refresh_token(self, user_id, token_hash, family_id, expires_at):
+        return self.catalog.add_refresh_token(user_id, token_hash, family_id, expires_at)
+
+    def rotate_refresh_token(self, token_hash, new_token_hash, expires_at):
+        return self.catalog.rotate_refresh_token(token_hash, new_token_hash, expires_at)
+
+    def revoke_refresh_token(self, token_hash):
+        return self.catalog.revoke_refresh_token(token_hash)
+
+    def add_exchange_rate(self, timestamp, rate, pair=USD_TOMAN):
+        return self.catalog.add_exchange_rate(timestamp, rate, pair)
+
+    def get_exchange_rates(self, pair=USD_TOMAN, since=None):
+        return self.catalog.get_exchange_rates(pair, since)
+
+    def add_category(self, name, user_id=None):
+        return self.catalog.add_category(name, user_id)
+
+    def get_all_categories(self):
+        return self.catalog.get_all_categories()
+
+    def get_category_by_id(self, category_id):
+        return self.catalog.get_category_by_id(category_id)
+
+    # Sources
+    def add_source(self, name, bank, usd, value=0.0, user_id=None):
+        return self._user(user_id).add_source(name, bank, usd, value, user_id)
+
+    def get_all_sources(self, user_id):
+        return self._user(user_id).get_all_sources(user_id)
+
+    def get_sources(self, user_id):
+        return self._user(user_id).get_sources(user_id)
+
+    def get_source_by_id(self, source_id):
+        shard = self._owner(source_id)
+        return shard.get_source_by_id(source_id) if shard else None
+
+    def update_source_balance(self, source_id, amount_in_dollar, your_currency_rate, is_deposit, date=None, note=None):
+        shard = self._owner(source_id)
+        return shard.update_source_balance(source_id, amount_in_dollar, your_currency_rate, is_deposit, date, note) if shard else False
+
+    def update_source_income(self, source_id, amount_in_dollar, your_currency_rate):
+        return self.update_source_balance(source_id, amount_in_dollar, your_currency_rate, True)
+
+    def balance_as_of(self, source_id, date=None):
+        shard = self._owner(source_id)
+        return shard.balance_as_of(source_id, date) if shard else None
+
+    def snapshot_balance(self, source_id, date=None):
+        shard = self._owner(source_id)
+        return shard.snapshot_balance(source_id, date) if shard else None
+
+    def snapshot_all_balances(self, date=None):
+        return sum(shard.snapshot_all_balances(date) for shard in self._all())
+
+    def get_balance_history(self, source_id, dates):
+        return {date: self.balance_as_of(source_id, date) for date in dates}
+
+    def reconcile_source_balance(self, source_id):
+        shard = self._owner(source_id)
+        return shard.reconcile_source_balance(source_id) if shard else None
+
+    # Transactions
+    def add_transaction(self, name, date, price_in_dollar, your_currency_rate, category_id, source_id, user_id, is_deposit=False, update_balance=True):
+        return self._user(user_id).add_transaction(
+            name, date, price_in_dollar, your_currency_rate, category_id, source_id, user_id, is_deposit, update_balance
+        )
+
+    def bulk_add_transactions(self, user_id, transactions):
+        return self._user(user_id).bulk_add_transactions(user_id, transactions)
+
+    def add_income(self, name, date, amount, is_usd, your_currency_rate, category_id, source_id):
+        shard = self._owner(source_id)
+        return shard.add_income(name, date, amount, is_usd, your_currency_rate, category_id, source_id) if shard else None
+
+    def get_all_transactions(self, user_id, month=None):
+        return self._user(user_id).get_all_transactions(user_id, month)
+
+    def get_transactions_page(self, user_id, limit, before_date=None, before_id=None, month=None):
+        return self._user(user_id).get_transactions_page(user_id, limit, before_date, before_id, month)
+
+    def get_transactions_by_month(self, user_id, month, year):
+        return self._user(user_id).get_transactions_by_month(user_id, month, year)
+
+    def iter_transactions(self, user_id, month=None, chunk_size=STREAM_CHUNK_SIZE):
+        return self._user(user_id).iter_transactions(user_id, month, chunk_size)
+
+    def iter_transactions_by_month(self, user_id, month, year, chunk_size=STREAM_CHUNK_SIZE):
+        return self._user(user_id).iter_transactions_by_month(user_id, month, year, chunk_size)
+
+    def iter_export_rows(self, dataset, user_id, chunk_size=STREAM_CHUNK_SIZE):
+        return self._user(user_id).iter_export_rows(dataset, user_id, chunk_size)
+
+    def get_transactions_by_source(self, source_id):
+        shard = self._owner(source_id)
+        return shard.get_transactions_by_source(source_id) if shard else []
+
+    def get_transactions_by_category(self, category_id):
+        return [row for shard in self._all() for row in shard.get_transactions_by_category(category_id)]
+
+    def get_transactions_by_date_range(self, start_date, end_date):
+        return [row for shard in self._all() for row in shard.get_transactions_by_date_range(start_date, end_date)]
+
+    def get_transaction_by_id(self, transaction_id):
+        shard = self._owner(transaction_id)
+        return shard.get_transaction_by_id(transaction_id) if shard else None
+
+    def update_transaction(self, transaction_id, name, date, price, is_usd, category_id, source_id, your_currency_rate, is_deposit):
+        shard = self._owner(transaction_id)
+        if shard is None:
+            return False
+        return shard.update_transaction(transaction_id, name, date, price, is_usd, category_id, source_id, your_currency_rate, is_deposit)
+
+    def delete_transaction(self, transaction_id, user_id):
+        return self._user(user_id).delete_transaction(transaction_id, user_id)
+
+    def get_monthly_aggregates(self, user_id, month, year):
+        return self._user(user_id).get_monthly_aggregates(user_id, month, year)
+
+    def rebuild_monthly_aggregates(self, user_id=None):
+        if user_id is not None:
+            return self._user(user_id).rebuild_monthly_aggregates(user_id)
+        return sum(shard.rebuild_monthly_aggregates() for shard in self._all())
+
+    # Loans and payments
+    def add_loan(self, name, total_amount, monthly_payment, is_usd, user_id):
+        return self._user(user_id).add_loan(name, total_amount, monthly_payment, is_usd, user_id)
+
+    def get_all_loans(self, user_id):
+        return self._user(user_id).get_all_loans(user_id)
+
+    def get_loan_by_id(self, loan_id, user_id):
+        return self._user(user_id).get_loan_by_id(loan_id, user_id)
+
+    def update_loan_remaining_amount(self, loan_id, new_remaining_amount):
+        shard = self._owner(loan_id)
+        return shard.update_loan_remaining_amount(loan_id, new_remaining_amount) if shard else False
+
+    def delete_loan(self, loan_id, user_id):
+        return self._user(user_id).delete_loan(loan_id, user_id)
+
+    def get_loan_summary(self, user_id):
+        return self._user(user_id).get_loan_summary(user_id)
+
+    def add_loan_payment(self, loan_id, amount, payment_date, source_id, user_id, is_paid=False, is_usd=True):
+        return self._user(user_id).add_loan_payment(loan_id, amount, payment_date, source_id, user_id, is_paid, is_usd)
+
+    def get_loan_payments(self, loan_id, user_id):
+        return self._user(user_id).get_loan_payments(loan_id, user_id)
+
+    def mark_payment_paid(self, payment_id, user_id):
+        return self._user(user_id).mark_payment_paid(payment_id, user_id)
+
+
+def _shifted(column):
+    """SQL moving a reference to a sharded row into the shard's ID range (0/NULL kept)"""
+    return f"CASE WHEN {column} > 0 THEN {column} + :base ELSE {column} END"
+
+
+# Per-user tables copied by split_database: (table, select list with the
+# IDs shifted into the shard's range, filter selecting the shard's rows)
+_SPLIT_TABLES = [
+    ("sources", SOURCE_COLUMNS, f"{_shifted('id')}, name, bank, usd, value, user_id", "user_id"),
+    ("transactions", TRANSACTION_COLUMNS,
+     f"{_shifted('id')}, name, date, price_in_dollar, your_currency_rate, category_id, {_shifted('source_id')}, "
+     "is_deposit, user_id, affects_balance", "user_id"),
+    ("loans", LOAN_COLUMNS, f"{_shifted('id')}, " + LOAN_COLUMNS.split(", ", 1)[1], "user_id"),
+    ("loan_payments", "id, loan_id, amount, payment_date, source_id, is_paid, is_usd, user_id, created_at",
+     f"{_shifted('id')}, {_shifted('loan_id')}, amount, payment_date, {_shifted('source_id')}, is_paid, is_usd, user_id, created_at",
+     "user_id"),
+    ("balance_adjustments", "id, source_id, user_id, date, amount, note, created_at",
+     f"{_shifted('id')}, {_shifted('source_id')}, user_id, date, amount, note, created_at", "user_id"),
+    ("balance_snapshots", "source_id, date, balance", f"{_shifted('source_id')}, date, balance",
+     "(SELECT user_id FROM src.sources WHERE src.sources.id = source_id)"),
+    ("monthly_aggregates",
+     "user_id, year, month, category_id, source_id, is_deposit, transaction_count, total_usd, total_toman",
+     f"user_id, year, month, category_id, {_shifted('source_id')}, is_deposit, transaction_count, total_usd, total_toman",
+     "user_id"),
+]
+
+
+def split_database(source_name, catalog_name, shards, shard_dir=None):
+    """Split a single-file database into a catalog and shard files.
+
+    Users, categories, refresh tokens and exchange rates are copied to the
+    new catalog as they are; every other row goes to its user's shard, with
+    IDs of sharded tables moved into the shard's ID range (old ID + shard *
+    SHARD_ID_SPAN; shard 0 keeps its IDs). Rows without a user go to shard
+    0. Transactions of archived years are copied back into the shards' hot
+    tables (archive the shards again afterwards). The source database is
+    only read. Returns the number of rows copied per table.
+    """
+    if os.path.exists(catalog_name):
+        raise FileExistsError(f"{catalog_name} already exists")
+    run_migrations(source_name)
+    os.makedirs(os.path.dirname(os.path.abspath(catalog_name)), exist_ok=True)
+    sharded = ShardedDatabase(catalog_name, shards, shard_dir, write_queue=False)
+    sharded.create_tables()
+    source = os.path.abspath(source_name)
+    copied = {table: 0 for table in CATALOG_TABLES + tuple(table for table, *_ in _SPLIT_TABLES)}
+
+    with sqlite3.connect(catalog_name) as conn:
+        conn.execute("ATTACH DATABASE ? AS src", (source,))
+        copied["users"] = conn.execute(
+            "INSERT INTO users (id, username, email, password_hash, created_at) "
+            "SELECT id, username, email, password_hash, created_at FROM src.users"
+        ).rowcount
+        copied["categories"] = conn.execute("INSERT INTO categories (id, name) SELECT id, name FROM src.categories").rowcount
+        copied["refresh_tokens"] = conn.execute("INSERT INTO refresh_tokens SELECT * FROM src.refresh_tokens").rowcount
+        copied["exchange_rates"] = conn.execute("INSERT INTO exchange_rates SELECT * FROM src.exchange_rates").rowcount
+    conn.close()
+
+    with sqlite3.connect(source) as conn:
+        root = os.path.dirname(source)
+        archives = [os.path.join(root, path) for (path,) in conn.execute("SELECT path FROM archived_years ORDER BY year")]
+    conn.close()
+    _, transaction_columns, transaction_select, _ = next(entry for entry in _SPLIT_TABLES if entry[0] == "transactions")
+
+    if sharded.per_user:
+        with sqlite3.connect(source) as conn:
+            keys = sorted({row[0] for table, _, _, owner in _SPLIT_TABLES if owner == "user_id"
+                           for row in conn.execute(f"SELECT DISTINCT COALESCE(user_id, 0) FROM {table}")})
+        conn.close()
+    else:
+        keys = sharded.shard_keys()
+
+    for key in keys:
+        shard = sharded.shard(key)
+        if sharded.per_user:
+            condition, params = "COALESCE({owner}, 0) = :key", {"key": key}
+        else:
+            condition, params = "COALESCE({owner}, 0) % :count = :key", {"key": key, "count": sharded.shard_count}
+        params["base"] = key * SHARD_ID_SPAN
+        with sqlite3.connect(shard.db_name) as conn:
+            conn.execute("ATTACH DATABASE ? AS src", (source,))
+            for table, target_columns, select, owner in _SPLIT_TABLES:
+                cursor = conn.execute(
+                    f"INSERT INTO {table} ({target_columns}) SELECT {select} FROM src.{table} "
+                    f"WHERE {condition.format(owner=owner)}",
+                    params
+                )
+                copied[table] += cursor.rowcount
+        conn.close()
+        for archive in archives:
+            with sqlite3.connect(shard.db_name) as conn:
+                conn.execute("ATTACH DATABASE ? AS archive", (archive,))
+                cursor = conn.execute(
+                    f"INSERT INTO transactions ({transaction_columns}) SELECT {transaction_select} "
+                    f"FROM archive.transactions WHERE {condition.format(owner='user_id')}",
+                    params
+                )
+                copied["transactions"] += cursor.rowcount
+            conn.close()
+    return copied
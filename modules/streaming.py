@@ -0,0 +1,29 @@
+import json
+from fastapi import Request
+from fastapi.responses import StreamingResponse
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+LINES_PER_CHUNK = 500
+
+
+def wants_ndjson(request: Request, stream: bool = False) -> bool:
+    """Whether the client asked for a streamed NDJSON response (?stream=1 or Accept header)"""
+    return stream or NDJSON_MEDIA_TYPE in request.headers.get("accept", "")
+
+
+def iter_ndjson(items, lines_per_chunk=LINES_PER_CHUNK):
+    """Serialize items to NDJSON, yielding a few hundred lines at a time"""
+    lines = []
+    for item in items:
+        lines.append(json.dumps(item, ensure_ascii=False, default=str))
+        if len(lines) >= lines_per_chunk:
+            yield "\n".join(lines) + "\n"
+            lines = []
+    if lines:
+        yield "\n".join(lines) + "\n"
+
+
+def ndjson_response(items, filename=None):
+    """Stream an iterable of JSON-serializable items as an NDJSON response"""
+    headers = {"Content-Disposition": f"attachment; filename={filename}"} if filename else None
+    return StreamingResponse(iter_ndjson(items), media_type=NDJSON_MEDIA_TYPE, headers=headers)
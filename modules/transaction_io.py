@@ -0,0 +1,144 @@
+import csv
+import io
+
+# Column layout shared by the bulk import and the ledger export, so an
+# exported transactions file can be imported again as-is.
+TRANSACTION_COLUMNS = [
+    "date",
+    "name",
+    "price",
+    "is_usd",
+    "category",
+    "source",
+    "is_deposit",
+    "your_currency_rate",
+]
+
+
+# Columns (name, type) of each exportable dataset, in the order the
+# Database export queries return them. Types drive CSV formatting and the
+# Parquet schema.
+EXPORT_SCHEMAS = {
+    "transactions": [
+        ("date", "str"),
+        ("name", "str"),
+        ("price", "float"),
+        ("is_usd", "bool"),
+        ("category", "str"),
+        ("source", "str"),
+        ("is_deposit", "bool"),
+        ("your_currency_rate", "float"),
+    ],
+    "sources": [
+        ("id", "int"),
+        ("name", "str"),
+        ("bank", "bool"),
+        ("usd", "bool"),
+        ("value", "float"),
+    ],
+    "loans": [
+        ("id", "int"),
+        ("name", "str"),
+        ("total_amount", "float"),
+        ("monthly_payment", "float"),
+        ("interest_rate", "float"),
+        ("start_date", "str"),
+        ("end_date", "str"),
+        ("remaining_amount", "float"),
+        ("is_usd", "bool"),
+        ("created_at", "str"),
+    ],
+    "loan_payments": [
+        ("id", "int"),
+        ("loan_id", "int"),
+        ("amount", "float"),
+        ("payment_date", "str"),
+        ("source_id", "int"),
+        ("source", "str"),
+        ("is_paid", "bool"),
+        ("is_usd", "bool"),
+        ("created_at", "str"),
+    ],
+}
+
+EXPORT_CHUNK_ROWS = 1000
+PARQUET_READ_BLOCK = 64 * 1024
+
+
+def read_csv_rows(text):
+    """Read CSV text with a header line into a list of dicts (blank cells are left out)"""
+    reader = csv.DictReader(io.StringIO(text))
+    missing = {"date", "name", "price", "source"} - set(reader.fieldnames or [])
+    if missing:
+        raise ValueError(f"CSV is missing required columns: {', '.join(sorted(missing))}")
+    return [
+        {key: value for key, value in row.items() if key and value not in (None, "")}
+        for row in reader
+    ]
+
+
+def iter_csv(dataset, rows, chunk_rows=EXPORT_CHUNK_ROWS):
+    """Serialize export rows to CSV text, a header line first, yielding one chunk at a time"""
+    schema = EXPORT_SCHEMAS[dataset]
+    bool_columns = [i for i, (_, kind) in enumerate(schema) if kind == "bool"]
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(name for name, _ in schema)
+    count = 0
+    for row in rows:
+        if bool_columns:
+            row = list(row)
+            for i in bool_columns:
+                if row[i] is not None:
+                    row[i] = "true" if row[i] else "false"
+        writer.writerow(row)
+        count += 1
+        if count % chunk_rows == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def iter_parquet(dataset, rows, chunk_rows=EXPORT_CHUNK_ROWS):
+    """Serialize export rows to Parquet, one row group per chunk, yielding file bytes.
+
+    Row groups are written to a temporary file (Parquet's footer can only be
+    written once all rows are known) and the file is then streamed back, so
+    only one chunk of rows is ever held in memory.
+    """
+    import tempfile
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    arrow_types = {"str": pa.string(), "float": pa.float64(), "int": pa.int64(), "bool": pa.bool_()}
+    columns = EXPORT_SCHEMAS[dataset]
+    schema = pa.schema([(name, arrow_types[kind]) for name, kind in columns])
+    bool_columns = {i for i, (_, kind) in enumerate(columns) if kind == "bool"}
+
+    def write_chunk(writer, chunk):
+        data = {}
+        for i, (name, _) in enumerate(columns):
+            values = [row[i] for row in chunk]
+            if i in bool_columns:
+                values = [None if value is None else bool(value) for value in values]
+            data[name] = values
+        writer.write_table(pa.Table.from_pydict(data, schema=schema))
+
+    with tempfile.TemporaryFile() as spool:
+        with pq.ParquetWriter(spool, schema) as writer:
+            chunk = []
+            for row in rows:
+                chunk.append(row)
+                if len(chunk) >= chunk_rows:
+                    write_chunk(writer, chunk)
+                    chunk = []
+            if chunk:
+                write_chunk(writer, chunk)
+        spool.seek(0)
+        while True:
+            block = spool.read(PARQUET_READ_BLOCK)
+            if not block:
+                break
+            yield block
@@ -6,6 +6,7 @@ from typing import Optional, List
 from datetime import datetime
 import os
 from dotenv import load_dotenv
+from modules.parse_cache import get_parse_cache, options_hash
 import json
 
 # Load environment variables
@@ -23,12 +24,15 @@ class TransactionInfo(BaseModel):
     is_deposit: bool = Field(description="Whether this is a deposit/income transaction (True) or an expense (False)")
 
 class TransactionParser:
-    def __init__(self, available_categories: List[str] = None, available_sources: List[str] = None):
+    def __init__(self, available_categories: List[str] = None, available_sources: List[str] = None, cache=None):
         self.available_categories = available_categories or []
         self.available_sources = available_sources or []
+        # Repeated messages are answered from the parse cache instead of the LLM
+        self.cache = cache if cache is not None else get_parse_cache()
+        self.model_name = os.getenv("OPENAI_MODEL_NAME", "gpt-3.5-turbo")  # Default to gpt-3.5-turbo if not specified
         
         self.llm = ChatOpenAI(
-            model=os.getenv("OPENAI_MODEL_NAME", "gpt-3.5-turbo"),  # Default to gpt-3.5-turbo if not specified
+            model=self.model_name,
             temperature=0,
             openai_api_base=os.getenv("OPENAI_API_BASE"),
             openai_api_key=os.getenv("OPENAI_API_KEY")
@@ -105,6 +109,13 @@ class TransactionParser:
     def parse_transaction(self, text: str) -> TransactionInfo:
         """Parse transaction information from text"""
         current_date = datetime.now().strftime("%Y-%m-%d")
+        if self.cache is not None:
+            cache_key = self.cache.key(
+                text, options_hash(self.model_name, self.available_categories, self.available_sources)
+            )
+            cached = self.cache.get(cache_key, current_date)
+            if cached is not None:
+                return TransactionInfo(**cached)
         
         # Format the prompt with the input text and format instructions
         formatted_prompt = self.prompt.format_messages(
@@ -124,12 +135,14 @@ class TransactionParser:
         # Parse the response into TransactionInfo
         try:
             transaction_info = self.parser.parse(cleaned_response)
-            return transaction_info
         except Exception as e:
             print(f"Error parsing transaction: {e}")
             print("Failed to parse the following response:")
             print(cleaned_response)
             raise ValueError(f"Failed to parse transaction response: {cleaned_response}")
+        if self.cache is not None:
+            self.cache.put(cache_key, text, transaction_info.model_dump(), current_date)
+        return transaction_info
 
 # Sample usage code
 if __name__ == "__main__":
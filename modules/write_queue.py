@@ -0,0 +1,175 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+# Group commit: when enabled, ledger writes from every thread go through one
+# writer thread that commits them in batches instead of one commit each.
+WRITE_QUEUE_ENABLED = os.getenv("DB_WRITE_QUEUE", "0").lower() in ("1", "true", "yes")
+# How long the writer waits for more writes after the first one of a batch.
+# 0 batches whatever queued up while the previous batch was committing,
+# which is enough once writers contend; a few ms only pays off when commits
+# are slow (fsync on every commit) and writes arrive spread out.
+WRITE_QUEUE_WINDOW_MS = float(os.getenv("DB_WRITE_QUEUE_WINDOW_MS", "0"))
+WRITE_QUEUE_MAX_BATCH = int(os.getenv("DB_WRITE_QUEUE_MAX_BATCH", "256"))
+
+_STOP = object()
+
+
+class WriteQueueClosed(Exception):
+    """Raised when a write is submitted to a queue that has been shut down"""
+
+
+class WriteQueue:
+    """Single writer thread that commits queued writes together.
+
+    submit(fn, *args) queues fn(cursor, *args) and returns a Future. The
+    writer takes every queued write (waiting up to window_ms for more),
+    runs them in one write_transaction() of `database`, each inside its own
+    SAVEPOINT, and commits once. A write that raises is rolled back to its savepoint alone
+    and its future gets the exception; the others still commit. Futures are
+    resolved only after the COMMIT, so a result means the write is durable.
+    """
+
+    def __init__(self, database, window_ms=WRITE_QUEUE_WINDOW_MS, max_batch=WRITE_QUEUE_MAX_BATCH):
+        self.database = database
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._closed = False
+        self._lock = threading.Lock()
+        self._batches = 0
+        self._writes = 0
+        self._failed = 0
+        self._largest_batch = 0
+        self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, fn, *args):
+        """Queue fn(cursor, *args) for the next batch and return its Future"""
+        future = Future()
+        with self._lock:
+            if self._closed:
+                raise WriteQueueClosed("The database write queue is shut down")
+            self._queue.put((fn, args, future))
+        return future
+
+    def close(self):
+        """Commit the writes already queued and stop the writer thread"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(_STOP)
+        self._thread.join()
+
+    def _collect(self):
+        """Block for the first write, then gather more until the window or batch size runs out"""
+        first = self._queue.get()
+        if first is _STOP:
+            return None, True
+        batch = [first]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            try:
+                item = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _run(self):
+        while True:
+            batch, stop = self._collect()
+            if batch:
+                self._commit(batch)
+            if stop:
+                return
+
+    def _commit(self, batch):
+        """Run a batch in one transaction and resolve its futures after COMMIT"""
+        outcomes = []
+        try:
+            with self.database.write_transaction() as cursor:
+                for fn, args, future in batch:
+                    if not future.set_running_or_notify_cancel():
+                        continue
+                    if len(batch) == 1:
+                        # Nothing to isolate: an error rolls back the whole transaction
+                        outcomes.append((future, fn(cursor, *args), None))
+                        continue
+                    cursor.execute("SAVEPOINT queued_write")
+                    try:
+                        outcomes.append((future, fn(cursor, *args), None))
+                    except Exception as e:
+                        cursor.execute("ROLLBACK TO SAVEPOINT queued_write")
+                        outcomes.append((future, None, e))
+                    cursor.execute("RELEASE SAVEPOINT queued_write")
+        except Exception as e:
+            # Nothing was committed; every write of the batch fails
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            with self._lock:
+                self._batches += 1
+                self._failed += len(batch)
+            return
+
+        failed = 0
+        for future, result, error in outcomes:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+                failed += 1
+        with self._lock:
+            self._batches += 1
+            self._writes += len(outcomes)
+            self._failed += failed
+            self._largest_batch = max(self._largest_batch, len(outcomes))
+
+    def stats(self):
+        """Batches committed, writes per batch and queue depth"""
+        with self._lock:
+            return {
+                "db_name": self.database.db_name,
+                "batches": self._batches,
+                "writes": self._writes,
+                "failed": self._failed,
+                "avg_batch": round(self._writes / self._batches, 2) if self._batches else 0.0,
+                "largest_batch": self._largest_batch,
+                "pending": self._queue.qsize(),
+                "window_ms": self.window * 1000,
+            }
+
+
+# One queue per database, shared by every Database instance in the process
+_queues = {}
+_queues_lock = threading.Lock()
+
+
+def get_write_queue(database):
+    """Get (or start) the shared write queue for a database"""
+    with _queues_lock:
+        write_queue = _queues.get(database.db_name)
+        if write_queue is None:
+            write_queue = WriteQueue(database)
+            _queues[database.db_name] = write_queue
+        return write_queue
+
+
+def write_queue_stats():
+    """Return statistics for every write queue started in this process"""
+    return [write_queue.stats() for write_queue in list(_queues.values())]
+
+
+def shutdown_write_queues():
+    """Commit queued writes and stop every writer thread (used on application shutdown)"""
+    with _queues_lock:
+        queues = list(_queues.values())
+        _queues.clear()
+    for write_queue in queues:
+        write_queue.close()
@@ -1474,6 +1474,40 @@ function checkAuth() {
     return true;
 }
 
+// Exchange the stored refresh token for a new token pair. Concurrent
+// callers share one in-flight refresh, since a refresh token works only once.
+let refreshPromise = null;
+
+function refreshAccessToken() {
+    if (!refreshPromise) {
+        refreshPromise = (async () => {
+            const refreshToken = localStorage.getItem('refresh_token');
+            if (!refreshToken) return false;
+            try {
+                const response = await fetch('/api/token/refresh', {
+                    method: 'POST',
+                    headers: { 'Content-Type': 'application/json' },
+                    body: JSON.stringify({ refresh_token: refreshToken }),
+                });
+                if (!response.ok) return false;
+                const data = await response.json();
+                localStorage.setItem('token', data.access_token);
+                localStorage.setItem('refresh_token', data.refresh_token);
+                return true;
+            } catch (error) {
+                return false;
+            }
+        })().finally(() => { refreshPromise = null; });
+    }
+    return refreshPromise;
+}
+
+function redirectToLogin() {
+    localStorage.removeItem('token');
+    localStorage.removeItem('refresh_token');
+    window.location.href = '/login.html';
+}
+
 // Add auth header to fetch requests
 async function fetchWithAuth(url, options = {}) {
     const token = localStorage.getItem('token');
@@ -1482,18 +1516,27 @@ async function fetchWithAuth(url, options = {}) {
         return;
     }
 
-    const headers = {
-        'Authorization': `Bearer ${token}`,
-        ...options.headers,
-    };
+    const send = (accessToken) => fetch(url, {
+        ...options,
+        headers: {
+            'Authorization': `Bearer ${accessToken}`,
+            ...options.headers,
+        },
+    });
+
+    let response = await send(token);
 
-    const response = await fetch(url, { ...options, headers });
-    
     if (response.status === 401) {
-        // Token expired or invalid
-        localStorage.removeItem('token');
-        window.location.href = '/login.html';
-        return;
+        // Access token expired: refresh silently and retry once
+        if (!(await refreshAccessToken())) {
+            redirectToLogin();
+            return;
+        }
+        response = await send(localStorage.getItem('token'));
+        if (response.status === 401) {
+            redirectToLogin();
+            return;
+        }
     }
 
     return response;
@@ -1501,8 +1544,17 @@ async function fetchWithAuth(url, options = {}) {
 
 // Logout function
 function logout() {
-    localStorage.removeItem('token');
-    window.location.href = '/login.html';
+    const refreshToken = localStorage.getItem('refresh_token');
+    if (refreshToken) {
+        // End the server-side session too; the redirect does not wait for it
+        fetch('/api/token/revoke', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ refresh_token: refreshToken }),
+            keepalive: true,
+        }).catch(() => {});
+    }
+    redirectToLogin();
 }
 
 // Update all fetch calls to use fetchWithAuth
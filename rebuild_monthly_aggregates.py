@@ -0,0 +1,16 @@
+from modules.repository import open_database
+import sys
+
+def rebuild_monthly_aggregates(user_id=None):
+    """Recompute the monthly_aggregates table from the transactions table"""
+    db = open_database()
+    db.create_tables()
+    
+    target = f"user {user_id}" if user_id is not None else "all users"
+    print(f"Rebuilding monthly aggregates for {target}...")
+    rows = db.rebuild_monthly_aggregates(user_id)
+    print(f"Wrote {rows} aggregate rows.")
+
+if __name__ == "__main__":
+    # Optional argument: only rebuild one user's aggregates
+    rebuild_monthly_aggregates(int(sys.argv[1]) if len(sys.argv) > 1 else None)
@@ -0,0 +1,57 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from modules.backup import backup_scheduler_stats, create_backup, database_files, list_backups, stream_backup
+from modules.repository import open_database
+from routers.users import get_current_user
+import os
+
+# Create router
+router = APIRouter()
+
+# Users allowed to call the admin endpoints (comma-separated usernames)
+ADMIN_USERNAMES = {name.strip() for name in os.getenv("ADMIN_USERNAMES", "").split(",") if name.strip()}
+
+# Dependencies
+def get_db():
+    return open_database()
+
+async def get_admin_user(current_user = Depends(get_current_user)):
+    if current_user.username not in ADMIN_USERNAMES:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin access required")
+    return current_user
+
+def check_backups_supported(db):
+    try:
+        database_files(db)
+    except ValueError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+
+# API routes
+@router.get("/api/admin/backup")
+async def download_backup(admin = Depends(get_admin_user), db = Depends(get_db)):
+    """Stream a consistent snapshot of the database, taken while it keeps serving requests.
+
+    A single database file is sent as is; shards and yearly archives come
+    together as a tar.
+    """
+    check_backups_supported(db)
+    filename, chunks = await run_in_threadpool(stream_backup, db)
+    return StreamingResponse(
+        chunks,
+        media_type="application/x-tar" if filename.endswith(".tar") else "application/vnd.sqlite3",
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    )
+
+@router.post("/api/admin/backups", status_code=201)
+async def take_backup(admin = Depends(get_admin_user), db = Depends(get_db)):
+    """Take a backup into the backup directory now, then apply retention"""
+    check_backups_supported(db)
+    path = await run_in_threadpool(create_backup, db)
+    return {"backup": os.path.basename(path), "backups": list_backups(db)}
+
+@router.get("/api/admin/backups")
+async def get_backups(admin = Depends(get_admin_user), db = Depends(get_db)):
+    """List the backups in the backup directory and the scheduler's state"""
+    check_backups_supported(db)
+    return {"backups": list_backups(db), "scheduler": backup_scheduler_stats()}
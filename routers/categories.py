@@ -19,5 +19,5 @@ def get_db_dependency():
 @router.get("/api/categories", response_model=List[Category])
 async def get_categories(db=Depends(get_db_dependency)):
     """Get all categories"""
-    categories = db.get_all_categories()
-    return [{"id": cat[0], "name": cat[1]} for cat in categories] 
\ No newline at end of file
+    categories = await db.get_all_categories()
+    return [{"id": cat.id, "name": cat.name} for cat in categories] 
\ No newline at end of file
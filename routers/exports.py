@@ -0,0 +1,44 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from typing import Literal
+from modules.async_database import AsyncDatabase
+from modules.transaction_io import iter_csv, iter_parquet
+from routers.users import get_current_user
+
+# Create router
+router = APIRouter()
+
+# Dependency
+def get_db():
+    return AsyncDatabase()
+
+# API routes
+@router.get("/api/export/{dataset}")
+async def export_dataset(
+    dataset: Literal["transactions", "sources", "loans", "loan_payments"],
+    format: Literal["csv", "parquet"] = Query("csv", description="Export file format"),
+    current_user = Depends(get_current_user),
+    db: AsyncDatabase = Depends(get_db)
+):
+    """Stream all of the current user's rows of one dataset as CSV or Parquet.
+
+    Rows are read from the database cursor in chunks and serialized as they
+    arrive. The transactions CSV uses the same columns as
+    POST /api/transactions/import, so it can be imported again.
+    """
+    rows = db.iter_export_rows(dataset, current_user.id)
+    if format == "parquet":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise HTTPException(status_code=501, detail="Parquet export requires the pyarrow package")
+        return StreamingResponse(
+            iter_parquet(dataset, rows),
+            media_type="application/vnd.apache.parquet",
+            headers={"Content-Disposition": f"attachment; filename={dataset}.parquet"}
+        )
+    return StreamingResponse(
+        iter_csv(dataset, rows),
+        media_type="text/csv",
+        headers={"Content-Disposition": f"attachment; filename={dataset}.csv"}
+    )
@@ -2,7 +2,8 @@ from fastapi import APIRouter, Depends, HTTPException, status, Query
 from typing import List, Optional
 from pydantic import BaseModel, Field
 from datetime import date, datetime
-from modules.database import Database
+from modules.async_database import AsyncDatabase
+from modules.database import LoanRow, LoanPaymentRow
 from routers.users import get_current_user
 
 # Create router
@@ -59,51 +60,60 @@ class LoanResponse(BaseModel):
 
 # Dependency
 def get_db():
-    return Database()
+    return AsyncDatabase()
+
+def _loan_to_dict(loan: LoanRow):
+    return {
+        "id": loan.id,
+        "name": loan.name,
+        "total_amount": loan.total_amount,
+        "monthly_payment": loan.monthly_payment,
+        "interest_rate": loan.interest_rate,
+        "start_date": loan.start_date,
+        "end_date": loan.end_date,
+        "remaining_amount": loan.remaining_amount,
+        "is_usd": bool(loan.is_usd),
+        # Ensure created_at is a string
+        "created_at": str(loan.created_at) if loan.created_at is not None else datetime.now().isoformat()
+    }
+
+def _payment_to_dict(payment: LoanPaymentRow):
+    return {
+        "id": payment.id,
+        "loan_id": payment.loan_id,
+        "amount": payment.amount,
+        "payment_date": payment.payment_date,
+        "source_id": payment.source_id,
+        "source_name": payment.source_name or "Unknown",
+        "is_paid": bool(payment.is_paid),
+        "is_usd": bool(payment.is_usd),
+        "created_at": str(payment.created_at) if payment.created_at is not None else datetime.now().isoformat()
+    }
 
 # API routes
 @router.get("/api/loans", response_model=List[Loan])
 async def get_loans(
     current_user = Depends(get_current_user),
-    db: Database = Depends(get_db)
+    db: AsyncDatabase = Depends(get_db)
 ):
     """Get all loans for the current user"""
-    loans = db.get_all_loans(current_user[0])
-    
-    result = []
-    for loan in loans:
-        # Ensure created_at is a string
-        created_at = str(loan[9]) if loan[9] is not None else datetime.now().isoformat()
-        
-        result.append({
-            "id": loan[0],
-            "name": loan[1],
-            "total_amount": loan[2],
-            "monthly_payment": loan[3],
-            "interest_rate": loan[4],
-            "start_date": loan[5],
-            "end_date": loan[6],
-            "remaining_amount": loan[7],
-            "is_usd": bool(loan[8]),
-            "created_at": created_at
-        })
-    
-    return result
+    loans = await db.get_all_loans(current_user.id)
+    return [_loan_to_dict(loan) for loan in loans]
 
 @router.post("/api/loans", response_model=LoanResponse)
 async def create_loan(
     loan: LoanCreate,
     current_user = Depends(get_current_user),
-    db: Database = Depends(get_db)
+    db: AsyncDatabase = Depends(get_db)
 ):
     """Create a new loan"""
     try:
-        loan_id = db.add_loan(
+        loan_id = await db.add_loan(
             name=loan.name,
             total_amount=loan.total_amount,
             monthly_payment=loan.monthly_payment,
             is_usd=loan.is_usd,
-            user_id=current_user[0]
+            user_id=current_user.id
         )
         
         if not loan_id:
@@ -123,41 +133,27 @@ async def create_loan(
 async def get_loan(
     loan_id: int,
     current_user = Depends(get_current_user),
-    db: Database = Depends(get_db)
+    db: AsyncDatabase = Depends(get_db)
 ):
     """Get a specific loan by ID"""
-    loan = db.get_loan_by_id(loan_id, current_user[0])
+    loan = await db.get_loan_by_id(loan_id, current_user.id)
     if not loan:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Loan not found"
         )
     
-    # Ensure created_at is a string
-    created_at = str(loan[9]) if loan[9] is not None else datetime.now().isoformat()
-    
-    return {
-        "id": loan[0],
-        "name": loan[1],
-        "total_amount": loan[2],
-        "monthly_payment": loan[3],
-        "interest_rate": loan[4],
-        "start_date": loan[5],
-        "end_date": loan[6],
-        "remaining_amount": loan[7],
-        "is_usd": bool(loan[8]),
-        "created_at": created_at
-    }
+    return _loan_to_dict(loan)
 
 @router.delete("/api/loans/{loan_id}")
 async def delete_loan(
     loan_id: int,
     current_user = Depends(get_current_user),
-    db: Database = Depends(get_db)
+    db: AsyncDatabase = Depends(get_db)
 ):
     """Delete a loan and all its payments"""
     # Check if loan exists and belongs to user
-    loan = db.get_loan_by_id(loan_id, current_user[0])
+    loan = await db.get_loan_by_id(loan_id, current_user.id)
     if not loan:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -165,7 +161,7 @@ async def delete_loan(
         )
     
     # Delete the loan
-    if not db.delete_loan(loan_id, current_user[0]):
+    if not await db.delete_loan(loan_id, current_user.id):
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Failed to delete loan"
@@ -177,43 +173,30 @@ async def delete_loan(
 async def get_loan_payments(
     loan_id: int,
     current_user = Depends(get_current_user),
-    db: Database = Depends(get_db)
+    db: AsyncDatabase = Depends(get_db)
 ):
     """Get all payments for a specific loan"""
     # Check if loan exists and belongs to user
-    loan = db.get_loan_by_id(loan_id, current_user[0])
+    loan = await db.get_loan_by_id(loan_id, current_user.id)
     if not loan:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Loan not found"
         )
     
-    payments = db.get_loan_payments(loan_id, current_user[0])
-    return [
-        {
-            "id": payment[0],
-            "loan_id": payment[1],
-            "amount": payment[2],
-            "payment_date": payment[3],
-            "source_id": payment[4],
-            "source_name": payment[8] if len(payment) > 8 else "Unknown",
-            "is_paid": bool(payment[5]),
-            "is_usd": bool(payment[6]),
-            "created_at": str(payment[7]) if payment[7] is not None else datetime.now().isoformat()
-        }
-        for payment in payments
-    ]
+    payments = await db.get_loan_payments(loan_id, current_user.id)
+    return [_payment_to_dict(payment) for payment in payments]
 
 @router.post("/api/loans/{loan_id}/payments", response_model=LoanResponse)
 async def create_loan_payment(
     loan_id: int,
     payment: LoanPaymentCreate,
     current_user = Depends(get_current_user),
-    db: Database = Depends(get_db)
+    db: AsyncDatabase = Depends(get_db)
 ):
     """Create a new loan payment"""
     # Check if loan exists and belongs to user
-    loan = db.get_loan_by_id(loan_id, current_user[0])
+    loan = await db.get_loan_by_id(loan_id, current_user.id)
     if not loan:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -221,8 +204,8 @@ async def create_loan_payment(
         )
     
     # Verify the source belongs to the user
-    sources = db.get_all_sources(current_user[0])
-    source_ids = [src[0] for src in sources]
+    sources = await db.get_all_sources(current_user.id)
+    source_ids = [src.id for src in sources]
     if payment.source_id not in source_ids:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -231,14 +214,14 @@ async def create_loan_payment(
     
     try:
         # Convert amount to USD if needed for loan payment
-        amount_in_usd = payment.amount if payment.is_usd else payment.amount / db.get_exchange_rate()
+        amount_in_usd = payment.amount if payment.is_usd else payment.amount / await db.get_exchange_rate()
         
-        payment_id = db.add_loan_payment(
+        payment_id = await db.add_loan_payment(
             loan_id=loan_id,
             amount=payment.amount,
             payment_date=payment.payment_date,
             source_id=payment.source_id,
-            user_id=current_user[0],
+            user_id=current_user.id,
             is_usd=payment.is_usd,
             is_paid=True  # Always mark as paid immediately
         )
@@ -251,53 +234,44 @@ async def create_loan_payment(
         
         # Update loan remaining amount since payment is marked as paid
         # Get current loan to calculate new remaining amount
-        current_loan = db.get_loan_by_id(loan_id, current_user[0])
+        current_loan = await db.get_loan_by_id(loan_id, current_user.id)
         if current_loan:
-            current_remaining = current_loan[7]  # remaining_amount is at index 7
+            current_remaining = current_loan.remaining_amount
             new_remaining_amount = current_remaining - amount_in_usd
-            success = db.update_loan_remaining_amount(loan_id, new_remaining_amount)
+            success = await db.update_loan_remaining_amount(loan_id, new_remaining_amount)
             if not success:
                 print(f"Warning: Failed to update loan remaining amount for loan {loan_id}")
         else:
             print(f"Warning: Could not find loan {loan_id} to update remaining amount")
         
-        # Update source balance for the loan payment
-        try:
-            db.update_source_balance(
-                payment.source_id, 
-                amount_in_usd, 
-                db.get_exchange_rate(), 
-                is_deposit=False  # This is an expense
-            )
-        except Exception as e:
-            print(f"Warning: Failed to update source balance: {e}")
-        
-        # Create expense transaction if requested
+        # The payment moves the source balance exactly once: through the expense
+        # transaction if one is requested, otherwise as a balance adjustment
+        transaction_id = None
         if payment.create_expense_transaction:
             try:
                 # Get or create a "loan-payment" category
-                categories = db.get_all_categories()
+                categories = await db.get_all_categories()
                 loan_category_id = None
                 for cat in categories:
-                    if cat[1] == "loan-payment":  # cat[1] is the name
-                        loan_category_id = cat[0]  # cat[0] is the id
+                    if cat.name == "loan-payment":
+                        loan_category_id = cat.id
                         break
                 
                 if not loan_category_id:
                     # Create loan-payment category if it doesn't exist
-                    loan_category_id = db.add_category("loan-payment")
+                    loan_category_id = await db.add_category("loan-payment")
                 
-                # Create expense transaction (without updating source balance since loan payment handles it)
-                transaction_id = db.add_transaction(
+                # Create expense transaction (it also deducts the source balance)
+                transaction_id = await db.add_transaction(
                     name=f"Loan Payment - {payment.loan_name}",
                     date=payment.payment_date,
                     price_in_dollar=amount_in_usd,
-                    your_currency_rate=db.get_exchange_rate(),
+                    your_currency_rate=await db.get_exchange_rate(),
                     category_id=loan_category_id,
                     source_id=payment.source_id,
                     is_deposit=False,  # This is an expense
-                    user_id=current_user[0],
-                    update_balance=False  # Don't update source balance to avoid double deduction
+                    user_id=current_user.id,
+                    update_balance=True
                 )
                 
                 if not transaction_id:
@@ -307,6 +281,20 @@ async def create_loan_payment(
                 print(f"Warning: Failed to create expense transaction: {str(e)}")
                 # Don't fail the loan payment if expense creation fails
         
+        if not transaction_id:
+            # Update source balance for the loan payment
+            try:
+                await db.update_source_balance(
+                    payment.source_id, 
+                    amount_in_usd, 
+                    await db.get_exchange_rate(), 
+                    is_deposit=False,  # This is an expense
+                    date=payment.payment_date,
+                    note=f"Loan payment {payment_id}"
+                )
+            except Exception as e:
+                print(f"Warning: Failed to update source balance: {e}")
+        
         return {"id": payment_id, "message": "Loan payment created successfully"}
     except Exception as e:
         raise HTTPException(
@@ -318,11 +306,11 @@ async def create_loan_payment(
 async def mark_payment_paid(
     payment_id: int,
     current_user = Depends(get_current_user),
-    db: Database = Depends(get_db)
+    db: AsyncDatabase = Depends(get_db)
 ):
     """Mark a loan payment as paid and update loan remaining amount"""
     try:
-        success = db.mark_payment_paid(payment_id, current_user[0])
+        success = await db.mark_payment_paid(payment_id, current_user.id)
         if not success:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -339,10 +327,10 @@ async def mark_payment_paid(
 @router.get("/api/loans/summary", response_model=LoanSummary)
 async def get_loan_summary(
     current_user = Depends(get_current_user),
-    db: Database = Depends(get_db)
+    db: AsyncDatabase = Depends(get_db)
 ):
     """Get loan summary statistics for the current user"""
-    summary = db.get_loan_summary(current_user[0])
+    summary = await db.get_loan_summary(current_user.id)
     if not summary or summary[0] is None:
         return {
             "total_loans": 0,
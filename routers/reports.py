@@ -1,10 +1,16 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from fastapi.responses import Response
 from typing import List, Dict, Any
 from datetime import datetime, date
-from modules.database import Database
+import calendar
+import math
+from modules.database import MonthlyAggregateRow, SourceRow, TransactionDetailRow, UserRow
+from modules.async_database import run_in_db_executor
+from modules.repository import open_database
 from routers.users import get_current_user  
-from modules.currency_exchange import CurrencyExchange
+from modules.currency_exchange import get_currency_exchange
+from modules.rate_history import get_rate_history
+from modules.streaming import wants_ndjson, ndjson_response
 from reportlab.lib.pagesizes import letter, A4
 from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, PageBreak
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
@@ -16,18 +22,34 @@ import io
 # Create router 
 router = APIRouter()
 
-# Get currency exchange instance
-currency_exchange = CurrencyExchange()
+# Shared currency exchange instance
+currency_exchange = get_currency_exchange()
 
 class MonthlyReportData:
     def __init__(self, user_id: int, month: int, year: int):
         self.user_id = user_id
         self.month = month
         self.year = year
-        self.db = Database()
-        self.exchange_rate = currency_exchange.get_usd_rate()
+        self.db = open_database()
+        self.rate_history = get_rate_history()
+        self.exchange_rate = self.month_end_rate()
+
+    def month_end_rate(self) -> float:
+        """Rate at the end of the month from the rate history; the current rate for this month or with no history"""
+        month_end = date(self.year, self.month, calendar.monthrange(self.year, self.month)[1])
+        if month_end < date.today():
+            rate = self.rate_history.rate_at(month_end)
+            if rate is not None:
+                return rate
+        return currency_exchange.get_usd_rate()
+
+    def toman_at_dates(self, transactions: List[TransactionDetailRow]):
+        """Each transaction's dollar amount in Toman at the market rate of its date, in one pass"""
+        return self.rate_history.to_toman(
+            [abs(tx.price_in_dollar) for tx in transactions], [tx.date for tx in transactions]
+        )
         
-    def get_transactions(self) -> List[Dict[str, Any]]:
+    def get_transactions(self) -> List[TransactionDetailRow]:
         """Get all transactions for the specified month"""
         try:
             transactions = self.db.get_transactions_by_month(self.user_id, self.month, self.year)
@@ -35,7 +57,7 @@ class MonthlyReportData:
         except Exception as e:
             raise
     
-    def get_sources(self) -> List[Dict[str, Any]]:
+    def get_sources(self) -> List[SourceRow]:
         """Get all sources for the user"""
         try:
             sources = self.db.get_sources(self.user_id)
@@ -44,64 +66,84 @@ class MonthlyReportData:
             print(f"Debug: Error in get_sources: {e}")
             raise
     
-    def calculate_totals(self, transactions: List[Dict[str, Any]]) -> Dict[str, float]:
-        """Calculate income, expense, and net totals in both currencies"""
-        total_income_usd = 0
-        total_expense_usd = 0
-        total_income_toman = 0
-        total_expense_toman = 0
-        
-        
-        for tx in transactions:
-            # Handle both tuple and dictionary formats
-            if isinstance(tx, dict):
-                price = tx['price_in_dollar']  # Database returns price_in_dollar
-                is_usd = tx.get('is_usd', True)  # Default to True if not present
-                is_deposit = bool(tx['is_deposit'])  # Convert 0/1 to boolean
-                currency_rate = tx['your_currency_rate']
-            else:
-                # Assume tuple format from database: need to figure out column order
-                # For now, let's convert tuple to dict
-                print(f"Debug: Transaction is tuple with {len(tx)} items: {tx}")
-                # This will help us understand the tuple structure
-                continue  # Skip for now to avoid errors
-            
-            amount = abs(price)
-            if is_usd:
-                if is_deposit:
-                    total_income_usd += amount
-                else:
-                    total_expense_usd += amount
-                # Convert to Toman
-                toman_amount = amount * currency_rate
-                if is_deposit:
-                    total_income_toman += toman_amount
-                else:
-                    total_expense_toman += toman_amount
-            else:
-                if is_deposit:
-                    total_income_toman += amount
-                else:
-                    total_expense_toman += amount
-                # Convert to USD
-                usd_amount = amount / currency_rate
-                if is_deposit:
-                    total_income_usd += usd_amount
-                else:
-                    total_expense_usd += usd_amount
-        
-        net_usd = total_income_usd - total_expense_usd
-        net_toman = total_income_toman - total_expense_toman
-        
+    def iter_transactions(self):
+        """Stream the transactions for the specified month without loading them all"""
+        return self.db.iter_transactions_by_month(self.user_id, self.month, self.year)
+
+    @staticmethod
+    def new_totals() -> Dict[str, float]:
+        """Start an empty set of income/expense/net totals"""
         return {
-            'income_usd': total_income_usd,
-            'expense_usd': total_expense_usd,
-            'net_usd': net_usd,
-            'income_toman': total_income_toman,
-            'expense_toman': total_expense_toman,
-            'net_toman': net_toman
+            'income_usd': 0,
+            'expense_usd': 0,
+            'net_usd': 0,
+            'income_toman': 0,
+            'expense_toman': 0,
+            'net_toman': 0
         }
 
+    @staticmethod
+    def add_to_totals(totals: Dict[str, float], tx: TransactionDetailRow) -> None:
+        """Add one transaction to running totals (in both currencies)"""
+        # Prices are stored in dollars; Toman is converted at the transaction's rate
+        usd_amount = abs(tx.price_in_dollar)
+        toman_amount = usd_amount * tx.your_currency_rate
+
+        if tx.is_deposit:
+            totals['income_usd'] += usd_amount
+            totals['income_toman'] += toman_amount
+        else:
+            totals['expense_usd'] += usd_amount
+            totals['expense_toman'] += toman_amount
+        totals['net_usd'] = totals['income_usd'] - totals['expense_usd']
+        totals['net_toman'] = totals['income_toman'] - totals['expense_toman']
+
+    def get_aggregates(self) -> List[MonthlyAggregateRow]:
+        """Get the month's pre-aggregated totals per category, source and type"""
+        if not hasattr(self, '_aggregates'):
+            self._aggregates = self.db.get_monthly_aggregates(self.user_id, self.month, self.year)
+        return self._aggregates
+
+    def get_totals(self) -> Dict[str, float]:
+        """Income, expense, and net totals read from monthly_aggregates (no transaction scan)"""
+        totals = self.new_totals()
+        for row in self.get_aggregates():
+            kind = 'income' if row.is_deposit else 'expense'
+            totals[f'{kind}_usd'] += row.total_usd
+            totals[f'{kind}_toman'] += row.total_toman
+        totals['net_usd'] = totals['income_usd'] - totals['expense_usd']
+        totals['net_toman'] = totals['income_toman'] - totals['expense_toman']
+        return totals
+
+    def get_transaction_count(self) -> int:
+        """Number of transactions in the month, from monthly_aggregates"""
+        return sum(row.transaction_count for row in self.get_aggregates())
+
+    def get_category_breakdown(self) -> List[Dict[str, Any]]:
+        """Per-category income/expense totals for the month, largest expense first"""
+        categories = {}
+        for row in self.get_aggregates():
+            entry = categories.setdefault(row.category_id, {
+                'category': row.category,
+                'transaction_count': 0,
+                'income_usd': 0,
+                'expense_usd': 0,
+                'income_toman': 0,
+                'expense_toman': 0
+            })
+            kind = 'income' if row.is_deposit else 'expense'
+            entry['transaction_count'] += row.transaction_count
+            entry[f'{kind}_usd'] += row.total_usd
+            entry[f'{kind}_toman'] += row.total_toman
+        return sorted(categories.values(), key=lambda entry: entry['expense_usd'], reverse=True)
+
+    def calculate_totals(self, transactions: List[TransactionDetailRow]) -> Dict[str, float]:
+        """Calculate income, expense, and net totals in both currencies"""
+        totals = self.new_totals()
+        for tx in transactions:
+            self.add_to_totals(totals, tx)
+        return totals
+
 def create_pdf_report(report_data: MonthlyReportData) -> bytes:
     """Create a PDF report with transactions and sources data"""
     buffer = io.BytesIO()
@@ -131,7 +173,7 @@ def create_pdf_report(report_data: MonthlyReportData) -> bytes:
     
     # Get data
     transactions = report_data.get_transactions()
-    totals = report_data.calculate_totals(transactions)
+    totals = report_data.get_totals()
     
     # Build content
     story = []
@@ -180,13 +222,7 @@ def create_pdf_report(report_data: MonthlyReportData) -> bytes:
         expense_transactions = []
         
         for tx in transactions:
-            if isinstance(tx, dict):
-                is_deposit = bool(tx['is_deposit'])  # Convert 0/1 to boolean
-            else:
-                # Skip tuples for now
-                continue
-                
-            if is_deposit:
+            if tx.is_deposit:
                 income_transactions.append(tx)
             else:
                 expense_transactions.append(tx)
@@ -197,27 +233,16 @@ def create_pdf_report(report_data: MonthlyReportData) -> bytes:
             income_data = [['Date', 'Description', 'Amount (USD)', 'Amount (Toman)', 'Source']]
             
             for tx in income_transactions:
-                # Handle both tuple and dictionary formats
-                if isinstance(tx, dict):
-                    date = tx['date']
-                    name = tx['name']
-                    price = tx['price_in_dollar']  # Database returns price_in_dollar
-                    is_usd = tx.get('is_usd', True)  # Default to True if not present
-                    currency_rate = tx['your_currency_rate']
-                    source = tx.get('source', 'N/A')
-                else:
-                    # Skip tuples for now
-                    continue
-                
-                amount_usd = price if is_usd else price / currency_rate
-                amount_toman = price * currency_rate if is_usd else price
+                # Prices are stored in dollars
+                amount_usd = tx.price_in_dollar
+                amount_toman = tx.price_in_dollar * tx.your_currency_rate
                 
                 income_data.append([
-                    date,
-                    name,
+                    tx.date,
+                    tx.name,
                     f"${amount_usd:,.2f}",
                     f"{amount_toman:,.0f} T",
-                    source
+                    tx.source or 'N/A'
                 ])
             
             income_table = Table(income_data, colWidths=[1*inch, 2.5*inch, 1*inch, 1*inch, 1*inch])
@@ -241,27 +266,16 @@ def create_pdf_report(report_data: MonthlyReportData) -> bytes:
             expense_data = [['Date', 'Description', 'Amount (USD)', 'Amount (Toman)', 'Source']]
             
             for tx in expense_transactions:
-                # Handle both tuple and dictionary formats
-                if isinstance(tx, dict):
-                    date = tx['date']
-                    name = tx['name']
-                    price = tx['price_in_dollar']  # Database returns price_in_dollar
-                    is_usd = tx.get('is_usd', True)  # Default to True if not present
-                    currency_rate = tx['your_currency_rate']
-                    source = tx.get('source', 'N/A')
-                else:
-                    # Skip tuples for now
-                    continue
-                
-                amount_usd = price if is_usd else price / currency_rate
-                amount_toman = price * currency_rate if is_usd else price
+                # Prices are stored in dollars
+                amount_usd = tx.price_in_dollar
+                amount_toman = tx.price_in_dollar * tx.your_currency_rate
                 
                 expense_data.append([
-                    date,
-                    name,
+                    tx.date,
+                    tx.name,
                     f"${amount_usd:,.2f}",
                     f"{amount_toman:,.0f} T",
-                    source
+                    tx.source or 'N/A'
                 ])
             
             expense_table = Table(expense_data, colWidths=[1*inch, 2.5*inch, 1*inch, 1*inch, 1*inch])
@@ -294,7 +308,7 @@ def create_pdf_report(report_data: MonthlyReportData) -> bytes:
 async def get_monthly_report_pdf(
     month: int = Query(..., ge=1, le=12, description="Month (1-12)"),
     year: int = Query(..., ge=2020, le=2030, description="Year"),
-    current_user: dict = Depends(get_current_user)
+    current_user: UserRow = Depends(get_current_user)
 ):
     """
     Generate a comprehensive monthly PDF report including:
@@ -302,11 +316,12 @@ async def get_monthly_report_pdf(
     - Detailed transaction list (income and expenses) for the selected month
     """
     try:
-        # Create report data
-        report_data = MonthlyReportData(current_user[0], month, year)
+        # Create report data (queries and the exchange rate lookup block, so
+        # they run on the database thread pool)
+        report_data = await run_in_db_executor(MonthlyReportData, current_user.id, month, year)
         
         # Generate PDF
-        pdf_content = create_pdf_report(report_data)
+        pdf_content = await run_in_db_executor(create_pdf_report, report_data)
         
         # Return PDF as response
         filename = f"monthly_report_{year}_{month:02d}.pdf"
@@ -320,28 +335,59 @@ async def get_monthly_report_pdf(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generating report: {str(e)}")
 
+def iter_monthly_summary(report_data: MonthlyReportData):
+    """NDJSON lines for a monthly summary: a header, one line per transaction, then the totals"""
+    yield {
+        "month": report_data.month,
+        "year": report_data.year,
+        "exchange_rate": report_data.exchange_rate
+    }
+    totals = report_data.new_totals()
+    count = 0
+    for tx in report_data.iter_transactions():
+        report_data.add_to_totals(totals, tx)
+        count += 1
+        yield {"transaction": tx._asdict()}
+    yield {"summary": totals, "transaction_count": count}
+
+def build_monthly_summary(report_data: MonthlyReportData, include_transactions: bool = True) -> Dict[str, Any]:
+    """JSON summary of a month: totals, per-category breakdown and optionally the transactions"""
+    summary = {
+        "month": report_data.month,
+        "year": report_data.year,
+        "exchange_rate": report_data.exchange_rate,
+        "summary": report_data.get_totals(),
+        "by_category": report_data.get_category_breakdown(),
+        "transaction_count": report_data.get_transaction_count()
+    }
+    if include_transactions:
+        transactions = report_data.get_transactions()
+        # Market value on the day next to the rate each transaction was posted at (None without rate history)
+        toman = report_data.toman_at_dates(transactions) if transactions else []
+        summary["transactions"] = [
+            {**tx._asdict(), "toman_at_date": None if math.isnan(amount) else round(float(amount), 2)}
+            for tx, amount in zip(transactions, toman)
+        ]
+    return summary
+
 @router.get("/monthly-summary")
 async def get_monthly_summary(
+    request: Request,
     month: int = Query(..., ge=1, le=12, description="Month (1-12)"),
     year: int = Query(..., ge=2020, le=2030, description="Year"),
-    current_user: dict = Depends(get_current_user)
+    stream: bool = Query(False, description="Stream as NDJSON: header, transactions, then summary"),
+    include_transactions: bool = Query(True, description="Include the month's transactions (totals come from aggregates either way)"),
+    current_user: UserRow = Depends(get_current_user)
 ):
     """
     Get a JSON summary of monthly transaction data (for API testing or quick preview)
     """
     try:
-        report_data = MonthlyReportData(current_user[0], month, year)
-        transactions = report_data.get_transactions()
-        totals = report_data.calculate_totals(transactions)
-        
-        return {
-            "month": month,
-            "year": year,
-            "exchange_rate": report_data.exchange_rate,
-            "summary": totals,
-            "transaction_count": len(transactions),
-            "transactions": transactions
-        }
+        report_data = await run_in_db_executor(MonthlyReportData, current_user.id, month, year)
+        if wants_ndjson(request, stream):
+            return ndjson_response(iter_monthly_summary(report_data))
+
+        return await run_in_db_executor(build_monthly_summary, report_data, include_transactions)
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generating summary: {str(e)}")
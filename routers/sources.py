@@ -1,9 +1,9 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Query
-from typing import List
+from typing import List, Optional
 from pydantic import BaseModel
-from modules.database import Database
+from modules.async_database import AsyncDatabase
 from routers.users import get_current_user
-from modules.currency_exchange import CurrencyExchange
+from modules.currency_exchange import get_currency_exchange
 
 # Create router
 router = APIRouter()
@@ -29,25 +29,31 @@ class SourceResponse(BaseModel):
 class TotalSourceResponse(BaseModel):
     total_usd: float
 
+class SourceBalance(BaseModel):
+    source_id: int
+    date: Optional[str]
+    usd: bool
+    balance: float
+
 # Dependency
 def get_db():
-    return Database()
+    return AsyncDatabase()
 
 # API routes
 @router.get("/api/sources", response_model=List[Source])
 async def get_sources(
     current_user = Depends(get_current_user),
-    db: Database = Depends(get_db)
+    db: AsyncDatabase = Depends(get_db)
 ):
     """Get all sources for the current user"""
-    sources = db.get_all_sources(current_user[0])  # current_user[0] is the user_id
+    sources = await db.get_all_sources(current_user.id)
     return [
         {
-            "id": src[0],
-            "name": src[1],
-            "bank": bool(src[2]),
-            "usd": bool(src[3]),
-            "value": src[4]
+            "id": src.id,
+            "name": src.name,
+            "bank": bool(src.bank),
+            "usd": bool(src.usd),
+            "value": src.value
         }
         for src in sources
     ]
@@ -56,12 +62,12 @@ async def get_sources(
 async def add_source(
     source: SourceCreate,
     current_user = Depends(get_current_user),
-    db: Database = Depends(get_db)
+    db: AsyncDatabase = Depends(get_db)
 ):
     """Add a new source"""
     try:
-        source_id = db.add_source(
-            user_id=current_user[0],  # Add user_id here
+        source_id = await db.add_source(
+            user_id=current_user.id,
             name=source.name,
             bank=source.bank,
             usd=source.usd,
@@ -79,22 +85,35 @@ async def add_source(
 async def get_total_source(
     usd: bool = Query(True, description="If true, return total in USD. If false, return in Toman."),
     current_user = Depends(get_current_user),
-    db: Database = Depends(get_db)
+    db: AsyncDatabase = Depends(get_db)
 ):
     """Get the total of all sources for the current user, converted to USD if needed."""
-    sources = db.get_all_sources(current_user[0])
+    sources = await db.get_all_sources(current_user.id)
     if not sources:
         return {"total_usd": 0.0}
-    exchange = CurrencyExchange()
-    rate = exchange.get_usd_rate(live=False)
+    rate = get_currency_exchange().get_usd_rate(live=False)
     if not rate:
         raise HTTPException(status_code=503, detail="Failed to fetch exchange rate")
     total_usd = 0.0
     for src in sources:
-        is_usd = bool(src[3])
-        value = src[4]
+        is_usd = bool(src.usd)
+        value = src.value
         if is_usd:
             total_usd += value
         else:
             total_usd += value / rate
-    return {"total_usd": round(total_usd, 2)} 
\ No newline at end of file
+    return {"total_usd": round(total_usd, 2)} 
+
+@router.get("/api/sources/{source_id}/balance", response_model=SourceBalance)
+async def get_source_balance(
+    source_id: int,
+    date: Optional[str] = Query(None, pattern=r"^\d{4}-\d{2}-\d{2}$", description="Balance at the end of this date (YYYY-MM-DD); omit for the current balance"),
+    current_user = Depends(get_current_user),
+    db: AsyncDatabase = Depends(get_db)
+):
+    """Get a source's balance derived from its ledger, now or as of a past date"""
+    source = await db.get_source_by_id(source_id)
+    if not source or source.user_id != current_user.id:
+        raise HTTPException(status_code=404, detail="Source not found")
+    balance = await db.balance_as_of(source_id, date)
+    return {"source_id": source_id, "date": date, "usd": bool(source.usd), "balance": balance}
@@ -1,9 +1,15 @@
-from fastapi import APIRouter, Depends, HTTPException, Body, Query, status
-from typing import List, Optional, Dict, Any
+from fastapi import APIRouter, Depends, HTTPException, Body, Query, Request, status
+from fastapi.concurrency import run_in_threadpool
+from typing import List, Optional, Dict, Any, Union
 from pydantic import BaseModel, Field
 from datetime import date, datetime
-from modules.database import Database
+import json
+from modules.async_database import AsyncDatabase
+from modules.database import TransactionRow
 from routers.users import get_current_user
+from modules.streaming import wants_ndjson, ndjson_response
+from modules.transaction_io import read_csv_rows
+from pydantic import ValidationError
 
 # Create router
 router = APIRouter()
@@ -22,6 +28,14 @@ class Transaction(BaseModel):
     source: Optional[str] = None
     is_deposit: Optional[bool] = None
 
+class TransactionCursor(BaseModel):
+    before_date: str
+    before_id: int
+
+class TransactionPage(BaseModel):
+    items: List[Transaction]
+    next_cursor: Optional[TransactionCursor] = None
+
 class TransactionCreate(BaseModel):
     name: str
     date: str
@@ -39,6 +53,20 @@ class IncomeCreate(BaseModel):
     source_name: str
     is_deposit: bool = True
 
+class TransactionImportRow(BaseModel):
+    date: str = Field(..., pattern=r"^\d{4}-\d{2}-\d{2}$")
+    name: str = Field(..., min_length=1)
+    price: float = Field(..., ge=0)
+    is_usd: bool = False
+    category: Optional[str] = None
+    source: str
+    is_deposit: bool = False
+    your_currency_rate: Optional[float] = Field(None, gt=0)
+
+class ImportResult(BaseModel):
+    imported: int
+    message: str
+
 class TransactionResponse(BaseModel):
     id: int
     message: str
@@ -67,9 +95,12 @@ class TransactionUpdate(BaseModel):
     your_currency_rate: float
     is_deposit: bool
 
+MAX_IMPORT_ROWS = 200_000
+MAX_REPORTED_IMPORT_ERRORS = 100
+
 # Create dependency functions that will be injected at runtime
 def get_db():
-    return Database()
+    return AsyncDatabase()
 
 def get_exchange_dependency():
     from main import get_exchange
@@ -79,40 +110,79 @@ def get_parser_dependency():
     from main import get_parser
     return get_parser()
 
+def _transaction_to_dict(transaction: TransactionRow, categories, sources):
+    return {
+        "id": transaction.id,
+        "name": transaction.name,
+        "date": transaction.date,
+        "price": transaction.price_in_dollar,
+        "your_currency_rate": transaction.your_currency_rate,
+        "is_usd": True,  # prices are stored in dollars
+        "category_id": transaction.category_id,
+        "source_id": transaction.source_id,
+        "category": categories.get(transaction.category_id, ""),
+        "source": sources.get(transaction.source_id, ""),
+        "is_deposit": bool(transaction.is_deposit)
+    }
+
+async def _names_by_id(db, user_id):
+    """Map category and source IDs to names for serializing transactions"""
+    categories = {cat.id: cat.name for cat in await db.get_all_categories()}
+    sources = {src.id: src.name for src in await db.get_all_sources(user_id)}
+    return categories, sources
+
 # API routes
-@router.get("/api/transactions", response_model=List[Transaction])
+@router.get("/api/transactions", response_model=Union[TransactionPage, List[Transaction]])
 async def get_transactions(
+    request: Request,
     month: Optional[int] = Query(None, ge=1, le=12),
+    limit: Optional[int] = Query(None, ge=1, le=500, description="Page size; enables cursor pagination"),
+    before_date: Optional[str] = Query(None, description="Cursor: return transactions older than this date"),
+    before_id: Optional[int] = Query(None, description="Cursor: tie-breaker ID for transactions on before_date"),
+    stream: bool = Query(False, description="Stream the full listing as NDJSON"),
     current_user = Depends(get_current_user),
-    db: Database = Depends(get_db)
+    db: AsyncDatabase = Depends(get_db)
 ):
-    """Get all transactions for the current user, optionally filtered by month"""
-    transactions = db.get_all_transactions(current_user[0], month)  # Pass month to DB
+    """Get transactions for the current user, optionally filtered by month.
+
+    Without ``limit`` the full (or monthly) list is returned as before. With
+    ``limit`` the response is one page, newest first, plus a ``next_cursor``
+    to pass back as ``before_date``/``before_id`` for the following page.
+    With ``stream=1`` (or ``Accept: application/x-ndjson``) the listing is
+    streamed one JSON object per line straight from the database cursor;
+    streaming and ``limit`` are mutually exclusive.
+    """
+    if before_id is not None and before_date is None:
+        raise HTTPException(status_code=400, detail="before_id requires before_date")
+    if limit is None and before_date is not None:
+        raise HTTPException(status_code=400, detail="Cursor parameters require limit")
+    if limit is not None and wants_ndjson(request, stream):
+        raise HTTPException(status_code=400, detail="Streaming cannot be combined with limit")
+
     # Fetch all categories and sources for mapping
-    categories = {cat[0]: cat[1] for cat in db.get_all_categories()}
-    sources = {src[0]: src[1] for src in db.get_all_sources(current_user[0])}
-    return [
-        {
-            "id": transaction[0],
-            "name": transaction[1],
-            "date": transaction[2],
-            "price": transaction[3],
-            "your_currency_rate": transaction[4],
-            "is_usd": bool(sources.get(transaction[6], False)),  # fallback if source not found
-            "category_id": transaction[5],
-            "source_id": transaction[6],
-            "category": categories.get(transaction[5], ""),
-            "source": sources.get(transaction[6], ""),
-            "is_deposit": bool(transaction[7]) if len(transaction) > 7 else False
-        }
-        for transaction in transactions
-    ]
+    categories, sources = await _names_by_id(db, current_user.id)
+
+    if wants_ndjson(request, stream):
+        transactions = db.iter_transactions(current_user.id, month)
+        return ndjson_response(_transaction_to_dict(transaction, categories, sources) for transaction in transactions)
+
+    if limit is None:
+        transactions = await db.get_all_transactions(current_user.id, month)  # Pass month to DB
+        return [_transaction_to_dict(transaction, categories, sources) for transaction in transactions]
+
+    transactions, next_cursor = await db.get_transactions_page(
+        current_user.id, limit, before_date=before_date, before_id=before_id, month=month
+    )
+    return {
+        "items": [_transaction_to_dict(transaction, categories, sources) for transaction in transactions],
+        "next_cursor": {"before_date": next_cursor[0], "before_id": next_cursor[1]} if next_cursor else None
+    }
 
 @router.post("/api/add_transaction", response_model=Transaction)
 async def create_transaction(
     transaction: TransactionCreate,
     current_user = Depends(get_current_user),
-    db: Database = Depends(get_db),
+    db: AsyncDatabase = Depends(get_db),
     exchange=Depends(get_exchange_dependency)
 ):
     """Create a new transaction"""
@@ -129,8 +199,8 @@ async def create_transaction(
         price_in_dollar = transaction.price / usd_rate
         your_currency_rate = usd_rate
 
-    transaction_id = db.add_transaction(
-        user_id=current_user[0],
+    transaction_id = await db.add_transaction(
+        user_id=current_user.id,
         name=transaction.name,
         date=transaction.date,
         price_in_dollar=price_in_dollar,
@@ -147,32 +217,19 @@ async def create_transaction(
         )
     
     # Get the created transaction
-    transaction_data = db.get_transaction_by_id(transaction_id)
-    # Fetch all categories and sources for mapping
-    categories = {cat[0]: cat[1] for cat in db.get_all_categories()}
-    sources = {src[0]: src[1] for src in db.get_all_sources(current_user[0])}
-    return {
-        "id": transaction_data[0],
-        "name": transaction_data[1],
-        "date": transaction_data[2],
-        "price": transaction_data[3],
-        "is_usd": bool(transaction_data[4]),
-        "category_id": transaction_data[5],
-        "source_id": transaction_data[6],
-        "category": categories.get(transaction_data[5], ""),
-        "source": sources.get(transaction_data[6], ""),
-        "your_currency_rate": transaction_data[4]
-    }
+    transaction_data = await db.get_transaction_by_id(transaction_id)
+    categories, sources = await _names_by_id(db, current_user.id)
+    return _transaction_to_dict(transaction_data, categories, sources)
 
 @router.delete("/api/transactions/{transaction_id}")
 async def delete_transaction(
     transaction_id: int,
     current_user = Depends(get_current_user),
-    db: Database = Depends(get_db)
+    db: AsyncDatabase = Depends(get_db)
 ):
     """Delete a transaction"""
     # Check if transaction exists and belongs to user
-    transaction = db.get_transaction_by_id(transaction_id)
+    transaction = await db.get_transaction_by_id(transaction_id)
     if not transaction:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -180,7 +237,7 @@ async def delete_transaction(
         )
     
     # Delete the transaction
-    if not db.delete_transaction(transaction_id, current_user[0]):
+    if not await db.delete_transaction(transaction_id, current_user.id):
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Failed to delete transaction"
@@ -192,12 +249,12 @@ async def delete_transaction(
 async def add_income(
     income: IncomeCreate,
     current_user = Depends(get_current_user),
-    db: Database = Depends(get_db),
+    db: AsyncDatabase = Depends(get_db),
     exchange=Depends(get_exchange_dependency)
 ):
     """Add income to a source"""
     # Get category ID
-    categories = {cat[1].lower(): cat[0] for cat in db.get_all_categories()}
+    categories = {cat.name.lower(): cat.id for cat in await db.get_all_categories()}
     category_name = income.category_name.lower()
     
     if category_name not in categories:
@@ -207,7 +264,7 @@ async def add_income(
         category_id = categories[category_name]
     
     # Get source ID
-    sources = {src[1].lower(): src[0] for src in db.get_all_sources(current_user[0])}
+    sources = {src.name.lower(): src.id for src in await db.get_all_sources(current_user.id)}
     source_name = income.source_name.lower()
     
     if source_name not in sources:
@@ -225,8 +282,8 @@ async def add_income(
     
     # Add transaction to database
     try:
-        tx_id = db.add_transaction(
-            user_id=current_user[0],
+        tx_id = await db.add_transaction(
+            user_id=current_user.id,
             name=income.name,
             date=income.date,
             price_in_dollar=price_in_dollar,  # Negative for income
@@ -241,6 +298,99 @@ async def add_income(
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def _read_import_rows(data, is_csv):
+    """Decode an import body (bytes) into its raw rows: CSV records or a JSON array"""
+    try:
+        if is_csv:
+            return read_csv_rows(data.decode("utf-8-sig"))
+        return json.loads(data)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise HTTPException(status_code=400, detail=f"Could not read import data: {e}")
+
+def _resolve_import_rows(raw_rows, categories, sources, exchange):
+    """Validate raw import rows and resolve their names and rates.
+
+    Returns (rows for bulk_add_transactions, errors). CPU-bound for large
+    imports, so it runs in a worker thread rather than on the event loop.
+    """
+    default_category_id = categories.get('other')
+    usd_rate = None
+    rows = []
+    errors = []
+    for index, raw_row in enumerate(raw_rows, start=1):
+        try:
+            row = TransactionImportRow.model_validate(raw_row)
+        except ValidationError as e:
+            errors.append({"row": index, "error": "; ".join(
+                f"{'.'.join(str(part) for part in err['loc'])}: {err['msg']}" for err in e.errors()
+            )})
+            continue
+
+        source_id = sources.get(row.source.lower())
+        if source_id is None:
+            errors.append({"row": index, "error": f"Source not found: {row.source}"})
+            continue
+        # Use 'other' category if not found
+        category_id = categories.get((row.category or '').lower(), default_category_id)
+
+        rate = row.your_currency_rate
+        if rate is None:
+            if usd_rate is None:
+                usd_rate = exchange.get_usd_rate(live=False)
+                if usd_rate is None:
+                    raise HTTPException(status_code=503, detail="Failed to fetch exchange rate")
+            rate = usd_rate
+        price_in_dollar = row.price if row.is_usd else row.price / rate
+        rows.append((row.name, row.date, price_in_dollar, rate, category_id, source_id, row.is_deposit))
+    return rows, errors
+
+@router.post("/api/transactions/import", response_model=ImportResult)
+async def import_transactions(
+    request: Request,
+    current_user = Depends(get_current_user),
+    db: AsyncDatabase = Depends(get_db),
+    exchange=Depends(get_exchange_dependency)
+):
+    """Bulk-import transactions from a JSON array or a CSV file.
+
+    Accepts ``application/json`` (an array of rows), ``text/csv`` (raw body) or
+    a multipart upload with a ``file`` field. Columns: date, name, price,
+    is_usd, category, source, is_deposit and optional your_currency_rate.
+    Every row is validated before anything is written; then all rows are
+    inserted in one transaction with one balance update per source.
+    """
+    content_type = request.headers.get("content-type", "")
+    if content_type.startswith("multipart/form-data"):
+        form = await request.form()
+        upload = form.get("file")
+        if upload is None or isinstance(upload, str):
+            raise HTTPException(status_code=400, detail="Missing 'file' upload")
+        data, is_csv = await upload.read(), True
+    else:
+        data, is_csv = await request.body(), "csv" in content_type
+    # Decoding and validating up to MAX_IMPORT_ROWS rows would stall the event loop
+    raw_rows = await run_in_threadpool(_read_import_rows, data, is_csv)
+
+    if not isinstance(raw_rows, list) or not raw_rows:
+        raise HTTPException(status_code=400, detail="Expected a non-empty list of transactions")
+    if len(raw_rows) > MAX_IMPORT_ROWS:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_IMPORT_ROWS} rows can be imported at once")
+
+    # Resolve category and source names once for the whole import
+    categories = {cat.name.lower(): cat.id for cat in await db.get_all_categories()}
+    sources = {src.name.lower(): src.id for src in await db.get_all_sources(current_user.id)}
+    rows, errors = await run_in_threadpool(_resolve_import_rows, raw_rows, categories, sources, exchange)
+
+    if errors:
+        raise HTTPException(status_code=422, detail={
+            "message": "Import rejected; no transactions were added",
+            "error_count": len(errors),
+            "errors": errors[:MAX_REPORTED_IMPORT_ERRORS]
+        })
+
+    imported = await db.bulk_add_transactions(current_user.id, rows)
+    return {"imported": imported, "message": f"Imported {imported} transactions"}
+
 class TransactionText(BaseModel):
     text: str
 
@@ -258,16 +408,17 @@ async def parse_transaction(
     
     try:
         # Get available categories and sources for the parser
-        db = Database()
-        categories = [cat[1] for cat in db.get_all_categories()]  # Get category names
-        sources = [src[1] for src in db.get_all_sources(current_user[0])]  # Get source names
+        db = AsyncDatabase()
+        categories = [cat.name for cat in await db.get_all_categories()]
+        sources = [src.name for src in await db.get_all_sources(current_user.id)]
         
         # Update parser with available categories and sources
         parser.available_categories = categories
         parser.available_sources = sources
         
         # Parse the transaction
-        transaction = parser.parse_transaction(text)
+        # The parser calls out to the LLM; keep that off the event loop
+        transaction = await run_in_threadpool(parser.parse_transaction, text)
         return transaction.dict()
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -291,11 +442,11 @@ async def update_transaction(
     transaction_id: int,
     update: TransactionUpdate = Body(...),
     current_user = Depends(get_current_user),
-    db: Database = Depends(get_db)
+    db: AsyncDatabase = Depends(get_db)
 ):
     # Check if transaction exists and belongs to user
-    transaction = db.get_transaction_by_id(transaction_id)
-    if not transaction or transaction[8] != current_user[0]:  # assuming user_id is at index 8
+    transaction = await db.get_transaction_by_id(transaction_id)
+    if not transaction or transaction.user_id != current_user.id:
         raise HTTPException(status_code=404, detail="Transaction not found or not owned by user")
 
     # Convert to USD if needed
@@ -304,7 +455,7 @@ async def update_transaction(
     else:
         price_in_dollar = update.price / update.your_currency_rate if update.your_currency_rate else update.price
 
-    updated = db.update_transaction(
+    updated = await db.update_transaction(
         transaction_id=transaction_id,
         name=update.name,
         date=update.date,
@@ -317,19 +468,6 @@ async def update_transaction(
     )
     if not updated:
         raise HTTPException(status_code=500, detail="Failed to update transaction")
-    transaction_data = db.get_transaction_by_id(transaction_id)
-    categories = {cat[0]: cat[1] for cat in db.get_all_categories()}
-    sources = {src[0]: src[1] for src in db.get_all_sources(current_user[0])}
-    return {
-        "id": transaction_data[0],
-        "name": transaction_data[1],
-        "date": transaction_data[2],
-        "price": transaction_data[3],
-        "your_currency_rate": transaction_data[4],
-        "is_usd": update.is_usd,  # return what user sent
-        "category_id": transaction_data[5],
-        "source_id": transaction_data[6],
-        "category": categories.get(transaction_data[5], ""),
-        "source": sources.get(transaction_data[6], ""),
-        "is_deposit": bool(transaction_data[7]) if len(transaction_data) > 7 else False
-    } 
\ No newline at end of file
+    transaction_data = await db.get_transaction_by_id(transaction_id)
+    categories, sources = await _names_by_id(db, current_user.id)
+    return _transaction_to_dict(transaction_data, categories, sources) 
\ No newline at end of file
@@ -1,20 +1,42 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Form
+from fastapi import APIRouter, Depends, HTTPException, status, Form, Request
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from pydantic import BaseModel, EmailStr
 from typing import Optional
 from datetime import datetime, timedelta
-from modules.database import Database
+import os
+from modules.async_database import AsyncDatabase
+from modules.database import UserRow
+from modules.cache import TTLCache
+from modules.login_throttle import check_login, record_attempt, user_throttle
+from modules.password_pool import get_password_hash_async, verify_password_async
 from modules.auth import (
-    verify_password,
-    get_password_hash,
     create_access_token,
+    create_refresh_token,
+    hash_refresh_token,
     verify_token,
     ACCESS_TOKEN_EXPIRE_MINUTES
 )
+import uuid
 
 router = APIRouter()
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/token")
 
+# Verified tokens and their users, so authenticated requests skip the JWT
+# decode and the user lookup. An entry lives until the token expires, at most
+# USER_CACHE_TTL_SECONDS, which bounds how long other processes can serve a
+# user changed elsewhere.
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "4096"))
+USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", "60"))
+user_cache = TTLCache(USER_CACHE_SIZE, USER_CACHE_TTL_SECONDS)
+
+def invalidate_cached_user(username: str) -> int:
+    """Drop the cached tokens of a user; call after changing or deleting the user"""
+    return user_cache.invalidate(lambda entry: entry[1].username == username)
+
+def user_cache_stats():
+    """Size and hit/miss counters of the token-to-user cache"""
+    return user_cache.stats()
+
 # Models
 class UserCreate(BaseModel):
     username: str
@@ -29,56 +51,101 @@ class User(BaseModel):
 class Token(BaseModel):
     access_token: str
     token_type: str
+    refresh_token: Optional[str] = None
+    expires_in: Optional[int] = None
+
+class RefreshRequest(BaseModel):
+    refresh_token: str
 
 class TokenData(BaseModel):
     username: Optional[str] = None
 
 # Dependency
 def get_db():
-    return Database()
+    return AsyncDatabase()
 
 # Helper function to get current user
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Database = Depends(get_db)):
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncDatabase = Depends(get_db)) -> UserRow:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
     
+    cached = user_cache.get(token)
+    if cached is not None:
+        return cached[1]
+    
     payload = verify_token(token)
     username: str = payload.get("sub")
     if username is None:
         raise credentials_exception
     
-    user = db.get_user_by_username(username)
+    user = await db.get_user_by_username(username)
     if user is None:
         raise credentials_exception
     
+    user_cache.set(token, (payload, user), expires_at=payload.get("exp"))
     return user
 
+def client_ip(request: Request) -> str:
+    """Address of the client; behind the proxies, uvicorn's --proxy-headers has resolved it"""
+    return request.client.host if request.client else "unknown"
+
+def check_login_throttle(request: Request, username: Optional[str] = None):
+    """Refuse with 429 when the client IP or the username has too many recent failures"""
+    retry_after = check_login(client_ip(request), username)
+    if retry_after:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many login attempts, try again later",
+            headers={"Retry-After": str(int(retry_after) + 1)},
+        )
+
+async def issue_tokens(db: AsyncDatabase, user: UserRow) -> dict:
+    """Access token plus the first refresh token of a new session"""
+    refresh_token, token_hash, expires_at = create_refresh_token()
+    await db.add_refresh_token(user.id, token_hash, uuid.uuid4().hex, expires_at)
+    return token_response(user.username, refresh_token)
+
+def token_response(username: str, refresh_token: str) -> dict:
+    access_token = create_access_token(
+        data={"sub": username},
+        expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    )
+    return {
+        "access_token": access_token,
+        "token_type": "bearer",
+        "refresh_token": refresh_token,
+        "expires_in": ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+    }
+
 # Routes
 @router.post("/api/register", response_model=User)
-def register_user(user: UserCreate, db: Database = Depends(get_db)):
+async def register_user(user: UserCreate, request: Request, db: AsyncDatabase = Depends(get_db)):
     """Register a new user"""
+    check_login_throttle(request)
+    record_attempt(client_ip(request))
+    
     # Check if username exists
-    if db.get_user_by_username(user.username):
+    if await db.get_user_by_username(user.username):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Username already registered"
         )
     
     # Check if email exists
-    if db.get_user_by_email(user.email):
+    if await db.get_user_by_email(user.email):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Email already registered"
         )
     
     # Create user
-    user_id = db.add_user(
+    user_id = await db.add_user(
         username=user.username,
         email=user.email,
-        password_hash=get_password_hash(user.password)
+        password_hash=await get_password_hash_async(user.password)
     )
     
     if not user_id:
@@ -88,44 +155,66 @@ def register_user(user: UserCreate, db: Database = Depends(get_db)):
         )
     
     # Return user data
-    user_data = db.get_user_by_id(user_id)
+    user_data = await db.get_user_by_id(user_id)
     return {
-        "id": user_data[0],
-        "username": user_data[1],
-        "email": user_data[2],
+        "id": user_data.id,
+        "username": user_data.username,
+        "email": user_data.email,
     }
 
 @router.post("/api/token", response_model=Token)
 async def login_for_access_token(
+    request: Request,
     form_data: OAuth2PasswordRequestForm = Depends(),
-    db: Database = Depends(get_db)
+    db: AsyncDatabase = Depends(get_db)
 ):
-    """Login user and return JWT token"""
-    user = db.get_user_by_username(form_data.username)
-    if not user or not verify_password(form_data.password, user[3]):
+    """Login user and return a JWT access token and a refresh token"""
+    # Throttled attempts are refused before any bcrypt work
+    username = form_data.username.lower()
+    check_login_throttle(request, username)
+    
+    user = await db.get_user_by_username(form_data.username)
+    # bcrypt is deliberately slow; verify on its own bounded thread pool
+    if not user or not await verify_password_async(form_data.password, user.password_hash):
+        record_attempt(client_ip(request), username)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = create_access_token(
-        data={"sub": user[1]},
-        expires_delta=access_token_expires
-    )
-    
-    return {
-        "access_token": access_token,
-        "token_type": "bearer"
-    }
+    user_throttle.reset(username)
+    return await issue_tokens(db, user)
+
+@router.post("/api/token/refresh", response_model=Token)
+async def refresh_access_token(body: RefreshRequest, db: AsyncDatabase = Depends(get_db)):
+    """Exchange a refresh token for a new access token and a new refresh token.
+
+    The presented refresh token is used up; presenting it again revokes the
+    whole session.
+    """
+    refresh_token, token_hash, expires_at = create_refresh_token()
+    user_id = await db.rotate_refresh_token(hash_refresh_token(body.refresh_token), token_hash, expires_at)
+    user = await db.get_user_by_id(user_id) if user_id is not None else None
+    if user is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid or expired refresh token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return token_response(user.username, refresh_token)
+
+@router.post("/api/token/revoke")
+async def revoke_refresh_token(body: RefreshRequest, db: AsyncDatabase = Depends(get_db)):
+    """Log out: revoke the session a refresh token belongs to"""
+    return {"revoked": await db.revoke_refresh_token(hash_refresh_token(body.refresh_token))}
 
 @router.get("/api/me", response_model=User)
 async def read_users_me(current_user = Depends(get_current_user)):
     """Get current user information"""
     return {
-        "id": current_user[0],
-        "username": current_user[1],
-        "email": current_user[2],
-        "created_at": current_user[4]
+        "id": current_user.id,
+        "username": current_user.username,
+        "email": current_user.email,
+        "created_at": current_user.created_at
     }
\ No newline at end of file
@@ -0,0 +1,21 @@
+from modules.sharding import split_database, PER_USER
+import argparse
+
+def main():
+    """Split a single-file database into a catalog and per-user shard files"""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("source", help="existing database file (only read)")
+    parser.add_argument("catalog", help="new catalog file to create, e.g. sharded/money_tracker.db")
+    parser.add_argument("--shards", default="8", help=f"number of shard files, or '{PER_USER}' for one file per user")
+    parser.add_argument("--shard-dir", help="directory of the shard files (default: next to the catalog)")
+    args = parser.parse_args()
+
+    print(f"Splitting {args.source} into {args.catalog} ({args.shards} shards)...")
+    copied = split_database(args.source, args.catalog, args.shards, args.shard_dir)
+    for table, rows in copied.items():
+        print(f"  {table}: {rows} rows")
+    print(f"Done. Run with DATABASE_URL={args.catalog} DB_SHARDS={args.shards}"
+          + (f" DB_SHARD_DIR={args.shard_dir}" if args.shard_dir else ""))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+"""
+Shared fixtures. The `db` fixture runs each test against every storage
+backend: SQLite always, PostgreSQL when TEST_POSTGRES_DSN points at a server
+(e.g. the docker-compose postgres service) whose user may create databases.
+"""
+import os
+import uuid
+import pytest
+from modules.connection_pool import close_pool
+from modules.database import Database
+
+POSTGRES_DSN = os.getenv("TEST_POSTGRES_DSN")
+
+
+@pytest.fixture(params=["sqlite", "postgres"])
+def db(request, tmp_path):
+    if request.param == "sqlite":
+        db = Database(str(tmp_path / "test.db"))
+        db.create_tables()
+        yield db
+        close_pool(db.db_name)
+        return
+
+    if not POSTGRES_DSN:
+        pytest.skip("set TEST_POSTGRES_DSN to run against PostgreSQL")
+    psycopg = pytest.importorskip("psycopg")
+    from modules.postgres_database import PostgresDatabase
+
+    # A throwaway database per test, dropped afterwards
+    name = f"money_tracker_test_{uuid.uuid4().hex[:12]}"
+    with psycopg.connect(POSTGRES_DSN, autocommit=True) as admin:
+        admin.execute(f'CREATE DATABASE "{name}"')
+    db = PostgresDatabase(psycopg.conninfo.make_conninfo(POSTGRES_DSN, dbname=name))
+    try:
+        db.create_tables()
+        yield db
+    finally:
+        close_pool(db.db_name)
+        with psycopg.connect(POSTGRES_DSN, autocommit=True) as admin:
+            admin.execute(f'DROP DATABASE IF EXISTS "{name}" WITH (FORCE)')
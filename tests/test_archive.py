@@ -0,0 +1,83 @@
+"""
+Transaction archive tests: moving closed years to yearly files must leave
+every read (listings, pages, streams, balances, aggregates) unchanged, and
+the hot table must only hold the open years.
+"""
+from datetime import date
+import pytest
+from modules.archive import archive_closed_years, archive_path, archive_year
+from modules.connection_pool import close_all_pools
+from modules.database import Database
+
+RATE = 2.0
+
+
+@pytest.fixture
+def history(tmp_path):
+    db = Database(str(tmp_path / "archive.db"))
+    db.create_tables()
+    user_id = db.add_user("alice", "alice@example.com", "hash")
+    category_id = db.add_category("food")
+    source_id = db.add_source("wallet", False, False, 1000.0, user_id)
+    current = date.today().year
+    for year in (2020, 2021, current):
+        for month in (1, 6, 12):
+            db.add_transaction("tx", f"{year}-{month:02d}-05", 1.0, RATE, category_id, source_id, user_id,
+                               is_deposit=month == 6)
+    yield db, user_id, category_id, source_id
+    close_all_pools()
+
+
+def snapshot(db, user_id, source_id):
+    pages, cursor = [], (None, None)
+    while cursor:
+        rows, cursor = db.get_transactions_page(user_id, 4, *cursor)
+        pages.extend(rows)
+    return {
+        "all": sorted(db.get_all_transactions(user_id)),
+        "pages": pages,
+        "month": db.get_transactions_by_month(user_id, 6, 2020),
+        "stream": list(db.iter_transactions_by_month(user_id, 12, 2021)),
+        "export": list(db.iter_export_rows("transactions", user_id)),
+        "balances": [db.balance_as_of(source_id, date) for date in ("2020-06-05", "2021-01-04", None)],
+        "aggregates": db.get_monthly_aggregates(user_id, 6, 2020),
+    }
+
+
+def test_archived_years_read_like_hot_ones(history):
+    db, user_id, _, source_id = history
+    before = snapshot(db, user_id, source_id)
+
+    assert archive_closed_years(db) == {2020: 3, 2021: 3}
+    with db.get_connection() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM transactions").fetchone()[0] == 3
+    assert snapshot(db, user_id, source_id) == before
+
+    db.rebuild_monthly_aggregates()
+    assert db.get_monthly_aggregates(user_id, 6, 2020) == before["aggregates"]
+    assert db.reconcile_source_balance(source_id) == 0
+
+
+def test_backdated_write_into_archived_year(history):
+    db, user_id, category_id, source_id = history
+    archive_year(db, 2020)
+
+    late_id = db.add_transaction("late", "2020-03-01", 5.0, RATE, category_id, source_id, user_id)
+    assert db.balance_as_of(source_id) == db.get_source_by_id(source_id).value
+    assert archive_year(db, 2020) == 1
+    assert db.get_transaction_by_id(late_id).name == "late"
+    assert len(db.get_transactions_by_date_range("2020-01-01", "2020-12-30")) == 4
+    assert db.reconcile_source_balance(source_id) == 0
+
+
+def test_open_year_is_not_archived(history):
+    db = history[0]
+    with pytest.raises(ValueError):
+        archive_year(db, date.today().year)
+
+
+def test_archives_sit_next_to_the_database(tmp_path, monkeypatch):
+    db_name = str(tmp_path / "data" / "money_tracker.db")
+    assert archive_path(db_name, 2020) == str(tmp_path / "data" / "money_tracker_archive" / "money_tracker_2020.db")
+    monkeypatch.setenv("DB_ARCHIVE_DIR", "cold")
+    assert archive_path(db_name, 2020) == str(tmp_path / "data" / "cold" / "money_tracker_2020.db")
@@ -0,0 +1,61 @@
+"""
+Async data-access tests: database calls awaited through AsyncDatabase must
+return the same results as Database and never stall the event loop.
+"""
+import asyncio
+import time
+from modules.async_database import AsyncDatabase, db_executor_stats
+
+SLOW_QUERY_SECONDS = 0.2
+MAX_LOOP_LAG_SECONDS = 0.05
+
+
+def test_async_calls_match_sync_results(db):
+    user_id = db.add_user("alice", "alice@example.com", "hash")
+    source_id = db.add_source("cash", False, True, 100.0, user_id)
+
+    async def main():
+        adb = AsyncDatabase(database=db)
+        category_id = await adb.add_category("food")
+        await adb.add_transaction("lunch", "1403-02-01", 5.0, 60000.0, category_id, source_id, user_id)
+        return await adb.get_all_transactions(user_id), await adb.get_all_sources(user_id)
+
+    transactions, sources = asyncio.run(main())
+    assert transactions == db.get_all_transactions(user_id)
+    assert sources == db.get_all_sources(user_id)
+    assert list(AsyncDatabase(database=db).iter_transactions(user_id)) == list(db.iter_transactions(user_id))
+
+
+def test_slow_queries_do_not_block_the_event_loop(db, monkeypatch):
+    user_id = db.add_user("alice", "alice@example.com", "hash")
+    original = db.get_all_sources
+
+    def slow_get_all_sources(user_id):
+        time.sleep(SLOW_QUERY_SECONDS)  # stands in for a slow month query
+        return original(user_id)
+
+    monkeypatch.setattr(db, "get_all_sources", slow_get_all_sources)
+
+    async def heartbeat(stop):
+        lag = 0.0
+        while not stop.is_set():
+            started = time.perf_counter()
+            await asyncio.sleep(0.005)
+            lag = max(lag, time.perf_counter() - started - 0.005)
+        return lag
+
+    async def main():
+        adb = AsyncDatabase(database=db)
+        stop = asyncio.Event()
+        beat = asyncio.create_task(heartbeat(stop))
+        # Mixed load: slow reads alongside fast reads and writes
+        await asyncio.gather(
+            *(adb.get_all_sources(user_id) for _ in range(4)),
+            *(adb.add_category(f"category {i}") for i in range(20)),
+            *(adb.get_user_by_id(user_id) for _ in range(20)),
+        )
+        stop.set()
+        return await beat
+
+    assert asyncio.run(main()) < MAX_LOOP_LAG_SECONDS
+    assert db_executor_stats()["peak_in_flight"] > 1
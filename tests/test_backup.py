@@ -0,0 +1,101 @@
+"""
+Online backup tests: a backup taken while writers keep committing must be a
+consistent snapshot, retention must keep the newest backups, and sharded
+databases must be backed up with every shard.
+"""
+import os
+import sqlite3
+import tarfile
+import threading
+import pytest
+from modules.backup import backup_file, create_backup, list_backups, stream_backup
+from modules.connection_pool import close_all_pools
+from modules.database import Database
+from modules.sharding import ShardedDatabase
+
+RATE = 2.0
+
+
+@pytest.fixture
+def ledger(tmp_path):
+    db = Database(str(tmp_path / "ledger.db"))
+    db.create_tables()
+    user_id = db.add_user("alice", "alice@example.com", "hash")
+    category_id = db.add_category("food")
+    source_id = db.add_source("wallet", False, True, 100000.0, user_id)
+    for day in range(1, 29):
+        for _ in range(50):
+            db.add_transaction("tx", f"1403-02-{day:02d}", 1.0, RATE, category_id, source_id, user_id)
+    yield db, user_id, category_id, source_id
+    close_all_pools()
+
+
+def test_backup_during_writes_is_consistent(ledger, tmp_path):
+    db, user_id, category_id, source_id = ledger
+    stop = threading.Event()
+
+    def write():
+        while not stop.is_set():
+            db.add_transaction("live", "1403-03-01", 1.0, RATE, category_id, source_id, user_id)
+
+    writer = threading.Thread(target=write)
+    writer.start()
+    try:
+        target = str(tmp_path / "copy.db")
+        assert backup_file(db.db_name, target, pages=4, sleep_ms=1) > 0
+    finally:
+        stop.set()
+        writer.join()
+
+    conn = sqlite3.connect(target)
+    try:
+        assert conn.execute("PRAGMA integrity_check").fetchone()[0] == "ok"
+        # The source balance and the transactions were copied as of the same moment
+        count = conn.execute("SELECT COUNT(*) FROM transactions").fetchone()[0]
+        value = conn.execute("SELECT value FROM sources WHERE id = ?", (source_id,)).fetchone()[0]
+        assert count >= 28 * 50
+        assert value == 100000.0 - count
+    finally:
+        conn.close()
+
+
+def test_retention_keeps_newest_backups(ledger, tmp_path):
+    db = ledger[0]
+    backup_dir = str(tmp_path / "backups")
+    paths = [create_backup(db, backup_dir, keep=2) for _ in range(4)]
+
+    assert list_backups(db, backup_dir) == [os.path.basename(path) for path in paths[-2:]]
+    assert os.listdir(paths[-1]) == ["ledger.db"]
+
+
+def test_stream_backup_of_a_single_file(ledger):
+    filename, chunks = stream_backup(ledger[0], chunk_bytes=4096)
+    data = b"".join(chunks)
+
+    assert filename.endswith(".db")
+    assert data.startswith(b"SQLite format 3\x00")
+
+
+def test_sharded_backup_includes_every_shard(tmp_path):
+    db = ShardedDatabase(str(tmp_path / "catalog.db"), shards=2)
+    db.create_tables()
+    try:
+        for name in ("alice", "bob"):
+            user_id = db.add_user(name, f"{name}@example.com", "hash")
+            db.add_source("wallet", False, True, 10.0, user_id)
+
+        filename, chunks = stream_backup(db)
+        tar_path = tmp_path / filename
+        tar_path.write_bytes(b"".join(chunks))
+        with tarfile.open(tar_path) as tar:
+            names = sorted(os.path.basename(name) for name in tar.getnames() if name.endswith(".db"))
+        assert names == sorted(["catalog.db"] + [os.path.basename(db.shard_path(key)) for key in db.shard_keys()])
+    finally:
+        close_all_pools()
+
+
+def test_backups_default_to_the_database_directory(ledger):
+    db = ledger[0]
+    path = create_backup(db, keep=1)
+    assert os.path.dirname(path) == os.path.join(os.path.dirname(os.path.abspath(db.db_name)), "backups")
+    assert list_backups(db) == [os.path.basename(path)]
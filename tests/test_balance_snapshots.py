@@ -0,0 +1,75 @@
+"""
+Balance snapshot tests: a source's balance derived from snapshots plus the
+ledger must match the stored running total, now and at earlier dates.
+"""
+from datetime import date, timedelta
+import pytest
+import modules.database as database
+
+
+def snapshot_dates(db, source_id):
+    with db.get_connection() as conn:
+        return [row[0] for row in conn.execute("SELECT date FROM balance_snapshots WHERE source_id = ? ORDER BY date", (source_id,))]
+
+
+@pytest.mark.parametrize("usd", [True, False])
+def test_balance_as_of_matches_stored_value(db, usd):
+    user_id = db.add_user("alice", "alice@example.com", "hash")
+    category_id = db.add_category("other")
+    source_id = db.add_source("wallet", False, usd, 1000.0, user_id)
+
+    first = db.add_transaction("salary", "1403-01-01", 50.0, 2.0, category_id, source_id, user_id, is_deposit=True)
+    db.add_transaction("rent", "1403-01-10", 20.0, 2.0, category_id, source_id, user_id)
+    db.bulk_add_transactions(user_id, [("bulk", "1403-02-01", 5.0, 2.0, category_id, source_id, False)] * 3)
+    db.add_income("gift", "1403-02-05", 8.0, True, 2.0, category_id, source_id)
+    db.add_transaction("loan", "1403-02-06", 4.0, 2.0, category_id, source_id, user_id, update_balance=False)
+    db.update_source_balance(source_id, 3.0, 2.0, False, date="1403-02-07", note="loan payment")
+    db.update_transaction(first, "salary", "1403-01-02", 60.0, True, category_id, source_id, 2.0, True)
+
+    factor = 1 if usd else 2.0
+    assert db.balance_as_of(source_id) == pytest.approx(db.get_source_by_id(source_id)[4])
+    assert db.balance_as_of(source_id, "1403-01-01") == pytest.approx(1000.0)
+    assert db.balance_as_of(source_id, "1403-01-31") == pytest.approx(1000.0 + 40.0 * factor)
+    assert db.balance_as_of(source_id, "1403-02-06") == pytest.approx(1000.0 + (40.0 - 15.0 + 8.0) * factor)
+    assert db.reconcile_source_balance(source_id) == pytest.approx(0.0)
+    assert db.balance_as_of(-1) is None
+
+
+def test_snapshots_are_taken_lazily_and_dropped_by_backdated_writes(db, monkeypatch):
+    monkeypatch.setattr(database, "BALANCE_SNAPSHOT_EVERY", 5)
+    user_id = db.add_user("alice", "alice@example.com", "hash")
+    category_id = db.add_category("other")
+    source_id = db.add_source("wallet", False, True, 100.0, user_id)
+    for day in range(1, 11):
+        db.add_transaction("tx", f"1403-03-{day:02d}", 1.0, 2.0, category_id, source_id, user_id)
+
+    assert db.balance_as_of(source_id, "1403-03-08") == pytest.approx(92.0)
+    assert snapshot_dates(db, source_id) == [database.GENESIS_DATE, "1403-03-08"]
+    assert db.balance_as_of(source_id) == pytest.approx(90.0)
+
+    # A write dated on or before a snapshot invalidates it; the genesis snapshot stays
+    db.add_transaction("late", "1403-03-08", 1.0, 2.0, category_id, source_id, user_id)
+    assert snapshot_dates(db, source_id) == [database.GENESIS_DATE]
+    assert db.balance_as_of(source_id, "1403-03-08") == pytest.approx(91.0)
+
+
+def test_current_balance_snapshot_covers_gregorian_ledger(db, monkeypatch):
+    monkeypatch.setattr(database, "BALANCE_SNAPSHOT_EVERY", 5)
+    user_id = db.add_user("alice", "alice@example.com", "hash")
+    category_id = db.add_category("other")
+    source_id = db.add_source("wallet", False, True, 100.0, user_id)
+    for days_ago in range(10, 0, -1):
+        day = (date.today() - timedelta(days=days_ago)).isoformat()
+        db.add_transaction("tx", day, 1.0, 2.0, category_id, source_id, user_id)
+
+    def rows_summed():
+        with db.get_connection() as conn:
+            return db._balance_as_of(conn.cursor(), source_id, database.LATEST_DATE)[1]
+
+    assert rows_summed() == 10
+    assert db.balance_as_of(source_id) == pytest.approx(90.0)
+    # The checkpoint is yesterday's Gregorian date, so it covers the ledger
+    yesterday = (date.today() - timedelta(days=1)).isoformat()
+    assert snapshot_dates(db, source_id) == [database.GENESIS_DATE, yesterday]
+    assert rows_summed() == 0
+    assert db.balance_as_of(source_id) == pytest.approx(90.0)
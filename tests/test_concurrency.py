@@ -0,0 +1,97 @@
+"""
+Concurrency stress tests: many parallel writers against one source must
+leave its balance exactly equal to the sum of their effects.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+
+WORKERS = 16
+ROUNDS = 25
+RATE = 2.0  # exact in binary floating point, so sums stay exact
+
+
+def make_source(db, usd):
+    user_id = db.add_user("alice", "alice@example.com", "hash")
+    category_id = db.add_category("other")
+    source_id = db.add_source("wallet", False, usd, 1000.0, user_id)
+    return user_id, category_id, source_id
+
+
+def balance(db, source_id):
+    return db.get_source_by_id(source_id)[4]
+
+
+@pytest.mark.parametrize("usd", [True, False])
+def test_parallel_adds_keep_exact_balance(db, usd):
+    user_id, category_id, source_id = make_source(db, usd)
+
+    def writer(worker):
+        for i in range(ROUNDS):
+            is_deposit = (worker + i) % 3 == 0
+            assert db.add_transaction("tx", "1403-01-01", 1.5, RATE, category_id, source_id, user_id, is_deposit=is_deposit)
+
+    with ThreadPoolExecutor(WORKERS) as executor:
+        list(executor.map(writer, range(WORKERS)))
+
+    deposits = sum(1 for w in range(WORKERS) for i in range(ROUNDS) if (w + i) % 3 == 0)
+    expenses = WORKERS * ROUNDS - deposits
+    unit = 1.5 if usd else 1.5 * RATE
+    assert balance(db, source_id) == 1000.0 + (deposits - expenses) * unit
+    assert len(db.get_all_transactions(user_id)) == WORKERS * ROUNDS
+
+
+def test_parallel_add_update_delete_keep_exact_balance(db):
+    user_id, category_id, source_id = make_source(db, usd=True)
+
+    def writer(worker):
+        for i in range(ROUNDS):
+            tx_id = db.add_transaction("tx", "1403-01-01", 2.0, RATE, category_id, source_id, user_id)
+            # Turn the expense into a 3.0 deposit, then drop every other one
+            assert db.update_transaction(tx_id, "tx", "1403-01-02", 3.0, True, category_id, source_id, RATE, True)
+            if i % 2:
+                assert db.delete_transaction(tx_id, user_id)
+
+    with ThreadPoolExecutor(WORKERS) as executor:
+        list(executor.map(writer, range(WORKERS)))
+
+    kept = WORKERS * (ROUNDS - ROUNDS // 2)
+    assert balance(db, source_id) == 1000.0 + kept * 3.0
+    assert len(db.get_all_transactions(user_id)) == kept
+
+
+def test_racing_deletes_of_one_transaction_apply_once(db):
+    user_id, category_id, source_id = make_source(db, usd=True)
+    tx_ids = [db.add_transaction("tx", "1403-01-01", 2.0, RATE, category_id, source_id, user_id) for _ in range(ROUNDS)]
+
+    def writer(worker):
+        return sum(bool(db.delete_transaction(tx_id, user_id)) for tx_id in tx_ids)
+
+    with ThreadPoolExecutor(WORKERS) as executor:
+        deleted = sum(executor.map(writer, range(WORKERS)))
+
+    # Each transaction is deleted, and its expense reverted, exactly once
+    assert deleted == ROUNDS
+    assert balance(db, source_id) == 1000.0
+    assert db.reconcile_source_balance(source_id) == 0
+
+
+def test_opposite_moves_between_two_sources_keep_exact_balances(db):
+    user_id, category_id, first = make_source(db, usd=True)
+    second = db.add_source("bank", True, True, 1000.0, user_id)
+
+    def writer(worker):
+        # Half the workers move their transaction first -> second, the others second -> first
+        start, end = (first, second) if worker % 2 else (second, first)
+        tx_id = db.add_transaction("tx", "1403-01-01", 1.0, RATE, category_id, start, user_id)
+        for i in range(ROUNDS):
+            source_id = end if i % 2 == 0 else start
+            assert db.update_transaction(tx_id, "tx", "1403-01-01", 1.0, True, category_id, source_id, RATE, False)
+
+    with ThreadPoolExecutor(WORKERS) as executor:
+        list(executor.map(writer, range(WORKERS)))
+
+    # ROUNDS is odd, so every transaction ends on the source it didn't start on
+    assert balance(db, first) == 1000.0 - WORKERS // 2
+    assert balance(db, second) == 1000.0 - WORKERS // 2
+    assert db.reconcile_source_balance(first) == 0
+    assert db.reconcile_source_balance(second) == 0
@@ -0,0 +1,65 @@
+"""
+Exchange rate cache tests: fresh rates must come from memory, concurrent
+misses must share one scrape, stale rates must be served while a single
+refresh runs, and the cache file must be written only on change.
+"""
+import json
+import threading
+import time
+from datetime import datetime, timedelta
+from modules.currency_exchange import CurrencyExchange
+
+
+def make_exchange(tmp_path, rates, delay=0.0):
+    exchange = CurrencyExchange(cache_file=str(tmp_path / "currency_cache.json"))
+    calls = []
+
+    def fetch_rate():
+        calls.append(1)
+        time.sleep(delay)
+        return rates[min(len(calls), len(rates)) - 1]
+
+    exchange.fetch_rate = fetch_rate
+    return exchange, calls
+
+
+def test_concurrent_misses_share_one_scrape(tmp_path):
+    exchange, calls = make_exchange(tmp_path, [60000.0], delay=0.2)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(exchange.get_usd_rate())) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == [60000.0] * 8
+    assert len(calls) == 1
+    assert exchange.get_usd_rate() == 60000.0
+    stats = exchange.stats()
+    assert stats["refreshes"] == 1 and stats["misses"] == 8 and stats["hits"] == 1
+
+
+def test_stale_rate_is_served_while_refreshing(tmp_path):
+    exchange, calls = make_exchange(tmp_path, [61000.0], delay=0.2)
+    exchange.save_to_cache(60000.0, datetime.now() - timedelta(hours=11))
+
+    started = time.perf_counter()
+    assert [exchange.get_usd_rate() for _ in range(3)] == [60000.0] * 3
+    assert time.perf_counter() - started < 0.1
+
+    deadline = time.time() + 5
+    while exchange.get_usd_rate() != 61000.0 and time.time() < deadline:
+        time.sleep(0.01)
+    assert len(calls) == 1
+    assert exchange.stats()["stale_hits"] >= 3
+
+
+def test_cache_file_written_only_on_change(tmp_path):
+    exchange, calls = make_exchange(tmp_path, [60000.0, 60000.0, 62000.0])
+    for _ in range(3):
+        exchange.get_usd_rate(live=True)
+
+    assert len(calls) == 3
+    assert exchange.stats()["disk_writes"] == 2
+    with open(exchange.cache_file) as f:
+        assert json.load(f)["rate"] == 62000.0
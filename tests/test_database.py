@@ -4,6 +4,7 @@ from datetime import datetime
 def test_database_operations():
     # Initialize database
     db = Database("test_money_tracker.db")
+    db.create_tables()
     
     try:
         # Test adding categories
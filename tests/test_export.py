@@ -0,0 +1,64 @@
+"""
+Ledger export tests: exported transactions must round-trip through the
+bulk-import row format, and Parquet output must match the CSV rows.
+"""
+import io
+import pytest
+from modules.transaction_io import TRANSACTION_COLUMNS, EXPORT_SCHEMAS, iter_csv, iter_parquet, read_csv_rows
+from routers.transactions import TransactionImportRow
+
+
+def seed(db):
+    user_id = db.add_user("alice", "alice@example.com", "hash")
+    category_id = db.add_category("food")
+    source_id = db.add_source("cash", False, False, 0.0, user_id)
+    for i in range(25):
+        db.add_transaction(f"item {i}", f"1403-01-{i % 28 + 1:02d}", 1.25 * i, 60000.0, category_id, source_id, user_id, is_deposit=i % 4 == 0)
+    db.add_income("salary", "1403-01-15", 500.0, True, 60000.0, category_id, source_id)
+    loan_id = db.add_loan("car", 1000.0, 100.0, True, user_id)
+    db.add_loan_payment(loan_id, 100.0, "1403-01-10", source_id, user_id)
+    return user_id
+
+
+def test_transactions_csv_round_trips_through_import_rows(db):
+    user_id = seed(db)
+    csv_text = "".join(iter_csv("transactions", db.iter_export_rows("transactions", user_id), chunk_rows=7))
+
+    assert csv_text.splitlines()[0].split(",") == TRANSACTION_COLUMNS
+    imported = [TransactionImportRow.model_validate(row) for row in read_csv_rows(csv_text)]
+    original = db.get_all_transactions(user_id)
+    assert len(imported) == len(original)
+
+    by_name = {tx[1]: tx for tx in original}
+    for row in imported:
+        tx = by_name[row.name]
+        assert (row.date, row.price, row.your_currency_rate, row.is_deposit) == (tx[2], abs(tx[3]), tx[4], bool(tx[7]))
+        assert row.is_usd and row.category == "food" and row.source == "cash"
+
+
+def test_export_reimports_to_the_same_ledger(db):
+    user_id = seed(db)
+    csv_text = "".join(iter_csv("transactions", db.iter_export_rows("transactions", user_id)))
+
+    # Import into a second user the way POST /api/transactions/import does
+    other_id = db.add_user("bob", "bob@example.com", "hash")
+    category_id = next(cat.id for cat in db.get_all_categories() if cat.name == "food")
+    source_id = db.add_source("cash", False, False, 0.0, other_id)
+    rows = [TransactionImportRow.model_validate(row) for row in read_csv_rows(csv_text)]
+    db.bulk_add_transactions(other_id, [
+        (row.name, row.date, row.price, row.your_currency_rate, category_id, source_id, row.is_deposit) for row in rows
+    ])
+
+    assert list(db.iter_export_rows("transactions", other_id)) == list(db.iter_export_rows("transactions", user_id))
+    original = db.get_all_sources(user_id)[0].value
+    assert db.get_all_sources(other_id)[0].value == pytest.approx(original)
+
+
+def test_parquet_export_matches_csv(db):
+    pq = pytest.importorskip("pyarrow.parquet")
+    user_id = seed(db)
+    for dataset, schema in EXPORT_SCHEMAS.items():
+        data = b"".join(iter_parquet(dataset, db.iter_export_rows(dataset, user_id), chunk_rows=7))
+        table = pq.read_table(io.BytesIO(data))
+        assert table.column_names == [name for name, _ in schema]
+        assert table.num_rows == len(list(db.iter_export_rows(dataset, user_id)))
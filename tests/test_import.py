@@ -0,0 +1,74 @@
+"""
+Bulk import endpoint tests: CSV and JSON bodies must be validated as a whole,
+imported in one go, and rejected without writing anything when a row is bad.
+The listing must refuse to stream a paginated page.
+"""
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from modules.async_database import AsyncDatabase
+from routers import transactions
+from routers.users import get_current_user
+
+CSV = """date,name,price,is_usd,category,source,is_deposit,your_currency_rate
+2024-05-01,coffee,3.5,true,food,cash,false,
+2024-05-02,salary,500,true,,cash,true,
+2024-05-03,bread,120000,false,food,cash,false,60000
+"""
+
+
+class FixedRate:
+    def get_usd_rate(self, live=False):
+        return 50000.0
+
+
+@pytest.fixture
+def setup(db):
+    user_id = db.add_user("alice", "alice@example.com", "hash")
+    db.add_category("food")
+    db.add_category("other")
+    source_id = db.add_source("cash", False, True, 0.0, user_id)
+    app = FastAPI()
+    app.include_router(transactions.router)
+    app.dependency_overrides[get_current_user] = lambda: db.get_user_by_id(user_id)
+    app.dependency_overrides[transactions.get_db] = lambda: AsyncDatabase(database=db)
+    app.dependency_overrides[transactions.get_exchange_dependency] = FixedRate
+    return TestClient(app), db, user_id, source_id
+
+
+def test_csv_import_through_the_endpoint(setup):
+    client, db, user_id, source_id = setup
+    response = client.post("/api/transactions/import", content=CSV, headers={"Content-Type": "text/csv"})
+
+    assert response.status_code == 200
+    assert response.json()["imported"] == 3
+    by_name = {tx.name: tx for tx in db.get_all_transactions(user_id)}
+    assert by_name["bread"].price_in_dollar == pytest.approx(2.0)
+    assert by_name["bread"].your_currency_rate == 60000
+    assert by_name["coffee"].your_currency_rate == 50000.0
+    assert db.get_source_by_id(source_id).value == pytest.approx(500 - 3.5 - 2.0)
+
+
+def test_invalid_rows_reject_the_whole_import(setup):
+    client, db, user_id, _ = setup
+    rows = [
+        {"date": "2024-05-01", "name": "coffee", "price": 3.5, "is_usd": True, "source": "cash"},
+        {"date": "May 2nd", "name": "tea", "price": -1, "is_usd": True, "source": "cash"},
+        {"date": "2024-05-03", "name": "taxi", "price": 2, "is_usd": True, "source": "wallet"},
+    ]
+    response = client.post("/api/transactions/import", json=rows)
+
+    assert response.status_code == 422
+    detail = response.json()["detail"]
+    assert detail["error_count"] == 2
+    assert [error["row"] for error in detail["errors"]] == [2, 3]
+    assert db.get_all_transactions(user_id) == []
+    assert client.post("/api/transactions/import", content=b"not json").status_code == 400
+
+
+def test_streaming_cannot_be_combined_with_limit(setup):
+    client, _, _, _ = setup
+    assert client.get("/api/transactions", params={"limit": 10, "stream": 1}).status_code == 400
+    response = client.get("/api/transactions", params={"limit": 10}, headers={"Accept": "application/x-ndjson"})
+    assert response.status_code == 400
+    assert client.get("/api/transactions", params={"limit": 10}).json() == {"items": [], "next_cursor": None}
@@ -0,0 +1,59 @@
+"""
+Login protection tests: repeated failures must lock a username out with 429
+before bcrypt runs again, and a saturated password hashing pool must refuse
+work at once instead of queueing it.
+"""
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from modules import login_throttle, password_pool
+from modules.async_database import AsyncDatabase
+from modules.auth import get_password_hash
+from routers import users
+
+
+@pytest.fixture
+def client(db, monkeypatch):
+    db.add_user("alice", "alice@example.com", get_password_hash("secret"))
+    for throttle in (login_throttle.ip_throttle, login_throttle.user_throttle):
+        monkeypatch.setattr(throttle, "_attempts", {})
+    monkeypatch.setattr(login_throttle.user_throttle, "max_attempts", 2)
+    app = FastAPI()
+    app.include_router(users.router)
+    app.dependency_overrides[users.get_db] = lambda: AsyncDatabase(database=db)
+    return TestClient(app)
+
+
+def login(client, password):
+    return client.post("/api/token", data={"username": "alice", "password": password})
+
+
+def test_failed_logins_lock_the_username(client, monkeypatch):
+    assert login(client, "wrong").status_code == 401
+    assert login(client, "wrong").status_code == 401
+
+    verified = []
+    monkeypatch.setattr(password_pool, "verify_password", lambda *args: verified.append(args) or True)
+    response = login(client, "secret")
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) > 0
+    assert verified == []
+
+
+def test_saturated_password_pool_rejects(client, monkeypatch):
+    monkeypatch.setattr(password_pool, "PASSWORD_QUEUE_LIMIT", 0)
+    assert login(client, "secret").status_code == 429
+    assert password_pool.password_pool_stats()["rejected"] >= 1
+
+    monkeypatch.setattr(password_pool, "PASSWORD_QUEUE_LIMIT", 4)
+    assert "access_token" in login(client, "secret").json()
+
+
+def test_only_failed_logins_count_against_the_ip(client, monkeypatch):
+    monkeypatch.setattr(login_throttle.ip_throttle, "max_attempts", 3)
+    for _ in range(5):
+        assert login(client, "secret").status_code == 200
+
+    for name in ("bob", "carol", "dave"):
+        assert client.post("/api/token", data={"username": name, "password": "x"}).status_code == 401
+    assert login(client, "secret").status_code == 429
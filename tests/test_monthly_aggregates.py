@@ -0,0 +1,51 @@
+"""
+Monthly aggregate tests: the incrementally maintained monthly_aggregates
+table must always match totals computed from the transactions themselves.
+"""
+import pytest
+from routers.reports import MonthlyReportData
+
+
+def report_for(db, user_id, month, year):
+    report = MonthlyReportData.__new__(MonthlyReportData)
+    report.db, report.user_id, report.month, report.year = db, user_id, month, year
+    return report
+
+
+def assert_matches_transactions(db, user_id, month, year):
+    report = report_for(db, user_id, month, year)
+    expected = report.calculate_totals(report.get_transactions())
+    assert report.get_totals() == pytest.approx(expected)
+    assert report.get_transaction_count() == len(report.get_transactions())
+
+
+def test_aggregates_follow_every_write_path(db):
+    user_id = db.add_user("alice", "alice@example.com", "hash")
+    food = db.add_category("food")
+    rent = db.add_category("rent")
+    cash = db.add_source("cash", False, True, 100.0, user_id)
+    bank = db.add_source("bank", True, False, 1000.0, user_id)
+
+    ids = [
+        db.add_transaction(f"tx {i}", f"1403-02-{i + 1:02d}", 2.5 * (i + 1), 60000.0, food if i % 2 else rent, cash if i % 3 else bank, user_id, is_deposit=i % 4 == 0)
+        for i in range(12)
+    ]
+    db.bulk_add_transactions(user_id, [
+        ("bulk", "1403-02-15", 4.0, 61000.0, food, bank, False),
+        ("bulk", "1403-03-01", 8.0, 61000.0, None, cash, True),
+    ])
+    assert_matches_transactions(db, user_id, 2, 1403)
+    assert_matches_transactions(db, user_id, 3, 1403)
+
+    # Move one transaction to another month and category, delete two more
+    db.update_transaction(ids[0], "moved", "1403-03-05", 9.0, True, food, bank, 62000.0, False)
+    db.delete_transaction(ids[1], user_id)
+    db.delete_transaction(ids[2], user_id)
+    assert_matches_transactions(db, user_id, 2, 1403)
+    assert_matches_transactions(db, user_id, 3, 1403)
+
+    before = sorted(db.get_monthly_aggregates(user_id, 2, 1403))
+    db.rebuild_monthly_aggregates(user_id)
+    after = sorted(db.get_monthly_aggregates(user_id, 2, 1403))
+    assert [row[:6] for row in before] == [row[:6] for row in after]
+    assert [row.total_toman for row in before] == pytest.approx([row.total_toman for row in after])
@@ -0,0 +1,61 @@
+"""
+Parse cache tests: repeated messages must hit whatever their spacing, case
+or digits, answers must survive a restart through the SQLite tier, and
+date-relative answers must not be reused on another day.
+"""
+from datetime import date, timedelta
+from modules.connection_pool import close_pool
+from modules.parse_cache import ParseCache, options_hash
+
+OPTIONS = options_hash("gpt", ["Transportation", "Food"], ["Cash"])
+TAXI = {"name": "Taxi", "date": "2024-05-01", "price": 35000.0, "is_usd": False,
+        "category_name": "Transportation", "source_name": "Cash", "notes": None, "is_deposit": False}
+
+
+def test_normalized_text_hits_both_tiers(tmp_path):
+    db_name = str(tmp_path / "parse_cache.db")
+    cache = ParseCache(db_name)
+    key = cache.key("taxi 35000 toman", OPTIONS)
+    assert cache.get(key, "2024-05-01") is None
+    cache.put(key, "taxi 35000 toman", TAXI, "2024-05-01")
+
+    assert cache.key("  Taxi   ۳۵۰۰۰ TOMAN ", OPTIONS) == key
+    assert cache.key("taxi 35000 toman", options_hash("gpt", ["Food"], ["Cash"])) != key
+    # Dated today by the LLM: re-dated to the day of the hit
+    assert cache.get(key, "2024-05-01") == TAXI
+    assert cache.get(key, "2024-06-10")["date"] == "2024-06-10"
+
+    restarted = ParseCache(db_name)
+    assert restarted.get(key, "2024-06-11")["date"] == "2024-06-11"
+    assert restarted.stats()["disk_hits"] == 1
+    assert cache.stats()["hit_rate"] == round(2 / 3, 3)
+    close_pool(db_name)
+
+
+def test_relative_dates_are_reused_on_the_same_day_only(tmp_path):
+    cache = ParseCache("")
+    today = date.today().isoformat()
+    tomorrow = (date.today() + timedelta(days=1)).isoformat()
+    yesterday = (date.today() - timedelta(days=1)).isoformat()
+    for text in ["taxi 35000 toman yesterday", "تاکسی ۳۵۰۰۰ تومان دیروز"]:
+        key = cache.key(text, OPTIONS)
+        cache.put(key, text, {**TAXI, "date": yesterday}, today)
+
+        assert cache.get(key, today)["date"] == yesterday
+        assert cache.get(key, tomorrow) is None
+
+
+def test_explicit_dates_are_kept(tmp_path):
+    cache = ParseCache("")
+    text = "netflix 20$ on 2024-03-05"
+    key = cache.key(text, OPTIONS)
+    cache.put(key, text, {**TAXI, "date": "2024-03-05"}, "2024-05-01")
+    assert cache.get(key, "2024-07-01")["date"] == "2024-03-05"
+
+
+def test_explicit_date_of_the_parse_day_is_kept(tmp_path):
+    cache = ParseCache("")
+    for text in ["netflix 20$ on 2024-05-01", "netflix 20$ on 1 May", "نتفلیکس ۲۰ دلار ۱۲ اردیبهشت"]:
+        key = cache.key(text, OPTIONS)
+        cache.put(key, text, {**TAXI, "date": "2024-05-01"}, "2024-05-01")
+        assert cache.get(key, "2024-07-01")["date"] == "2024-05-01"
@@ -0,0 +1,115 @@
+"""
+Query-plan regression tests: every query issued by Database must be served
+by an index, never by a full table scan or a temporary sort.
+"""
+import re
+from contextlib import contextmanager
+import pytest
+from modules.database import Database
+
+# Tables that are intentionally read in full (small lookup tables: global
+# categories and the handful of archived years), plus the derived ledger
+# subquery of balance queries, whose branches are checked separately
+FULL_SCAN_ALLOWED = {"categories", "archived_years", "ledger"}
+
+SCAN_RE = re.compile(r"^SCAN (\w+)")
+
+
+@pytest.fixture
+def traced_db(tmp_path, monkeypatch):
+    db = Database(str(tmp_path / "plans.db"))
+    db.create_tables()
+
+    user_id = db.add_user("alice", "alice@example.com", "hash")
+    other_id = db.add_user("bob", "bob@example.com", "hash")
+    category_id = db.add_category("food")
+    source_id = db.add_source("cash", False, True, 100.0, user_id)
+    db.add_source("bank", True, False, 1000.0, other_id)
+    for day in range(1, 6):
+        db.add_transaction("lunch", f"1403-02-0{day}", 5.0, 60000, category_id, source_id, user_id)
+    loan_id = db.add_loan("car", 1000.0, 100.0, True, user_id)
+    payment_id = db.add_loan_payment(loan_id, 100.0, "1403-02-01", source_id, user_id)
+
+    statements = []
+    original = db.get_connection
+
+    @contextmanager
+    def get_connection():
+        with original() as conn:
+            conn.set_trace_callback(statements.append)
+            try:
+                yield conn
+            finally:
+                conn.set_trace_callback(None)
+
+    monkeypatch.setattr(db, "get_connection", get_connection)
+    ids = {
+        "user_id": user_id,
+        "category_id": category_id,
+        "source_id": source_id,
+        "loan_id": loan_id,
+        "payment_id": payment_id,
+    }
+    return db, ids, statements
+
+
+def run_every_query(db, ids):
+    """Call each read/update/delete path of Database once"""
+    user_id, source_id = ids["user_id"], ids["source_id"]
+    transaction_id = db.get_all_transactions(user_id)[0][0]
+
+    db.get_user_by_username("alice")
+    db.get_user_by_email("alice@example.com")
+    db.get_user_by_id(user_id)
+    db.get_all_sources(user_id)
+    db.get_sources(user_id)
+    db.get_source_by_id(source_id)
+    db.get_category_by_id(ids["category_id"])
+    db.get_all_transactions(user_id, month=2)
+    db.get_transactions_by_month(user_id, 2, 1403)
+    _, cursor = db.get_transactions_page(user_id, 2)
+    db.get_transactions_page(user_id, 2, before_date=cursor[0], before_id=cursor[1])
+    db.get_transactions_page(user_id, 2, before_date="1403-02-04", month=2)
+    db.get_transactions_by_source(source_id)
+    db.get_transactions_by_category(ids["category_id"])
+    db.get_transactions_by_date_range("1403-02-01", "1403-02-03")
+    db.get_transaction_by_id(transaction_id)
+    db.get_monthly_aggregates(user_id, 2, 1403)
+    for dataset in ("transactions", "sources", "loans", "loan_payments"):
+        list(db.iter_export_rows(dataset, user_id))
+    db.update_source_balance(source_id, 1.0, 60000, True)
+    db.balance_as_of(source_id)
+    db.balance_as_of(source_id, "1403-02-03")
+    db.snapshot_balance(source_id, "1403-02-02")
+    db.update_transaction(transaction_id, "dinner", "1403-02-04", 7.0, True, ids["category_id"], source_id, 60000, False)
+    db.delete_transaction(transaction_id, user_id)
+    db.get_all_loans(user_id)
+    db.get_loan_by_id(ids["loan_id"], user_id)
+    db.update_loan_remaining_amount(ids["loan_id"], 900.0)
+    db.get_loan_payments(ids["loan_id"], user_id)
+    db.mark_payment_paid(ids["payment_id"], user_id)
+    db.get_loan_summary(user_id)
+    db.delete_loan(ids["loan_id"], user_id)
+
+
+def query_plan(db, sql):
+    with db.pool.connection() as conn:
+        return [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}")]
+
+
+def test_database_queries_use_indexes(traced_db):
+    db, ids, statements = traced_db
+    run_every_query(db, ids)
+
+    queries = [sql for sql in statements if re.match(r"\s*(SELECT|UPDATE|DELETE)", sql, re.I)]
+    assert queries, "no queries were traced"
+
+    problems = []
+    for sql in queries:
+        for detail in query_plan(db, sql):
+            match = SCAN_RE.match(detail)
+            if match and match.group(1) not in FULL_SCAN_ALLOWED:
+                problems.append((detail, sql.strip()))
+            if "TEMP B-TREE" in detail:
+                problems.append((detail, sql.strip()))
+    assert not problems, "\n".join(f"{detail}: {sql}" for detail, sql in problems)
@@ -0,0 +1,57 @@
+"""
+Exchange rate history tests: point-in-time lookups must return the last
+rate recorded at or before the time asked for, the vectorized lookup must
+agree with the scalar one, and rows written elsewhere must be picked up.
+"""
+from datetime import date, datetime
+import numpy as np
+from modules import rate_history
+from modules.rate_history import RateHistory
+
+
+def test_rate_at_is_the_last_rate_before(db):
+    history = RateHistory(db)
+    assert history.rate_at("2024-01-01") is None
+    history.record(60000.0, datetime(2024, 1, 1, 9, 0))
+    history.record(61000.0, datetime(2024, 1, 2, 9, 0))
+    history.record(63000.0, datetime(2024, 1, 5, 12, 30))
+
+    assert history.rate_at(datetime(2024, 1, 2, 8, 59)) == 60000.0
+    assert history.rate_at("2024-01-02") == 61000.0  # a date means its end
+    assert history.rate_at(date(2024, 1, 4)) == 61000.0
+    assert history.rate_at("2024-01-05 12:30:00") == 63000.0
+    assert history.rate_at("2023-12-01") == 60000.0  # before the history: first rate
+
+
+def test_vectorized_conversion_matches_scalar_lookups(db):
+    history = RateHistory(db)
+    for day, rate in [(1, 60000.0), (10, 62000.0), (20, 65000.0)]:
+        history.record(rate, datetime(2024, 3, day, 12))
+    dates = ["2024-03-01", "2024-03-09", "2024-03-10", "2024-03-31", "2024-03-10T11:00:00"]
+
+    rates = history.rates_at(dates)
+    assert rates.tolist() == [history.rate_at(d) for d in dates]
+    assert history.to_toman([1, 2, 3, 4, 5], dates).tolist() == [60000.0, 120000.0, 186000.0, 260000.0, 300000.0]
+    assert np.allclose(history.to_usd(history.to_toman([10.0] * 5, dates), dates), 10.0)
+
+
+def test_picks_up_rows_from_other_writers(db, monkeypatch):
+    history = RateHistory(db)
+    history.record(60000.0, datetime(2024, 1, 1))
+    # Another worker records a newer rate; it shows up once the sync interval passes
+    db.add_exchange_rate("2024-02-01T00:00:00", 70000.0)
+    monkeypatch.setattr(rate_history, "SYNC_SECONDS", 0)
+
+    assert history.rate_at("2024-03-01") == 70000.0
+    assert history.stats()["points"] == 2
+
+
+def test_malformed_dates_get_no_rate(db):
+    history = RateHistory(db)
+    dates = ["2024-03-05", "2024-02-30", "2024/05/01", ""]
+    assert np.isnan(history.rates_at(dates)).all()
+
+    history.record(60000.0, datetime(2024, 3, 1, 12))
+    rates = history.rates_at(dates)
+    assert rates[0] == 60000.0 and np.isnan(rates[1:]).all()
+    assert np.isnan(history.to_toman([1.0] * 4, dates)[1:]).all()
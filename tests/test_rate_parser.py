@@ -0,0 +1,44 @@
+"""
+tgju price extraction tests: the targeted extraction must agree with a full
+BeautifulSoup parse, and hand any markup it does not recognise to that parse.
+"""
+import os
+import pytest
+from modules.currency_exchange import CurrencyExchange, extract_price_text
+
+FIXTURE = os.path.join(os.path.dirname(__file__), "fixtures", "tgju_price_dollar_rl.html")
+
+
+def test_saved_page_matches_full_parse():
+    with open(FIXTURE, encoding="utf-8") as f:
+        html = f.read()
+    exchange = CurrencyExchange()
+
+    # The column name also appears in an inline script before the span
+    assert extract_price_text(html) == "1,023,500"
+    assert exchange.parse_rate(html) == exchange.parse_rate_full(html) == 102350.0
+    assert exchange.stats()["parse_fallbacks"] == 0
+
+
+@pytest.mark.parametrize("markup", [
+    '<span data-col="info.last_trade.PDrCotVal">615,200</span>',
+    "<SPAN class='value' data-col='info.last_trade.PDrCotVal' title=\"x\">\n 615,200 \n</SPAN>",
+    '<span data-col=info.last_trade.PDrCotVal>615200</span>',
+    '<div data-col="info.last_trade.PDrCotVal">1</div><span data-col="info.last_trade.PDrCotVal">615,200</span>',
+])
+def test_markup_variants(markup):
+    html = f"<html><body>{markup}</body></html>"
+    exchange = CurrencyExchange()
+    assert exchange.parse_rate(html) == exchange.parse_rate_full(html) == 61520.0
+    assert exchange.stats()["parse_fallbacks"] == 0
+
+
+def test_unexpected_markup_falls_back():
+    exchange = CurrencyExchange()
+    nested = '<span data-col="info.last_trade.PDrCotVal"><b>615,200</b></span>'
+    assert extract_price_text(nested) is None
+    assert exchange.parse_rate(nested) == 61520.0
+    assert exchange.stats()["parse_fallbacks"] == 1
+
+    with pytest.raises(ValueError):
+        exchange.parse_rate("<html><body>maintenance</body></html>")
@@ -0,0 +1,96 @@
+"""
+Background rate refresher tests, against a local stub of the tgju.org page:
+the refresher must keep the rate fresh without callers ever scraping, retry
+failed fetches, and open its circuit breaker when the page keeps failing.
+"""
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from modules.currency_exchange import CurrencyExchange
+from modules.rate_refresher import CircuitBreaker, RateRefresher
+
+PAGE = '<html><body><span class="value" data-col="info.last_trade.PDrCotVal">615,200</span></body></html>'
+
+
+@pytest.fixture
+def stub():
+    """Stub price page; set `stub.status` to make it fail"""
+    requests_seen = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            requests_seen.append(self.path)
+            body = PAGE.encode() if server.status == 200 else b"unavailable"
+            self.send_response(server.status)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.status = 200
+    server.requests_seen = requests_seen
+    server.url = f"http://127.0.0.1:{server.server_address[1]}/profile/price_dollar_rl"
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def make_refresher(tmp_path, stub, **kwargs):
+    exchange = CurrencyExchange(cache_file=str(tmp_path / "currency_cache.json"), url=stub.url)
+    exchange.fetch_rate = lambda: pytest.fail("a caller scraped synchronously")
+    kwargs.setdefault("breaker", CircuitBreaker(threshold=2, cooldown=60))
+    return exchange, RateRefresher(exchange, interval_minutes=60, backoff=0.01, **kwargs)
+
+
+def test_refresher_keeps_callers_off_the_scraper(tmp_path, stub):
+    exchange, refresher = make_refresher(tmp_path, stub)
+
+    async def scenario():
+        await refresher.start()
+        try:
+            for _ in range(100):
+                if exchange.get_usd_rate(live=True):
+                    break
+                await asyncio.sleep(0.01)
+            return exchange.get_usd_rate()
+        finally:
+            await refresher.stop()
+
+    assert asyncio.run(scenario()) == 61520.0
+    assert exchange.refresher is None
+    assert exchange.stats()["refreshes"] == 1
+
+
+def test_breaker_opens_after_repeated_failures(tmp_path, stub):
+    stub.status = 500
+    exchange, refresher = make_refresher(tmp_path, stub, retries=2)
+
+    async def scenario():
+        await refresher.start()
+        try:
+            assert await refresher.refresh_once() is False
+            assert await refresher.refresh_once() is False
+            assert exchange.get_usd_rate() is None
+        finally:
+            await refresher.stop()
+
+    asyncio.run(scenario())
+    # Each refresh retried once (the task's own first refresh may add more)
+    assert len(stub.requests_seen) >= 4
+    assert refresher.breaker.state == "open"
+    assert not refresher.breaker.allow()
+
+
+def test_half_open_breaker_closes_on_success():
+    breaker = CircuitBreaker(threshold=1, cooldown=0)
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert breaker.allow() and breaker.state == "half-open"
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.stats()["opens"] == 1
@@ -0,0 +1,47 @@
+"""
+Refresh token tests: a refresh token must be exchangeable once for a new
+pair, a reused one must end the whole session, and revoking must log out.
+"""
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from modules import login_throttle
+from modules.async_database import AsyncDatabase
+from modules.auth import get_password_hash
+from routers import users
+
+
+@pytest.fixture
+def client(db, monkeypatch):
+    db.add_user("alice", "alice@example.com", get_password_hash("secret"))
+    for throttle in (login_throttle.ip_throttle, login_throttle.user_throttle):
+        monkeypatch.setattr(throttle, "_attempts", {})
+    app = FastAPI()
+    app.include_router(users.router)
+    app.dependency_overrides[users.get_db] = lambda: AsyncDatabase(database=db)
+    return TestClient(app)
+
+
+def refresh(client, token):
+    return client.post("/api/token/refresh", json={"refresh_token": token})
+
+
+def test_refresh_rotates_and_detects_reuse(client):
+    login = client.post("/api/token", data={"username": "alice", "password": "secret"}).json()
+    first = refresh(client, login["refresh_token"])
+    assert first.status_code == 200
+    rotated = first.json()
+    assert rotated["refresh_token"] != login["refresh_token"]
+    me = client.get("/api/me", headers={"Authorization": f"Bearer {rotated['access_token']}"})
+    assert me.json()["username"] == "alice"
+
+    # The used token is presented again: the session is revoked, successor included
+    assert refresh(client, login["refresh_token"]).status_code == 401
+    assert refresh(client, rotated["refresh_token"]).status_code == 401
+
+
+def test_revoke_ends_the_session(client):
+    login = client.post("/api/token", data={"username": "alice", "password": "secret"}).json()
+    assert client.post("/api/token/revoke", json={"refresh_token": login["refresh_token"]}).json() == {"revoked": True}
+    assert refresh(client, login["refresh_token"]).status_code == 401
+    assert refresh(client, "not-a-token").status_code == 401
@@ -0,0 +1,36 @@
+"""
+Row type tests: Database returns named rows whose fields line up with the
+columns they were read from.
+"""
+from modules.database import LoanPaymentRow, LoanRow, SourceRow, TransactionRow, UserRow
+
+
+def test_rows_have_named_fields(db):
+    user_id = db.add_user("alice", "alice@example.com", "hash")
+    category_id = db.add_category("food")
+    source_id = db.add_source("cash", False, True, 100.0, user_id)
+    transaction_id = db.add_transaction("lunch", "1403-02-01", 5.0, 60000.0, category_id, source_id, user_id, is_deposit=True)
+    loan_id = db.add_loan("car", 1000.0, 100.0, True, user_id)
+    db.add_loan_payment(loan_id, 100.0, "1403-02-01", source_id, user_id)
+
+    user = db.get_user_by_id(user_id)
+    assert isinstance(user, UserRow) and (user.username, user.password_hash) == ("alice", "hash")
+
+    source = db.get_all_sources(user_id)[0]
+    assert isinstance(source, SourceRow) and (source.name, source.value, source.user_id) == ("cash", 105.0, user_id)
+
+    transaction = db.get_transaction_by_id(transaction_id)
+    assert isinstance(transaction, TransactionRow)
+    assert (transaction.date, transaction.price_in_dollar, transaction.your_currency_rate) == ("1403-02-01", 5.0, 60000.0)
+    assert transaction.is_deposit and transaction.user_id == user_id
+    assert list(db.iter_transactions(user_id)) == db.get_all_transactions(user_id) == [transaction]
+
+    detail = db.get_transactions_by_month(user_id, 2, 1403)[0]
+    assert (detail.category, detail.source) == ("food", "cash")
+
+    loan = db.get_loan_by_id(loan_id, user_id)
+    assert isinstance(loan, LoanRow) and loan.remaining_amount == 1000.0 and loan.created_at
+
+    payment = db.get_loan_payments(loan_id, user_id)[0]
+    assert isinstance(payment, LoanPaymentRow)
+    assert (payment.source_name, payment.user_id, payment.is_paid) == ("cash", user_id, 0)
@@ -0,0 +1,90 @@
+"""
+Sharded SQLite backend tests: users must land on their shard with IDs that
+route back to it, shards must read the catalog tables, and splitting a
+monolithic database must keep every user's data intact.
+"""
+import pytest
+from modules.connection_pool import close_all_pools
+from modules.database import Database
+from modules.sharding import SHARD_ID_SPAN, ShardedDatabase, split_database
+
+RATE = 2.0
+
+
+@pytest.fixture
+def sharded(tmp_path):
+    db = ShardedDatabase(str(tmp_path / "catalog.db"), shards=3)
+    db.create_tables()
+    yield db
+    close_all_pools()
+
+
+def add_user_with_source(db, name):
+    user_id = db.add_user(name, f"{name}@example.com", "hash")
+    return user_id, db.add_source("wallet", False, True, 100.0, user_id)
+
+
+def test_users_are_routed_to_their_shard(sharded):
+    category_id = sharded.add_category("food")
+    for name in ("alice", "bob", "carol", "dave"):
+        user_id, source_id = add_user_with_source(sharded, name)
+        tx_id = sharded.add_transaction("lunch", "1403-02-01", 5.0, RATE, category_id, source_id, user_id)
+
+        assert source_id // SHARD_ID_SPAN == tx_id // SHARD_ID_SPAN == user_id % 3
+        assert sharded.get_transaction_by_id(tx_id).user_id == user_id
+        assert sharded.get_source_by_id(source_id).value == 95.0
+        # Category names come from the catalog attached to the shard
+        assert [row.category for row in sharded.get_transactions_by_month(user_id, 2, 1403)] == ["food"]
+        assert sharded.update_transaction(tx_id, "lunch", "1403-02-01", 6.0, True, category_id, source_id, RATE, False)
+        assert sharded.delete_transaction(tx_id, user_id)
+        assert sharded.get_source_by_id(source_id).value == 100.0
+
+    assert sharded.get_transaction_by_id(99 * SHARD_ID_SPAN + 1) is None
+    assert len(sharded.get_transactions_by_category(category_id)) == 0
+
+
+def test_per_user_files(tmp_path):
+    db = ShardedDatabase(str(tmp_path / "catalog.db"), shards="per-user")
+    db.create_tables()
+    category_id = db.add_category("food")
+    users = [add_user_with_source(db, name) for name in ("alice", "bob")]
+    for user_id, source_id in users:
+        db.add_transaction("lunch", "1403-02-01", 5.0, RATE, category_id, source_id, user_id)
+
+    assert db.shard_keys() == [user_id for user_id, _ in users]
+    assert all(source_id // SHARD_ID_SPAN == user_id for user_id, source_id in users)
+    assert len(db.get_transactions_by_date_range("1403-01-01", "1403-12-29")) == 2
+    close_all_pools()
+
+
+@pytest.mark.parametrize("shards", [2, "per-user"])
+def test_split_keeps_every_users_data(tmp_path, shards):
+    mono = Database(str(tmp_path / "mono.db"))
+    mono.create_tables()
+    category_id = mono.add_category("food")
+    users = []
+    for name in ("alice", "bob", "carol"):
+        user_id, source_id = add_user_with_source(mono, name)
+        for day in range(1, 4):
+            mono.add_transaction("tx", f"1403-02-0{day}", float(day), RATE, category_id, source_id, user_id)
+        loan_id = mono.add_loan("car", 100.0, 10.0, True, user_id)
+        mono.add_loan_payment(loan_id, 10.0, "1403-03-01", source_id, user_id)
+        users.append(user_id)
+    mono.snapshot_all_balances("1403-02-02")
+
+    copied = split_database(mono.db_name, str(tmp_path / "split" / "catalog.db"), shards)
+    assert copied["users"] == 3 and copied["transactions"] == 9 and copied["loan_payments"] == 3
+
+    sharded = ShardedDatabase(str(tmp_path / "split" / "catalog.db"), shards)
+    for user_id in users:
+        def view(db):
+            source = db.get_sources(user_id)[0]
+            loan = db.get_all_loans(user_id)[0]
+            return (
+                [(t.name, t.date, t.price_in_dollar, t.category) for t in db.get_transactions_by_month(user_id, 2, 1403)],
+                source.value,
+                db.balance_as_of(source.id, "1403-02-02"),
+                [p.amount for p in db.get_loan_payments(loan.id, user_id)],
+            )
+        assert view(sharded) == view(mono)
+    close_all_pools()
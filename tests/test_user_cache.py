@@ -0,0 +1,46 @@
+"""
+Token cache tests: get_current_user must look a token's user up once, serve
+repeat requests from the cache, and never outlive the token or an
+invalidation.
+"""
+import asyncio
+import time
+from datetime import timedelta
+from modules.async_database import AsyncDatabase
+from modules.auth import create_access_token
+from modules.cache import TTLCache
+from routers import users
+
+
+def test_cache_expires_and_evicts():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2, expires_at=time.time() - 1)
+    cache.set("c", 3)
+    cache.set("d", 4)
+
+    assert cache.get("a") is None  # least recently used, evicted
+    assert cache.get("c") == 3
+    assert cache.stats()["evictions"] == 2
+
+
+def test_current_user_is_cached_per_token(db, monkeypatch):
+    db.add_user("alice", "alice@example.com", "hash")
+    adb = AsyncDatabase(database=db)
+    monkeypatch.setattr(users, "user_cache", TTLCache(maxsize=16, ttl=60))
+    lookups = []
+    original = db.get_user_by_username
+    monkeypatch.setattr(db, "get_user_by_username", lambda name: lookups.append(name) or original(name))
+    token = create_access_token({"sub": "alice"}, timedelta(minutes=5))
+
+    async def resolve(times):
+        return [await users.get_current_user(token, adb) for _ in range(times)]
+
+    resolved = asyncio.run(resolve(3))
+    assert {user.username for user in resolved} == {"alice"}
+    assert lookups == ["alice"]
+    assert users.user_cache_stats()["hits"] == 2
+
+    assert users.invalidate_cached_user("alice") == 1
+    asyncio.run(resolve(1))
+    assert lookups == ["alice", "alice"]
@@ -0,0 +1,76 @@
+"""
+Group-commit write queue tests: writes batched into shared commits must
+keep each caller's result and atomicity, and one failing write must not
+affect the rest of its batch.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from modules.write_queue import WriteQueue, shutdown_write_queues
+
+WORKERS = 16
+ROUNDS = 25
+RATE = 2.0
+
+
+@pytest.fixture
+def queued_db(db):
+    # Second handle on the same database whose ledger writes go through the queue
+    queued = type(db)(db.db_name, write_queue=True)
+    yield queued
+    shutdown_write_queues()
+
+
+def setup_source(db):
+    user_id = db.add_user("alice", "alice@example.com", "hash")
+    category_id = db.add_category("other")
+    source_id = db.add_source("wallet", False, True, 1000.0, user_id)
+    return user_id, category_id, source_id
+
+
+def test_parallel_writes_are_batched_and_exact(queued_db):
+    user_id, category_id, source_id = setup_source(queued_db)
+
+    def writer(worker):
+        ids = []
+        for i in range(ROUNDS):
+            tx_id = queued_db.add_transaction("tx", "1403-01-01", 2.0, RATE, category_id, source_id, user_id)
+            if i % 2:
+                assert queued_db.update_transaction(tx_id, "tx", "1403-01-02", 3.0, True, category_id, source_id, RATE, True)
+            ids.append(tx_id)
+        return ids
+
+    with ThreadPoolExecutor(WORKERS) as executor:
+        ids = [tx_id for batch in executor.map(writer, range(WORKERS)) for tx_id in batch]
+
+    assert len(set(ids)) == WORKERS * ROUNDS and None not in ids
+    deposits = WORKERS * (ROUNDS // 2)
+    expenses = WORKERS * ROUNDS - deposits
+    assert queued_db.get_source_by_id(source_id).value == 1000.0 + deposits * 3.0 - expenses * 2.0
+    assert queued_db.balance_as_of(source_id) == pytest.approx(queued_db.get_source_by_id(source_id).value)
+
+    stats = queued_db.write_queue.stats()
+    assert stats["writes"] == WORKERS * ROUNDS + deposits
+    assert stats["batches"] < stats["writes"]
+
+
+def test_failed_write_rolls_back_alone(db):
+    user_id, category_id, source_id = setup_source(db)
+    write_queue = WriteQueue(db, window_ms=200)
+
+    def failing(cursor):
+        db._add_transaction(cursor, "half-done", "1403-01-01", 50.0, RATE, category_id, source_id, user_id, False, True)
+        raise ValueError("boom")
+
+    try:
+        first = write_queue.submit(db._add_transaction, "a", "1403-01-01", 1.0, RATE, category_id, source_id, user_id, False, True)
+        broken = write_queue.submit(failing)
+        last = write_queue.submit(db._update_source_balance, source_id, 4.0, RATE, True, "1403-01-02", "refund")
+        assert first.result() and last.result()
+        with pytest.raises(ValueError):
+            broken.result()
+    finally:
+        write_queue.close()
+
+    assert write_queue.stats()["batches"] == 1
+    assert [tx.name for tx in db.get_all_transactions(user_id)] == ["a"]
+    assert db.get_source_by_id(source_id).value == 1000.0 - 1.0 + 4.0